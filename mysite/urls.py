@@ -18,6 +18,7 @@ from django.urls import include, path
 from . import views
 # implement Google login
 from django.contrib.auth.views import LogoutView
+from studybuddy.views.metrics_views import metrics_page
 
 # handler404 = views.handler404
 # handler500 = 'my_app.views.handler500'
@@ -29,4 +30,6 @@ urlpatterns = [
     path('', views.index, name = "index"),
     path('accounts/', include('allauth.urls')),
     path('logout', LogoutView.as_view(), name='logout'),
+    # request, chat and channel layer metrics for Prometheus
+    path('metrics', metrics_page, name='metrics'),
 ]
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class StudybuddyConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "studybuddy"
+
+    def ready(self):
+        # connects the signal handlers
+        from studybuddy import signals
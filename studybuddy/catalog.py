@@ -0,0 +1,218 @@
+import contextvars
+import json
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Max
+from studybuddy.models import Course, Departments, EnrolledClass, Post
+from studybuddy.search import rebuild_index
+
+# the Course fields filled in from the catalog, course_number is what identifies a section
+COURSE_FIELDS = ('subject', 'catalog_number', 'instructor', 'section', 'course_number', 'description')
+
+# set while import_catalog runs, the Course signals leave the search index and departments to it
+importing = contextvars.ContextVar('importing_catalog', default=False)
+
+
+def iter_catalog(file, chunk_size=1 << 16):
+    """
+    yield the entries of a JSON array one at a time without reading the whole file into memory
+
+    The file is the same list of sections the luthers-list API returned, e.g.
+    [{"subject": "CS", "catalog_number": "3240", "instructor": {"name": "..."}, "course_section": "001",
+      "course_number": 12345, "description": "Advanced Software Development"}, ...]
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    started = False
+    eof = False
+
+    while True:
+        # skip whitespace, the opening bracket and the commas between entries
+        while position < len(buffer) and (buffer[position].isspace() or buffer[position] in ',['):
+            if buffer[position] == '[':
+                if started:
+                    break
+                started = True
+            position += 1
+
+        if position < len(buffer) and not started:
+            raise ValueError('the catalog should be a JSON array')
+
+        if position < len(buffer) and buffer[position] == ']':
+            return
+
+        if position < len(buffer) and started:
+            try:
+                entry, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                # the entry runs past what has been read so far
+                if eof:
+                    raise
+            else:
+                position = end
+                yield entry
+                continue
+
+        if eof:
+            raise ValueError('catalog ended before the closing ]')
+
+        chunk = file.read(chunk_size)
+        eof = not chunk
+        buffer = buffer[position:] + chunk
+        position = 0
+
+
+def course_fields(entry):
+    """
+    the Course fields for one catalog entry
+    """
+    instructor = entry.get('instructor') or {}
+    if isinstance(instructor, dict):
+        instructor = instructor.get('name', '')
+
+    return {
+        'subject': str(entry['subject']),
+        'catalog_number': str(entry['catalog_number']),
+        'instructor': str(instructor),
+        'section': str(entry.get('course_section', entry.get('section', ''))),
+        'course_number': str(entry['course_number']),
+        'description': str(entry.get('description', '')),
+    }
+
+
+def import_catalog(entries, batch_size=1000, delete_missing=False):
+    """
+    make the Course and Departments tables match the catalog
+
+    The existing courses are loaded once and compared in memory by course_number, then the
+    differences are written with bulk_create, bulk_update and batched deletes. Courses that are
+    updated in place keep their posts and enrollments. Courses missing from the catalog are only
+    deleted with delete_missing, since that deletes their posts, rooms, sessions and enrollments too.
+    delete_missing also merges courses that share a course_number into the oldest one, moving their
+    posts and enrollments over first.
+
+    return the number of courses created, updated, deleted and merged, and the number of departments
+    """
+    catalog = {}
+    for entry in entries:
+        fields = course_fields(entry)
+        catalog[fields['course_number']] = fields
+
+    token = importing.set(True)
+    try:
+        return _import(catalog, batch_size, delete_missing)
+    finally:
+        importing.reset(token)
+
+
+def _import(catalog, batch_size, delete_missing):
+    with transaction.atomic():
+        # the oldest course with a course_number is the one the catalog updates, newer copies are
+        # duplicates: course pk -> the pk of the course it duplicates
+        existing = {}
+        duplicates = {}
+        duplicate_fields = set()
+        for row in Course.objects.order_by('pk').values_list('pk', *COURSE_FIELDS).iterator():
+            pk, fields = row[0], dict(zip(COURSE_FIELDS, row[1:]))
+            if fields['course_number'] in existing:
+                duplicates[pk] = existing[fields['course_number']][0]
+                duplicate_fields.add(tuple(fields.values()))
+            else:
+                existing[fields['course_number']] = (pk, fields)
+
+        if not delete_missing:
+            # duplicates are only merged into their course when the catalog is complete, until then
+            # they are left alone
+            duplicates = {}
+        else:
+            duplicate_fields = set()
+
+        to_create = []
+        to_update = []
+        for course_number, fields in catalog.items():
+            if course_number not in existing:
+                to_create.append(Course(**fields))
+            else:
+                pk, current = existing[course_number]
+                # a duplicate that is kept may already be exactly what the catalog says
+                if current != fields and tuple(fields.values()) not in duplicate_fields:
+                    to_update.append(Course(pk=pk, **fields))
+
+        to_delete = []
+        if delete_missing:
+            to_delete = [pk for course_number, (pk, fields) in existing.items() if course_number not in catalog]
+
+        merge_duplicates(duplicates)
+        # delete first so an updated or new section can't clash with one that is going away
+        to_delete += list(duplicates)
+        for start in range(0, len(to_delete), batch_size):
+            Course.objects.filter(pk__in=to_delete[start:start + batch_size]).delete()
+        Course.objects.bulk_update(to_update, COURSE_FIELDS, batch_size=batch_size)
+        Course.objects.bulk_create(to_create, batch_size=batch_size)
+
+        # bulk_create and bulk_update don't send the signals that keep departments and search up to date,
+        # and the deletes' signals are skipped while importing
+        departments = refresh_departments()
+        rebuild_index()
+
+    return {
+        'created': len(to_create),
+        'updated': len(to_update),
+        'deleted': len(to_delete) - len(duplicates),
+        'merged': len(duplicates),
+        'departments': len(departments),
+    }
+
+
+def merge_duplicates(duplicates):
+    """
+    move the posts and enrollments of each duplicate course (pk -> the pk of the course it duplicates)
+    to the course it duplicates, so deleting the duplicate doesn't delete them
+    """
+    for duplicate, course in duplicates.items():
+        Post.objects.filter(course_id=duplicate).update(course_id=course)
+        # a student enrolled in both only keeps the one enrollment
+        enrolled = EnrolledClass.objects.filter(course_id=course).values('student_id')
+        EnrolledClass.objects.filter(course_id=duplicate, student_id__in=enrolled).delete()
+        EnrolledClass.objects.filter(course_id=duplicate).update(course_id=course)
+
+
+def refresh_departments():
+    """
+    make Departments list every subject in Course with how many sections it has
+
+    The rows are only rewritten when something changed, so Departments.updated says when the
+    directory last changed. return the directory
+    """
+    counts = dict(Course.objects.order_by().values_list('subject').annotate(Count('pk')))
+    if dict(Departments.objects.values_list('dept', 'course_count')) != counts:
+        Departments.objects.all().delete()
+        Departments.objects.bulk_create([Departments(dept=dept, course_count=count)
+                                         for dept, count in sorted(counts.items())])
+    return counts
+
+
+def directory_last_modified():
+    """
+    when the department directory last changed, or None if there are no departments
+    """
+    return Departments.objects.aggregate(Max('updated'))['updated__max']
+
+
+def department_directory(last_modified=None):
+    """
+    the departments and their course counts, in order
+
+    The list is cached under the time it last changed, so refreshing the directory in any process
+    (like the import_catalog command) makes every other process stop using its cached copy.
+    """
+    if last_modified is None:
+        last_modified = directory_last_modified()
+    if last_modified is None:
+        return []
+
+    version = int(last_modified.timestamp() * 1000000)
+    return cache.get_or_set('department_directory',
+                            lambda: list(Departments.objects.order_by('dept').values('dept', 'course_count')),
+                            version=version)
@@ -1,16 +1,56 @@
 import json
+import time
+from collections import OrderedDict
 
+from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
-from asgiref.sync import sync_to_async, async_to_sync
+from channels.layers import get_channel_layer
+from asgiref.sync import async_to_sync
 
-from .models import Message, Room, User
+from .models import Room, RoomReadState, User
+from .message_buffer import message_buffer
+from . import metrics
+
+
+def room_group_name(room_pk):
+    return 'chat_%s' % room_pk
+
+
+def broadcast_profile_update(user):
+    """
+    let every open connection in the user's chat rooms know their display name changed
+    """
+    channel_layer = get_channel_layer()
+    for room_pk in user.room_set.values_list('pk', flat=True):
+        async_to_sync(channel_layer.group_send)(
+            room_group_name(room_pk),
+            {
+                'type': 'profile_updated',
+                'email': user.email,
+                'name': user.name,
+            }
+        )
 
 
 class ChatConsumer(AsyncWebsocketConsumer):
+    # how many display names each connection keeps around
+    name_cache_size = 128
+
     async def connect(self):
+        # disconnect can run when connecting failed part way, before the room was looked up
+        self.room = None
         # self.user_email = self.scope['url_route']['kwargs']['user_email']
         self.room_name = self.scope['url_route']['kwargs']['room_name']
-        self.room_group_name = 'chat_%s' % self.room_name
+        self.room_group_name = room_group_name(self.room_name)
+        self.names = OrderedDict()
+
+        # who is connecting is decided here once, never by what the client sends later
+        self.user, self.room = await self.get_membership()
+        if self.room is None:
+            # only signed in members of the room can join its chat
+            metrics.WEBSOCKET_CONNECTS.inc(result='rejected')
+            await self.close()
+            return
 
         await self.channel_layer.group_add(
             self.room_group_name,
@@ -18,40 +58,65 @@ class ChatConsumer(AsyncWebsocketConsumer):
         )
 
         await self.accept()
+        metrics.WEBSOCKET_CONNECTS.inc(result='accepted')
+        metrics.WEBSOCKET_OPEN.inc()
 
     async def disconnect(self, close_code):
+        if self.room is None:
+            # rejected, or connecting failed, so it never joined the room group
+            return
+        metrics.WEBSOCKET_OPEN.dec()
+
         # Leave room group
         await self.channel_layer.group_discard(
             self.room_group_name,
             self.channel_name
         )
 
+        # save anything still waiting in the buffer
+        await message_buffer.aflush()
+
+        # everything up to now was seen while connected, so it isn't unread on the rooms page
+        await self.mark_read()
+
     async def receive(self, text_data):
+        started = time.perf_counter()
         data = json.loads(text_data)
         message = data['message']
-        email = data['email']
-        room_pk = data['room_pk']
+        metrics.CHAT_RECEIVED.inc()
 
-        await self.save_message(email, room_pk, message)
+        # the message is saved in the background so the room doesn't wait on the database
+        if message != "":
+            await message_buffer.enqueue(self.user.email, self.room.pk, message)
 
-        await self.channel_layer.group_send(
+        sent_to = await self.channel_layer.group_send(
             self.room_group_name,
             {
                 'type': 'chat_message',
                 'message': message,
-                'email': email,
-                'room_pk': room_pk,
+                'email': self.user.email,
+                'room_pk': self.room.pk,
+                'name': self.user.name,
             }
         )
 
+        # only some channel layers say how many connections the message went to
+        if sent_to is not None:
+            metrics.CHAT_FANOUT.observe(sent_to)
+        metrics.CHAT_RECEIVE_DURATION.observe(time.perf_counter() - started)
+
     async def chat_message(self, event):
         message = event['message']
         email = event['email']
         room_pk = event['room_pk']
-        name = User.objects.get(email=email).name
 
-        print('name', name)
+        if 'name' in event:
+            name = event['name']
+            self.remember_name(email, name)
+        else:
+            name = await self.get_name(email)
 
+        metrics.CHAT_DELIVERED.inc()
         await self.send(text_data=json.dumps({
             'message': message,
             'email': email,
@@ -59,10 +124,48 @@ class ChatConsumer(AsyncWebsocketConsumer):
             'name': name
         }))
 
-    @sync_to_async
-    def save_message(self, email, room_pk, message):
-        if User.objects.filter(email=email) and message != "":
-            user = User.objects.get(email=email)
-            room = Room.objects.get(pk=room_pk)
+    async def profile_updated(self, event):
+        # a member of this room changed their name, so forget the old one
+        self.names.pop(event['email'], None)
+        if event['email'] == self.user.email:
+            self.user.name = event['name']
+
+    async def get_name(self, email):
+        if email in self.names:
+            self.names.move_to_end(email)
+            return self.names[email]
+
+        name = await self.lookup_name(email)
+        self.remember_name(email, name)
+        return name
+
+    def remember_name(self, email, name):
+        self.names[email] = name
+        self.names.move_to_end(email)
+        if len(self.names) > self.name_cache_size:
+            # drop the least recently used name
+            self.names.popitem(last=False)
+
+    @database_sync_to_async
+    def get_membership(self):
+        """
+        return the studybuddy user signed in on this connection and the room they are joining,
+        or None for the room if they aren't signed in or aren't a member of it
+        """
+        auth_user = self.scope.get('user')
+        if auth_user is None or auth_user.is_anonymous or not self.room_name.isdigit():
+            return None, None
+
+        user = User.objects.filter(email=auth_user.email).first()
+        room = Room.objects.filter(pk=self.room_name, users=user).first() if user else None
+        return user, room
+
+    @database_sync_to_async
+    def mark_read(self):
+        # the user may have left the room, or been its last member and deleted it, before disconnecting
+        if Room.objects.filter(pk=self.room.pk, users=self.user).exists():
+            RoomReadState.mark_read(self.user, self.room)
 
-            Message.objects.create(user=user, room=room, content=message)
+    @database_sync_to_async
+    def lookup_name(self, email):
+        return User.objects.filter(email=email).values_list('name', flat=True).first() or ""
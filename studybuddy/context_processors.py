@@ -0,0 +1,11 @@
+from django.utils.functional import SimpleLazyObject
+from studybuddy.middleware import get_student_name
+
+
+def student_name(request):
+    """
+    makes student_name available to every template, looked up only if the template uses it
+    """
+    if request.user.is_anonymous:
+        return {}
+    return {'student_name': SimpleLazyObject(lambda: get_student_name(request))}
@@ -0,0 +1,142 @@
+import threading
+import time
+from django.conf import settings
+from studybuddy.models import User
+
+# number of set bits, int.bit_count is only on Python 3.10+
+popcount = getattr(int, 'bit_count', lambda bits: bin(bits).count('1'))
+
+
+def set_bits(bits):
+    """
+    the positions of the set bits, lowest first
+    """
+    while bits:
+        lowest = bits & -bits
+        yield lowest.bit_length() - 1
+        bits ^= lowest
+
+
+class FriendGraph:
+    """
+    Who is friends with who, kept in memory for mutual friend counts and "people you may know"
+
+    Every user in a friendship gets a small int id, and each user's friends are stored as a bitset
+    (a Python int with the friends' ids set), so mutual friends are an & and a popcount, and friends of
+    friends are an | over the user's friends. It is loaded from the User.friends table in one query,
+    kept up to date by the signal in studybuddy.signals, and reloaded every max_age seconds to pick up
+    changes made by other processes.
+    """
+
+    def __init__(self, max_age=300):
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self.loaded_at = None
+
+    def load(self):
+        """
+        read every friendship from the database
+        """
+        with self.lock:
+            self.ids = {}
+            self.emails = []
+            self.adjacency = []
+            for email, friend_email in User.friends.through.objects.values_list('from_user_id', 'to_user_id').iterator():
+                self._connect(self._id(email), self._id(friend_email))
+            self.loaded_at = time.monotonic()
+
+    def reset(self):
+        """
+        forget everything, the graph is loaded again the next time it is used
+        """
+        with self.lock:
+            self.loaded_at = None
+
+    @property
+    def loaded(self):
+        return self.loaded_at is not None
+
+    def ensure_loaded(self):
+        if self.loaded_at is None or time.monotonic() - self.loaded_at > self.max_age:
+            self.load()
+
+    def _id(self, email):
+        if email not in self.ids:
+            self.ids[email] = len(self.emails)
+            self.emails.append(email)
+            self.adjacency.append(0)
+        return self.ids[email]
+
+    def _connect(self, a, b):
+        self.adjacency[a] |= 1 << b
+        self.adjacency[b] |= 1 << a
+
+    def _friends_bits(self, email):
+        user_id = self.ids.get(email)
+        return 0 if user_id is None else self.adjacency[user_id]
+
+    def befriend(self, email, friend_email):
+        """
+        two users became friends, does nothing until the graph has been loaded
+        """
+        with self.lock:
+            if self.loaded:
+                self._connect(self._id(email), self._id(friend_email))
+
+    def unfriend(self, email, friend_email):
+        with self.lock:
+            if self.loaded and email in self.ids and friend_email in self.ids:
+                a, b = self.ids[email], self.ids[friend_email]
+                self.adjacency[a] &= ~(1 << b)
+                self.adjacency[b] &= ~(1 << a)
+
+    def friends(self, email):
+        """
+        the emails of a user's friends
+        """
+        self.ensure_loaded()
+        with self.lock:
+            return {self.emails[friend_id] for friend_id in set_bits(self._friends_bits(email))}
+
+    def mutual_counts(self, email, others):
+        """
+        how many friends the user has in common with each of the others, as a dict by email
+        """
+        self.ensure_loaded()
+        with self.lock:
+            friends = self._friends_bits(email)
+            return {other: popcount(friends & self._friends_bits(other)) for other in others}
+
+    def friends_of_friends(self, email):
+        """
+        the users who aren't friends with this one but have friends in common with them, as a dict
+        of email to how many mutual friends they have
+        """
+        self.ensure_loaded()
+        with self.lock:
+            friends = self._friends_bits(email)
+            candidates = 0
+            for friend_id in set_bits(friends):
+                candidates |= self.adjacency[friend_id]
+            if email in self.ids:
+                candidates &= ~(1 << self.ids[email])
+            candidates &= ~friends
+
+            return {self.emails[candidate]: popcount(friends & self.adjacency[candidate])
+                    for candidate in set_bits(candidates)}
+
+
+friend_graph = FriendGraph(getattr(settings, 'MATCH_INDEX_MAX_AGE', 300))
+
+
+def people_you_may_know(student, exclude=(), limit=5):
+    """
+    the users with the most friends in common with this one, as (User, number of mutual friends), best first
+    """
+    candidates = friend_graph.friends_of_friends(student.email)
+    for email in exclude:
+        candidates.pop(email, None)
+    top = sorted(candidates.items(), key=lambda candidate: (-candidate[1], candidate[0]))[:limit]
+
+    users = User.objects.in_bulk([email for email, mutual in top])
+    return [(users[email], mutual) for email, mutual in top if email in users]
@@ -0,0 +1,307 @@
+import asyncio
+import functools
+import json
+import random
+import sqlite3
+import string
+import threading
+import time
+import uuid
+
+from channels.exceptions import ChannelFull
+from channels.layers import BaseChannelLayer
+
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS channel_message (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    channel TEXT NOT NULL,
+    target TEXT NOT NULL,
+    expires REAL NOT NULL,
+    body TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS channel_message_target ON channel_message (target, id);
+CREATE INDEX IF NOT EXISTS channel_message_channel ON channel_message (channel, expires);
+CREATE TABLE IF NOT EXISTS channel_group (
+    name TEXT NOT NULL,
+    channel TEXT NOT NULL,
+    joined REAL NOT NULL,
+    PRIMARY KEY (name, channel)
+);
+CREATE INDEX IF NOT EXISTS channel_group_channel ON channel_group (channel);
+'''
+
+
+class SQLiteChannelLayer(BaseChannelLayer):
+    """
+    Channel layer that lets several server processes on the same machine talk to each other
+    through a shared SQLite file, so more than one daphne process can serve the same chat rooms
+    without running a separate broker like Redis.
+
+    Messages have to be JSON serialisable. Each process reads the messages for all of its own
+    consumers with a single polling query and hands them out from memory, so the cost of waiting
+    for messages doesn't grow with the number of open connections.
+    """
+
+    extensions = ['groups', 'flush']
+
+    def __init__(self, path, expiry=60, group_expiry=86400, capacity=100, channel_capacity=None,
+                 poll_interval=0.005, max_poll_interval=0.1, clean_interval=1):
+        super().__init__(expiry=expiry, capacity=capacity, channel_capacity=channel_capacity)
+        self.channel_capacity = self.compile_capacities(channel_capacity or {})
+        self.path = str(path)
+        self.group_expiry = group_expiry
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.clean_interval = clean_interval
+
+        # every channel made by this process starts with this, which is how the poller finds them
+        self.client_prefix = 'specific.' + uuid.uuid4().hex + '!'
+
+        self._connection = None
+        self._lock = threading.Lock()
+        self._last_clean = 0
+        self._reset(None)
+
+    def _reset(self, loop):
+        # queues and tasks belong to one event loop, so start over if we are used from another one
+        self._loop = loop
+        self._buffers = {}
+        self._poller = None
+
+    def _check_loop(self):
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._reset(loop)
+
+    # Database access
+
+    def _connect(self):
+        if self._connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.executescript(SCHEMA)
+            self._connection = connection
+        return self._connection
+
+    def _execute(self, function, *args, transaction=True):
+        with self._lock:
+            connection = self._connect()
+            if not transaction:
+                # every statement commits on its own
+                return function(connection, *args)
+
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                result = function(connection, *args)
+            except BaseException:
+                connection.execute('ROLLBACK')
+                raise
+            connection.execute('COMMIT')
+            return result
+
+    async def _run(self, function, *args, transaction=True):
+        return await asyncio.get_running_loop().run_in_executor(
+            None, functools.partial(self._execute, function, *args, transaction=transaction))
+
+    def _target(self, channel):
+        # messages for a process specific channel are picked up by the process that made it
+        return self.non_local_name(channel)
+
+    def _insert(self, connection, channels, body, now):
+        """
+        queue body on every channel that still has room for it and return the channels that were full
+        """
+        placeholders = ','.join('?' * len(channels))
+        counts = dict(connection.execute(
+            'SELECT channel, COUNT(*) FROM channel_message '
+            'WHERE channel IN (%s) AND expires >= ? GROUP BY channel' % placeholders,
+            (*channels, now)))
+
+        full = [channel for channel in channels if counts.get(channel, 0) >= self.get_capacity(channel)]
+        connection.executemany(
+            'INSERT INTO channel_message (channel, target, expires, body) VALUES (?, ?, ?, ?)',
+            [(channel, self._target(channel), now + self.expiry, body) for channel in channels if channel not in full])
+        return full
+
+    def _send(self, connection, channel, body):
+        return self._insert(connection, [channel], body, time.time())
+
+    def _group_send(self, connection, group, body):
+        now = time.time()
+        self._clean_expired(connection, now)
+        channels = [row[0] for row in connection.execute(
+            'SELECT channel FROM channel_group WHERE name = ?', (group,))]
+        # SQLite limits how many values one statement can take
+        for start in range(0, len(channels), 500):
+            self._insert(connection, channels[start:start + 500], body, now)
+        return len(channels)
+
+    def _claim(self, connection, channel):
+        row = connection.execute(
+            'SELECT id, body FROM channel_message WHERE target = ? AND expires >= ? ORDER BY id LIMIT 1',
+            (channel, time.time())).fetchone()
+        if row is None:
+            return None
+        connection.execute('DELETE FROM channel_message WHERE id = ?', (row[0],))
+        return row[1]
+
+    def _take_local(self, connection):
+        # only this process reads messages sent to its own channels, so nothing else can
+        # take them between the select and the delete and no write lock is needed while polling
+        now = time.time()
+        self._clean_expired(connection, now)
+        rows = connection.execute(
+            'SELECT id, channel, body FROM channel_message WHERE target = ? AND expires >= ? ORDER BY id',
+            (self.client_prefix, now)).fetchall()
+        if rows:
+            connection.execute('DELETE FROM channel_message WHERE target = ? AND id <= ?',
+                               (self.client_prefix, rows[-1][0]))
+        return [(channel, body) for _, channel, body in rows]
+
+    def _clean_expired(self, connection, now):
+        """
+        remove expired messages, and take the channels they were sent to out of their groups
+        since nothing has been reading them
+        """
+        if now - self._last_clean < self.clean_interval:
+            return
+        self._last_clean = now
+
+        connection.execute(
+            'DELETE FROM channel_group WHERE channel IN '
+            '(SELECT DISTINCT channel FROM channel_message WHERE expires < ?)', (now,))
+        connection.execute('DELETE FROM channel_message WHERE expires < ?', (now,))
+        connection.execute('DELETE FROM channel_group WHERE joined < ?', (now - self.group_expiry,))
+
+    # Channel layer API
+
+    async def send(self, channel, message):
+        """
+        Send a message onto a (general or specific) channel.
+        """
+        assert isinstance(message, dict), "message is not a dict"
+        assert self.valid_channel_name(channel), "Channel name not valid"
+        assert "__asgi_channel__" not in message
+
+        if await self._run(self._send, channel, json.dumps(message)):
+            raise ChannelFull(channel)
+
+    async def receive(self, channel):
+        """
+        Receive the first message that arrives on the channel.
+        """
+        assert self.valid_channel_name(channel)
+        self._check_loop()
+
+        if channel.startswith(self.client_prefix):
+            return await self._receive_local(channel)
+
+        # general channels can be read by any process, so each message is claimed on its own
+        interval = self.poll_interval
+        while True:
+            body = await self._run(self._claim, channel)
+            if body is not None:
+                return json.loads(body)
+            await asyncio.sleep(interval)
+            interval = min(interval * 2, self.max_poll_interval)
+
+    async def _receive_local(self, channel):
+        queue = self._buffers.setdefault(channel, asyncio.Queue())
+        if self._poller is None or self._poller.done():
+            self._poller = asyncio.ensure_future(self._poll())
+
+        try:
+            return json.loads(await queue.get())
+        except asyncio.CancelledError:
+            # the consumer went away, so stop collecting messages for it
+            if queue.empty():
+                self._buffers.pop(channel, None)
+            raise
+
+    async def _poll(self):
+        interval = self.poll_interval
+        while self._buffers:
+            rows = await self._run(self._take_local, transaction=False)
+            for channel, body in rows:
+                if channel in self._buffers:
+                    self._buffers[channel].put_nowait(body)
+
+            if rows:
+                interval = self.poll_interval
+            else:
+                await asyncio.sleep(interval)
+                interval = min(interval * 2, self.max_poll_interval)
+
+    async def new_channel(self, prefix="specific."):
+        """
+        Returns a new channel name that can be used by something in our
+        process as a specific channel.
+        """
+        # the prefix is always our own so the poller can find the channel
+        self._check_loop()
+        channel = self.client_prefix + ''.join(random.choice(string.ascii_letters) for i in range(12))
+        self._buffers[channel] = asyncio.Queue()
+        return channel
+
+    # Flush extension
+
+    async def flush(self):
+        def flush(connection):
+            connection.execute('DELETE FROM channel_message')
+            connection.execute('DELETE FROM channel_group')
+
+        await self._run(flush)
+        self._buffers = {}
+
+    async def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+    # Groups extension
+
+    async def group_add(self, group, channel):
+        """
+        Adds the channel name to a group.
+        """
+        assert self.valid_group_name(group), "Group name not valid"
+        assert self.valid_channel_name(channel), "Channel name not valid"
+
+        def group_add(connection):
+            connection.execute('INSERT OR REPLACE INTO channel_group (name, channel, joined) VALUES (?, ?, ?)',
+                               (group, channel, time.time()))
+
+        await self._run(group_add)
+
+    async def group_discard(self, group, channel):
+        assert self.valid_channel_name(channel), "Invalid channel name"
+        assert self.valid_group_name(group), "Invalid group name"
+
+        def group_discard(connection):
+            connection.execute('DELETE FROM channel_group WHERE name = ? AND channel = ?', (group, channel))
+
+        await self._run(group_discard)
+
+    async def group_send(self, group, message):
+        """
+        Send the message to every channel in the group, and return how many channels that was.
+        """
+        assert isinstance(message, dict), "Message is not a dict"
+        assert self.valid_group_name(group), "Invalid group name"
+
+        return await self._run(self._group_send, group, json.dumps(message))
+
+    # Monitoring
+
+    def pending_count(self):
+        """
+        how many messages are waiting to be received, across every process using the file
+        """
+        def count(connection):
+            return connection.execute('SELECT COUNT(*) FROM channel_message WHERE expires >= ?',
+                                      (time.time(),)).fetchone()[0]
+
+        return self._execute(count, transaction=False)
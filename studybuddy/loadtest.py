@@ -0,0 +1,370 @@
+"""
+A load generator for the chat rooms, used by `python manage.py chat_loadtest` to size workers.
+
+It opens many websocket connections across many rooms, has each one send messages at a steady
+rate and measures how long every message takes to reach every connection in its room. The
+connections either run the ChatConsumer in this process through channels' WebsocketCommunicator,
+or connect over the network to a running daphne.
+"""
+import asyncio
+import base64
+import bisect
+import json
+import math
+import os
+import random
+import struct
+import time
+from importlib import import_module
+from urllib.parse import urlsplit
+
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY, BACKEND_SESSION_KEY, HASH_SESSION_KEY, get_user_model
+from django.contrib.auth.hashers import make_password
+from django.utils import timezone
+
+from studybuddy.catalog import refresh_departments
+from studybuddy.models import User, Course, Post, Room, Message
+from studybuddy.routing import websocket_urlpatterns
+
+# load test users, courses and posts are named with this so they can be found and removed afterwards
+PREFIX = 'loadtest'
+LOADTEST_SUBJECT = 'LOAD'
+
+# upper edges of the latency histogram buckets, in milliseconds
+HISTOGRAM_BUCKETS = [0.5 * 2 ** i for i in range(16)]
+
+
+class Histogram:
+    """
+    latency samples in milliseconds, with percentiles and a bucketed text chart
+    """
+
+    def __init__(self):
+        self.samples = []
+
+    def __len__(self):
+        return len(self.samples)
+
+    def add(self, ms):
+        self.samples.append(ms)
+
+    def percentile(self, percent):
+        if not self.samples:
+            return 0.0
+        samples = sorted(self.samples)
+        return samples[min(len(samples) - 1, int(len(samples) * percent / 100))]
+
+    def buckets(self):
+        """
+        how many samples fall in each bucket, as [(upper edge, count)], the last edge is infinity
+        """
+        counts = [0] * (len(HISTOGRAM_BUCKETS) + 1)
+        for sample in self.samples:
+            counts[bisect.bisect_left(HISTOGRAM_BUCKETS, sample)] += 1
+        return list(zip(HISTOGRAM_BUCKETS + [math.inf], counts))
+
+    def chart(self, width=40):
+        # leave off the empty buckets below the fastest sample and above the slowest
+        buckets = self.buckets()
+        while buckets and not buckets[-1][1]:
+            buckets.pop()
+        while buckets and not buckets[0][1]:
+            buckets.pop(0)
+        most = max((count for edge, count in buckets), default=0) or 1
+
+        lines = []
+        for edge, count in buckets:
+            label = '<= %g ms' % edge if edge != math.inf else '> %g ms' % HISTOGRAM_BUCKETS[-1]
+            lines.append('%12s %-*s %d' % (label, width, '#' * math.ceil(width * count / most), count))
+        return '\n'.join(lines)
+
+    def summary(self):
+        return {
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'p99': self.percentile(99),
+            'max': max(self.samples, default=0.0),
+        }
+
+
+def prepare(rooms, connections_per_room):
+    """
+    make the load test's users, one per connection, and rooms with those users in them, and return
+    [(auth user, room pk)] for every connection
+
+    Everything is bulk inserted, so the course doesn't show up in the department directory or search,
+    and passwords are left unusable since connections log in with a session made for them (see
+    session_cookie) or are handed the user directly.
+    """
+    cleanup()
+    course, = Course.objects.bulk_create([Course(subject=LOADTEST_SUBJECT, catalog_number='0000', instructor=PREFIX,
+                                                 section='0', course_number=PREFIX, description='chat load test')])
+    count = rooms * connections_per_room
+    emails = ['%s%d@example.com' % (PREFIX, i) for i in range(count)]
+    students = User.objects.bulk_create([User(email=email, username='%s%d' % (PREFIX, i), name='Load Test %d' % i)
+                                         for i, email in enumerate(emails)])
+
+    password = make_password(None)
+    auth_users = get_user_model().objects.bulk_create([
+        get_user_model()(username='%s%d' % (PREFIX, i), email=email, password=password)
+        for i, email in enumerate(emails)])
+
+    today = timezone.localdate()
+    posts = Post.objects.bulk_create([Post(course=course, user=students[i * connections_per_room],
+                                           topic='%s %d' % (PREFIX, i), startDate=today, endDate=today)
+                                      for i in range(rooms)])
+    room_objects = Room.objects.bulk_create([Room(name=post.topic, post=post) for post in posts])
+    Membership = Room.users.through
+    Membership.objects.bulk_create([Membership(room_id=room.pk, user_id=emails[i * connections_per_room + j])
+                                    for i, room in enumerate(room_objects) for j in range(connections_per_room)])
+
+    return [(auth_users[i * connections_per_room + j], room.pk)
+            for i, room in enumerate(room_objects) for j in range(connections_per_room)]
+
+
+def cleanup():
+    """
+    remove everything prepare made, messages and rooms go with the course and users
+    """
+    Course.objects.filter(subject=LOADTEST_SUBJECT, course_number=PREFIX).delete()
+    User.objects.filter(email__startswith=PREFIX, email__endswith='@example.com').delete()
+    get_user_model().objects.filter(username__startswith=PREFIX, email__endswith='@example.com').delete()
+    # drops a LOAD department left behind by an older load test
+    refresh_departments()
+
+
+def saved_messages(room_pks):
+    return Message.objects.filter(room_id__in=room_pks).count()
+
+
+def session_cookie(user):
+    """
+    a session cookie that logs the user in, for connections made over the network
+    """
+    session = import_module(settings.SESSION_ENGINE).SessionStore()
+    session[SESSION_KEY] = str(user.pk)
+    session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+    session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+    session.create()
+    return '%s=%s' % (settings.SESSION_COOKIE_NAME, session.session_key)
+
+
+def room_path(room_pk):
+    return '/studybuddy/chat/rooms/%d/' % room_pk
+
+
+class InProcessConnection:
+    """
+    a connection to a ChatConsumer running in this process, for measuring the consumer, channel
+    layer and message buffer without the network
+    """
+    application = URLRouter(websocket_urlpatterns)
+
+    def __init__(self, user, room_pk):
+        self.communicator = WebsocketCommunicator(self.application, room_path(room_pk))
+        self.communicator.scope['user'] = user
+
+    async def connect(self):
+        connected, _ = await self.communicator.connect()
+        return connected
+
+    async def send(self, text):
+        await self.communicator.send_to(text_data=text)
+
+    async def receive(self):
+        return (await self.communicator.receive_output(timeout=None))['text']
+
+    async def close(self):
+        await self.communicator.disconnect()
+
+
+class DaphneConnection:
+    """
+    a real websocket connection to a running server, logged in with a session cookie
+
+    This is a minimal websocket client (text frames, ping and close) written on asyncio streams.
+    autobahn's asyncio client can't be used because daphne has already set autobahn up for twisted
+    in this process.
+    """
+
+    def __init__(self, url, cookie, room_pk):
+        # url is the server's address, like ws://localhost:8000
+        self.url = urlsplit(url.rstrip('/') + room_path(room_pk))
+        self.cookie = cookie
+        self.reader = self.writer = None
+
+    async def connect(self):
+        secure = self.url.scheme == 'wss'
+        try:
+            self.reader, self.writer = await asyncio.open_connection(
+                self.url.hostname, self.url.port or (443 if secure else 80), ssl=secure or None)
+        except OSError:
+            return False
+
+        key = base64.b64encode(os.urandom(16)).decode()
+        # the server only accepts websockets from its own pages, see AllowedHostsOriginValidator
+        self.writer.write(('GET %s HTTP/1.1\r\n'
+                           'Host: %s\r\n'
+                           'Upgrade: websocket\r\n'
+                           'Connection: Upgrade\r\n'
+                           'Sec-WebSocket-Key: %s\r\n'
+                           'Sec-WebSocket-Version: 13\r\n'
+                           'Origin: %s://%s\r\n'
+                           'Cookie: %s\r\n\r\n'
+                           % (self.url.path, self.url.netloc, key, 'https' if secure else 'http', self.url.netloc,
+                              self.cookie)).encode())
+        response = await self.reader.readuntil(b'\r\n\r\n')
+        return response.split(b' ', 2)[1] == b'101'
+
+    async def send(self, text):
+        self.write_frame(0x1, text.encode('utf8'))
+        await self.writer.drain()
+
+    async def receive(self):
+        message = b''
+        while True:
+            try:
+                header = await self.reader.readexactly(2)
+                length = header[1] & 0x7f
+                if length == 126:
+                    length = struct.unpack('!H', await self.reader.readexactly(2))[0]
+                elif length == 127:
+                    length = struct.unpack('!Q', await self.reader.readexactly(8))[0]
+                payload = await self.reader.readexactly(length)
+            except (asyncio.IncompleteReadError, OSError):
+                raise ConnectionError('connection closed')
+
+            opcode = header[0] & 0x0f
+            if opcode == 0x8:
+                raise ConnectionError('connection closed')
+            if opcode == 0x9:
+                self.write_frame(0xa, payload)
+                continue
+            if opcode in (0x0, 0x1):
+                message += payload
+                # the final frame of a message has the top bit set
+                if header[0] & 0x80:
+                    return message.decode('utf8')
+
+    def write_frame(self, opcode, payload):
+        # frames from a client are always masked
+        mask = os.urandom(4)
+        if len(payload) < 126:
+            header = struct.pack('!BB', 0x80 | opcode, 0x80 | len(payload))
+        elif len(payload) < 1 << 16:
+            header = struct.pack('!BBH', 0x80 | opcode, 0x80 | 126, len(payload))
+        else:
+            header = struct.pack('!BBQ', 0x80 | opcode, 0x80 | 127, len(payload))
+        self.writer.write(header + mask + bytes(byte ^ mask[i % 4] for i, byte in enumerate(payload)))
+
+    async def close(self):
+        if self.writer is not None:
+            self.write_frame(0x8, struct.pack('!H', 1000))
+            self.writer.close()
+
+
+async def measure_loop_lag(lag, stop, interval=0.01):
+    """
+    how late the event loop wakes up from a short sleep, a busy loop delays every message
+    """
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        start = loop.time()
+        await asyncio.sleep(interval)
+        lag.add(max(0.0, (loop.time() - start - interval) * 1000))
+
+
+async def drive(connections, rate, duration, drain=2.0, connect_concurrency=100):
+    """
+    connect every connection, have each send rate messages a second for duration seconds and
+    record how long each message took to reach every connection in its room
+
+    connections are (room pk, connection) pairs. Messages are sent on a fixed schedule whether or
+    not earlier ones have arrived, so a server that falls behind shows up as growing latency.
+    return the measurements as a dict
+    """
+    run = '%x' % random.getrandbits(32)
+    latency = Histogram()
+    lag = Histogram()
+    stop = asyncio.Event()
+    received = [0]
+    sent = {}
+
+    # connecting thousands of sockets at once would measure the connect storm, not the chat
+    semaphore = asyncio.Semaphore(connect_concurrency)
+
+    async def connect(connection):
+        async with semaphore:
+            return await connection.connect()
+
+    connect_started = time.perf_counter()
+    connected = await asyncio.gather(*(connect(connection) for room_pk, connection in connections))
+    connect_seconds = time.perf_counter() - connect_started
+    open_connections = [(room_pk, connection) for (room_pk, connection), ok in zip(connections, connected) if ok]
+    room_sizes = {}
+    for room_pk, connection in open_connections:
+        room_sizes[room_pk] = room_sizes.get(room_pk, 0) + 1
+
+    async def send(index, room_pk, connection):
+        interval = 1 / rate
+        # start at a random point in the first interval so the connections don't all send together
+        next_send = time.perf_counter() + random.random() * interval
+        end = time.perf_counter() + duration
+        sequence = 0
+        while next_send < end:
+            await asyncio.sleep(max(0.0, next_send - time.perf_counter()))
+            await connection.send(json.dumps({'message': '%s %s %d %d %.9f'
+                                              % (PREFIX, run, index, sequence, time.perf_counter())}))
+            sent[room_pk] = sent.get(room_pk, 0) + 1
+            sequence += 1
+            next_send += interval
+
+    async def receive(connection):
+        while True:
+            try:
+                message = json.loads(await connection.receive())['message'].split()
+            except ConnectionError:
+                return
+            if len(message) == 5 and message[:2] == [PREFIX, run]:
+                latency.add((time.perf_counter() - float(message[4])) * 1000)
+                received[0] += 1
+
+    lag_task = asyncio.ensure_future(measure_loop_lag(lag, stop))
+    receivers = [asyncio.ensure_future(receive(connection)) for room_pk, connection in open_connections]
+    started = time.perf_counter()
+    await asyncio.gather(*(send(index, room_pk, connection)
+                           for index, (room_pk, connection) in enumerate(open_connections)))
+    send_seconds = time.perf_counter() - started
+
+    # every message goes to every connection in its room, the sender's included
+    expected = sum(count * room_sizes[room_pk] for room_pk, count in sent.items())
+
+    # wait for the messages still on their way, stopping early once everything has arrived
+    drain_until = time.perf_counter() + drain
+    while received[0] < expected and time.perf_counter() < drain_until:
+        await asyncio.sleep(0.05)
+
+    stop.set()
+    await lag_task
+    for receiver in receivers:
+        receiver.cancel()
+    await asyncio.gather(*receivers, return_exceptions=True)
+    await asyncio.gather(*(connection.close() for room_pk, connection in open_connections), return_exceptions=True)
+
+    return {
+        'connections': len(open_connections),
+        'failed_connections': len(connections) - len(open_connections),
+        'rooms': len(room_sizes),
+        'connect_seconds': connect_seconds,
+        'seconds': send_seconds,
+        'sent': sum(sent.values()),
+        'expected': expected,
+        'delivered': received[0],
+        'sent_per_second': sum(sent.values()) / send_seconds if send_seconds else 0.0,
+        'delivered_per_second': received[0] / send_seconds if send_seconds else 0.0,
+        'latency': latency,
+        'loop_lag': lag,
+    }
@@ -0,0 +1,83 @@
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+from studybuddy import loadtest
+from studybuddy.message_buffer import message_buffer
+
+
+class Command(BaseCommand):
+    help = ('Open many chat connections across many rooms, send messages at a steady rate and report '
+            'delivery latency, throughput, database writes and event loop lag')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rooms', type=int, default=100, help='how many chat rooms to spread the connections over')
+        parser.add_argument('--connections-per-room', type=int, default=10,
+                            help='how many connections join each room, each as a different user')
+        parser.add_argument('--rate', type=float, default=0.5,
+                            help='how many messages each connection sends a second')
+        parser.add_argument('--duration', type=float, default=30, help='how many seconds to send messages for')
+        parser.add_argument('--drain', type=float, default=5,
+                            help='how many seconds to wait for messages still on their way after sending stops')
+        parser.add_argument('--connect-concurrency', type=int, default=100,
+                            help='how many connections are opened at the same time')
+        parser.add_argument('--url', help='connect to a running server, like ws://localhost:8000, instead of '
+                                          'running the chat consumer in this process')
+        parser.add_argument('--keep', action='store_true', help="don't delete the load test's users and rooms")
+        parser.add_argument('--yes', action='store_true',
+                            help='run even though DEBUG is off, the load test adds users and rooms to the %s database'
+                                 % DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        if options['rate'] <= 0 or options['duration'] <= 0:
+            raise CommandError('--rate and --duration must be more than 0')
+        if not settings.DEBUG and not options['yes']:
+            raise CommandError('DEBUG is off, so this could be the production database %s. Pass --yes to add the '
+                               "load test's users and rooms to it anyway" % settings.DATABASES[DEFAULT_DB_ALIAS]['NAME'])
+
+        self.stdout.write('Preparing %d rooms with %d users each'
+                          % (options['rooms'], options['connections_per_room']))
+        members = loadtest.prepare(options['rooms'], options['connections_per_room'])
+        room_pks = sorted({room_pk for user, room_pk in members})
+
+        try:
+            if options['url']:
+                connections = [(room_pk, loadtest.DaphneConnection(options['url'], loadtest.session_cookie(user), room_pk))
+                               for user, room_pk in members]
+            else:
+                connections = [(room_pk, loadtest.InProcessConnection(user, room_pk)) for user, room_pk in members]
+
+            # the consumers' database calls run on this thread and share its connection
+            results = async_to_sync(self.drive)(connections, options)
+            # a server in another process flushes its message buffer on its own schedule, anything
+            # it hasn't saved by the end of the drain isn't counted
+            self.report(results, loadtest.saved_messages(room_pks))
+        finally:
+            if not options['keep']:
+                loadtest.cleanup()
+
+    async def drive(self, connections, options):
+        results = await loadtest.drive(connections, options['rate'], options['duration'], options['drain'],
+                                       options['connect_concurrency'])
+        if not options['url']:
+            await message_buffer.aflush()
+        return results
+
+    def report(self, results, saved):
+        latency = results['latency'].summary()
+        lag = results['loop_lag'].summary()
+        lines = [
+            'Connections:  %d open in %d rooms (%d failed) in %.1fs'
+            % (results['connections'], results['rooms'], results['failed_connections'], results['connect_seconds']),
+            'Sent:         %d messages in %.1fs, %.1f/s'
+            % (results['sent'], results['seconds'], results['sent_per_second']),
+            'Delivered:    %d of %d, %.1f/s' % (results['delivered'], results['expected'], results['delivered_per_second']),
+            'Saved:        %d messages, %.1f writes/s' % (saved, saved / results['seconds'] if results['seconds'] else 0.0),
+            'Latency:      p50 %.1fms  p95 %.1fms  p99 %.1fms  max %.1fms'
+            % (latency['p50'], latency['p95'], latency['p99'], latency['max']),
+            'Loop lag:     p50 %.1fms  p99 %.1fms  max %.1fms' % (lag['p50'], lag['p99'], lag['max']),
+            '',
+            'Delivery latency:',
+            results['latency'].chart(),
+        ]
+        self.stdout.write('\n'.join(lines))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from studybuddy.catalog import iter_catalog, import_catalog
+
+
+class Command(BaseCommand):
+    help = 'Load courses and departments from a catalog JSON dump (the luthers-list API format)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='JSON file with a list of course sections')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='how many rows to write per statement')
+        parser.add_argument('--delete-missing', action='store_true',
+                            help='delete courses that are no longer in the catalog, with their posts, rooms and '
+                                 'enrollments, and merge duplicate sections, only use this with a full catalog')
+
+    def handle(self, *args, **options):
+        with open(options['path'], encoding='utf-8') as file:
+            counts = import_catalog(iter_catalog(file), options['batch_size'], options['delete_missing'])
+        self.stdout.write('Created %d, updated %d, deleted %d and merged %d duplicate courses in %d departments'
+                          % (counts['created'], counts['updated'], counts['deleted'], counts['merged'],
+                             counts['departments']))
@@ -0,0 +1,32 @@
+import json
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from studybuddy.profiling import aggregate
+
+
+class Command(BaseCommand):
+    help = 'Summarise the profiled requests in PROFILING_DIR/requests.jsonl by view'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', help='requests.jsonl to read, PROFILING_DIR/requests.jsonl by default')
+        parser.add_argument('--output', help='also write the summary to this JSON file')
+
+    def handle(self, *args, **options):
+        path = Path(options['path'] or Path(settings.PROFILING_DIR) / 'requests.jsonl')
+        if not path.exists():
+            raise CommandError('No profiled requests in %s' % path)
+
+        with open(path, encoding='utf-8') as file:
+            views = aggregate(line for line in file if line.strip())
+
+        if options['output']:
+            Path(options['output']).write_text(json.dumps(views, indent=2), encoding='utf-8')
+
+        self.stdout.write('%-36s %8s %9s %9s %8s %8s %10s' % ('view', 'requests', 'avg ms', 'max ms', 'queries',
+                                                             'max', 'duplicates'))
+        for name, view in views.items():
+            self.stdout.write('%-36s %8d %9.1f %9.1f %8.1f %8d %10.1f' % (
+                name, view['requests'], view['avg_ms'], view['max_ms'], view['avg_queries'], view['max_queries'],
+                view['avg_duplicate_queries']))
@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from studybuddy.sweeper import sweep, sweep_forever
+
+
+class Command(BaseCommand):
+    help = 'Delete posts whose end date has passed and study sessions that are over'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int,
+                            help='how many rows to delete per statement, SWEEP_BATCH_SIZE by default')
+        parser.add_argument('--loop', action='store_true',
+                            help='keep sweeping every SWEEP_INTERVAL seconds, run this in only one process')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size'] or settings.SWEEP_BATCH_SIZE
+        if options['loop']:
+            self.stdout.write('Sweeping every %d seconds' % settings.SWEEP_INTERVAL)
+            sweep_forever(batch_size=batch_size)
+            return
+        deleted = sweep(batch_size)
+        self.stdout.write('Deleted %d expired posts and %d past study sessions'
+                          % (deleted['posts'], deleted['sessions']))
@@ -0,0 +1,219 @@
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+from django.conf import settings
+from django.db import connection
+from studybuddy.models import User, EnrolledClass
+from studybuddy.friend_graph import friend_graph
+
+logger = logging.getLogger(__name__)
+
+# how much each thing two students have in common counts towards matching them
+SECTION_WEIGHT = 8
+CATALOG_WEIGHT = 4
+SUBJECT_WEIGHT = 1
+MUTUAL_FRIEND_WEIGHT = 2
+MAJOR_WEIGHT = 1
+
+
+class MatchIndex:
+    """
+    Which students are enrolled in what and their majors, kept in memory to suggest study buddies
+
+    This is a sparse student x course matrix stored by column: for each section, catalog number and
+    subject there is the set of students enrolled in it. Scoring a student adds up the columns for
+    their own courses, so it only touches students who share something with them, and it never
+    queries the database. Friendships come from the friend graph (studybuddy.friend_graph).
+
+    The index is loaded once, kept up to date by the signals in studybuddy.signals, and reloaded in
+    the background every max_age seconds to pick up changes made by other processes.
+    """
+
+    def __init__(self, max_age=300):
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self.loaded_at = None
+        self.reloading = False
+
+    def load(self):
+        """
+        read every enrollment and major from the database (two queries, friendships are loaded by
+        the friend graph)
+        """
+        courses_by_student = defaultdict(set)
+        course_keys = {}
+        students_by_section = defaultdict(set)
+        students_by_catalog = defaultdict(Counter)
+        students_by_subject = defaultdict(Counter)
+
+        enrollments = EnrolledClass.objects.values_list('student_id', 'course_id', 'course__subject',
+                                                        'course__catalog_number')
+        for email, course_id, subject, catalog_number in enrollments.iterator():
+            if course_id in courses_by_student[email]:
+                continue
+            courses_by_student[email].add(course_id)
+            course_keys[course_id] = (subject, catalog_number)
+            students_by_section[course_id].add(email)
+            students_by_catalog[subject, catalog_number][email] += 1
+            students_by_subject[subject][email] += 1
+
+        majors = {email: major for email, major in User.objects.exclude(major='').values_list('email', 'major')}
+
+        with self.lock:
+            self.courses_by_student = courses_by_student
+            self.course_keys = course_keys
+            self.students_by_section = students_by_section
+            self.students_by_catalog = students_by_catalog
+            self.students_by_subject = students_by_subject
+            self.majors = majors
+            self.loaded_at = time.monotonic()
+
+    def reset(self):
+        """
+        forget everything, the index is loaded again the next time it is used
+        """
+        with self.lock:
+            self.loaded_at = None
+
+    @property
+    def loaded(self):
+        return self.loaded_at is not None
+
+    def ensure_loaded(self):
+        """
+        load the index the first time it is used, and after that start reloading it once it is older
+        than max_age without making the request wait
+        """
+        if self.loaded_at is None:
+            self.load()
+        elif time.monotonic() - self.loaded_at > self.max_age:
+            with self.lock:
+                if self.reloading:
+                    return
+                self.reloading = True
+            threading.Thread(target=self.reload, name='match-index-reload', daemon=True).start()
+
+    def reload(self):
+        # requests keep using the index that is already loaded until this one replaces it
+        try:
+            self.load()
+        except Exception:
+            logger.exception('Reloading the study buddy match index failed')
+        finally:
+            self.reloading = False
+            connection.close()
+
+    def enroll(self, email, course_id, subject, catalog_number):
+        """
+        a student enrolled in a course, does nothing until the index has been loaded
+        """
+        with self.lock:
+            if not self.loaded or course_id in self.courses_by_student[email]:
+                return
+            self.courses_by_student[email].add(course_id)
+            self.course_keys[course_id] = (subject, catalog_number)
+            self.students_by_section[course_id].add(email)
+            self.students_by_catalog[subject, catalog_number][email] += 1
+            self.students_by_subject[subject][email] += 1
+
+    def unenroll(self, email, course_id):
+        """
+        a student left a course
+        """
+        with self.lock:
+            if not self.loaded or course_id not in self.courses_by_student[email]:
+                return
+            subject, catalog_number = self.course_keys[course_id]
+            self.courses_by_student[email].discard(course_id)
+            self.students_by_section[course_id].discard(email)
+            uncount(self.students_by_catalog[subject, catalog_number], email)
+            uncount(self.students_by_subject[subject], email)
+
+    def set_major(self, email, major):
+        with self.lock:
+            if not self.loaded:
+                return
+            if major:
+                self.majors[email] = major
+            else:
+                self.majors.pop(email, None)
+
+    def scores(self, email):
+        """
+        how well every other student who shares something with this one matches them, leaving out
+        students who are already their friends
+        """
+        self.ensure_loaded()
+        friends = friend_graph.friends(email)
+        mutual_friends = friend_graph.friends_of_friends(email)
+
+        with self.lock:
+            courses = self.courses_by_student.get(email, ())
+            catalogs = {self.course_keys[course_id] for course_id in courses}
+            subjects = {subject for subject, catalog_number in catalogs}
+
+            # a student in the same section is also in the same catalog number and subject, so the
+            # weights add up and closer matches always rank higher
+            scores = Counter()
+            for course_id in courses:
+                scores.update(dict.fromkeys(self.students_by_section[course_id], SECTION_WEIGHT))
+            for catalog in catalogs:
+                scores.update(dict.fromkeys(self.students_by_catalog[catalog], CATALOG_WEIGHT))
+            for subject in subjects:
+                scores.update(dict.fromkeys(self.students_by_subject[subject], SUBJECT_WEIGHT))
+            scores.update({candidate: mutual * MUTUAL_FRIEND_WEIGHT for candidate, mutual in mutual_friends.items()})
+
+            major = self.majors.get(email)
+            if major:
+                for candidate in scores:
+                    if self.majors.get(candidate) == major:
+                        scores[candidate] += MAJOR_WEIGHT
+
+        scores.pop(email, None)
+        for friend in friends:
+            scores.pop(friend, None)
+        return scores
+
+    def reasons(self, email, candidate):
+        """
+        what two students have in common, to show next to a suggestion
+        """
+        mutual_friends = friend_graph.mutual_counts(email, [candidate])[candidate]
+        with self.lock:
+            courses = self.courses_by_student.get(email, set())
+            candidate_courses = self.courses_by_student.get(candidate, set())
+            catalogs = {self.course_keys[course_id] for course_id in candidate_courses}
+            return {
+                'shared_sections': len(courses & candidate_courses),
+                'shared_courses': len({self.course_keys[course_id] for course_id in courses} & catalogs),
+                'mutual_friends': mutual_friends,
+                'same_major': bool(self.majors.get(email)) and self.majors.get(email) == self.majors.get(candidate),
+            }
+
+
+def uncount(counter, email):
+    # take away one of the student's sections, dropping them once they have none left
+    counter[email] -= 1
+    if counter[email] <= 0:
+        del counter[email]
+
+
+match_index = MatchIndex(getattr(settings, 'MATCH_INDEX_MAX_AGE', 300))
+
+
+def suggest_buddies(student, limit=5):
+    """
+    the students who best match this one, best first, each as a dict with the User and what they have in common
+    """
+    top = match_index.scores(student.email).most_common(limit)
+    users = User.objects.in_bulk([email for email, score in top])
+
+    suggestions = []
+    for email, score in top:
+        if email in users:
+            suggestion = match_index.reasons(student.email, email)
+            suggestion['user'] = users[email]
+            suggestion['score'] = score
+            suggestions.append(suggestion)
+    return suggestions
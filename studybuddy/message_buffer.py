@@ -0,0 +1,113 @@
+import asyncio
+import atexit
+import logging
+import threading
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db import DatabaseError
+
+from .models import Message, Room, User
+
+logger = logging.getLogger(__name__)
+
+
+class MessageBuffer:
+    """
+    Write-behind buffer for chat messages.
+
+    The chat consumer broadcasts a message right away and only queues it here to be saved.
+    Queued messages are written with one bulk_create when max_size of them are waiting or when
+    flush_interval seconds have passed since the first one was queued, whichever happens first.
+    """
+
+    def __init__(self, max_size=50, flush_interval=0.5):
+        self.max_size = max_size
+        self.flush_interval = flush_interval
+        self._pending = []
+        self._lock = threading.Lock()
+        self._timer = None
+        # the loop the timer runs on, Task.get_loop() needs Python 3.8
+        self._timer_loop = None
+
+    def __len__(self):
+        return len(self._pending)
+
+    def add(self, email, room_pk, content):
+        """
+        queue a message to be saved
+        return True: the buffer is full and should be flushed now
+               False: the message can wait for the timer
+        """
+        with self._lock:
+            self._pending.append(Message(user_id=email, room_id=room_pk, content=content))
+            return len(self._pending) >= self.max_size
+
+    def flush(self):
+        """
+        save every queued message to the database and return how many were saved
+        """
+        with self._lock:
+            pending, self._pending = self._pending, []
+
+        if not pending:
+            return 0
+
+        try:
+            # the sender or the room may have been removed while the message was waiting
+            user_pks = set(User.objects.filter(email__in={message.user_id for message in pending})
+                           .values_list('email', flat=True))
+            room_pks = set(Room.objects.filter(pk__in={message.room_id for message in pending})
+                           .values_list('pk', flat=True))
+            messages = [message for message in pending
+                        if message.user_id in user_pks and message.room_id in room_pks]
+
+            Message.objects.bulk_create(messages)
+        except DatabaseError:
+            # put them back in front of anything queued since, so the next flush tries them again in order
+            with self._lock:
+                self._pending[:0] = pending
+            logger.exception('Saving %d chat messages failed, they will be tried again', len(pending))
+            return 0
+        return len(messages)
+
+    async def aflush(self):
+        return await database_sync_to_async(self.flush)()
+
+    async def enqueue(self, email, room_pk, content):
+        """
+        queue a message from the event loop, flushing right away if the buffer is full or
+        starting the flush timer if this is the first message waiting
+        """
+        if self.add(email, room_pk, content):
+            await self.aflush()
+        elif not self._timer_running():
+            self._start_timer()
+
+    def _start_timer(self):
+        self._timer = asyncio.ensure_future(self._flush_later())
+        self._timer_loop = asyncio.get_running_loop()
+
+    def _timer_running(self):
+        # a timer left over from an event loop that has since stopped will never fire
+        return (self._timer is not None and not self._timer.done()
+                and self._timer_loop is asyncio.get_running_loop())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.flush_interval)
+        # messages queued while this flush runs start a timer of their own
+        self._timer = None
+        try:
+            await self.aflush()
+        except Exception:
+            logger.exception('Saving queued chat messages failed')
+        # anything that couldn't be saved is tried again after another interval
+        if self._pending and not self._timer_running():
+            self._start_timer()
+
+
+message_buffer = MessageBuffer(max_size=getattr(settings, 'CHAT_MESSAGE_BUFFER_SIZE', 50),
+                               flush_interval=getattr(settings, 'CHAT_MESSAGE_FLUSH_INTERVAL', 0.5))
+
+# make sure nothing that is still queued is lost when the server shuts down
+atexit.register(message_buffer.flush)
@@ -0,0 +1,293 @@
+"""
+Counters, gauges and histograms for the views and the chat, served in the Prometheus text format
+at /metrics.
+
+Metrics are kept in memory in each process. When daphne runs as several processes, set
+METRICS_DIR to a directory they share: every process writes its metrics there every
+METRICS_WRITE_INTERVAL seconds, and /metrics adds up all of them, so it doesn't matter which
+process is scraped. Counters and histograms from processes that have exited are kept, gauges are
+dropped with their process. Empty the directory when deploying.
+"""
+import functools
+import json
+import math
+import os
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connection
+
+# the default histogram buckets, in seconds, and for counts of things like queries
+TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+
+class Registry:
+    """
+    every metric in the process, and writing them to METRICS_DIR for the other processes
+    """
+
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+        # None until the first update, then the writer thread, or False when there is no METRICS_DIR
+        self.writer = None
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def snapshot(self):
+        """
+        every metric's values as plain data that can be written as JSON and merged
+        """
+        with self.lock:
+            return {name: {'kind': metric.kind, 'help': metric.help, 'labels': list(metric.label_names),
+                           'buckets': list(getattr(metric, 'buckets', ())),
+                           'values': [[list(key), value] for key, value in metric.values.items()]}
+                    for name, metric in self.metrics.items()}
+
+    def changed(self):
+        # called on every update, the first one decides whether this process writes to METRICS_DIR so
+        # the rest don't look at the settings again
+        if self.writer is None:
+            with self.lock:
+                if self.writer is None:
+                    self.writer = False
+                    if getattr(settings, 'METRICS_DIR', ''):
+                        self.writer = threading.Thread(target=self.write_forever, daemon=True,
+                                                       name='metrics-writer')
+                        self.writer.start()
+
+    def write_forever(self):
+        while True:
+            time.sleep(getattr(settings, 'METRICS_WRITE_INTERVAL', 5))
+            self.write()
+
+    def write(self):
+        """
+        save this process's metrics to METRICS_DIR, replacing the file in one step so a scrape never
+        reads half of it
+        """
+        directory = Path(settings.METRICS_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / ('metrics-%d.json' % os.getpid())
+        temporary = path.with_suffix('.tmp')
+        temporary.write_text(json.dumps(self.snapshot()), encoding='utf-8')
+        os.replace(temporary, path)
+
+
+registry = Registry()
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        # label values -> value
+        self.values = {}
+        registry.register(self)
+
+    def key(self, labels):
+        return tuple(str(labels[name]) for name in self.label_names)
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with registry.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+        registry.changed()
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with registry.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+        registry.changed()
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=TIME_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        with registry.lock:
+            # [count in each bucket and one for above the last, sum, count]
+            counts, total, count = self.values.get(key) or [[0] * (len(self.buckets) + 1), 0, 0]
+            counts[next((i for i, edge in enumerate(self.buckets) if value <= edge), len(self.buckets))] += 1
+            self.values[key] = [counts, total + value, count + 1]
+        registry.changed()
+
+
+HTTP_REQUESTS = Counter('studybuddy_http_requests_total', 'Requests handled by each view',
+                        ('view', 'method', 'status'))
+HTTP_DURATION = Histogram('studybuddy_http_request_duration_seconds',
+                          'Time spent in each view, including rendering its template', ('view',))
+HTTP_QUERIES = Histogram('studybuddy_http_db_queries', 'Database queries made by each request to a view',
+                         ('view',), COUNT_BUCKETS)
+
+WEBSOCKET_CONNECTS = Counter('studybuddy_websocket_connects_total', 'Chat connections accepted or rejected',
+                             ('result',))
+WEBSOCKET_OPEN = Gauge('studybuddy_websocket_connections', 'Chat connections open right now')
+CHAT_RECEIVED = Counter('studybuddy_chat_messages_received_total', 'Chat messages sent by clients')
+CHAT_RECEIVE_DURATION = Histogram('studybuddy_chat_receive_seconds',
+                                  'Time to queue a chat message for saving and send it to its room')
+CHAT_DELIVERED = Counter('studybuddy_chat_messages_delivered_total', 'Chat messages sent out to clients')
+CHAT_FANOUT = Histogram('studybuddy_chat_fanout', 'How many connections each chat message was sent to',
+                        buckets=COUNT_BUCKETS)
+
+
+def timed_view(name, view):
+    """
+    view, counting its requests and measuring its time and queries under name
+    """
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        queries = [0]
+
+        def count(execute, sql, params, many, context):
+            queries[0] += 1
+            return execute(sql, params, many, context)
+
+        status = 500
+        start = time.perf_counter()
+        try:
+            with connection.execute_wrapper(count):
+                response = view(request, *args, **kwargs)
+            status = response.status_code
+            return response
+        finally:
+            HTTP_REQUESTS.inc(view=name, method=request.method, status=status)
+            HTTP_DURATION.observe(time.perf_counter() - start, view=name)
+            HTTP_QUERIES.observe(queries[0], view=name)
+
+    return wrapper
+
+
+def instrument(urlpatterns):
+    """
+    measure every view in urlpatterns, labelled with its url name
+    """
+    for pattern in urlpatterns:
+        pattern.callback = timed_view(pattern.name or pattern.callback.__name__, pattern.callback)
+    return urlpatterns
+
+
+def channel_layer_depth():
+    """
+    how many messages are waiting in the channel layer, or None if the layer can't say
+    """
+    from channels.layers import get_channel_layer
+
+    layer = get_channel_layer()
+    if hasattr(layer, 'pending_count'):
+        return layer.pending_count()
+    if hasattr(layer, 'channels'):
+        # the in memory layer keeps a queue of (expiry, message) per channel
+        return sum(queue.qsize() for queue in layer.channels.values())
+    return None
+
+
+def process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def collect():
+    """
+    the metrics to serve: this process's, or with METRICS_DIR every process's added together
+    """
+    if not getattr(settings, 'METRICS_DIR', ''):
+        return registry.snapshot()
+
+    registry.write()
+    snapshots = []
+    for path in Path(settings.METRICS_DIR).glob('metrics-*.json'):
+        try:
+            snapshot = json.loads(path.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            continue
+        if not process_alive(int(path.stem.split('-')[1])):
+            snapshot = {name: metric for name, metric in snapshot.items() if metric['kind'] != 'gauge'}
+        snapshots.append(snapshot)
+    return merge(snapshots)
+
+
+def merge(snapshots):
+    """
+    add up snapshots from several processes, counts and sums are added bucket by bucket
+    """
+    merged = {}
+    for snapshot in snapshots:
+        for name, metric in snapshot.items():
+            values = merged.setdefault(name, dict(metric, values={}))['values']
+            for labels, value in metric['values']:
+                key = tuple(labels)
+                if metric['kind'] == 'histogram':
+                    counts, total, count = values.get(key) or [[0] * len(value[0]), 0, 0]
+                    values[key] = [[a + b for a, b in zip(counts, value[0])], total + value[1], count + value[2]]
+                else:
+                    values[key] = values.get(key, 0) + value
+    for metric in merged.values():
+        metric['values'] = [[list(key), value] for key, value in metric['values'].items()]
+    return merged
+
+
+def render(snapshot):
+    """
+    the metrics in the Prometheus text exposition format
+    """
+    lines = []
+    for name, metric in sorted(snapshot.items()):
+        lines.append('# HELP %s %s' % (name, metric['help']))
+        lines.append('# TYPE %s %s' % (name, metric['kind']))
+        for labels, value in sorted(metric['values'], key=lambda item: item[0]):
+            pairs = list(zip(metric['labels'], labels))
+            if metric['kind'] != 'histogram':
+                lines.append('%s%s %s' % (name, label_text(pairs), number(value)))
+                continue
+            counts, total, count = value
+            cumulative = 0
+            for edge, bucket in zip(metric['buckets'] + [math.inf], counts):
+                cumulative += bucket
+                lines.append('%s_bucket%s %s' % (name, label_text(pairs + [('le', number(edge))]), cumulative))
+            lines.append('%s_sum%s %s' % (name, label_text(pairs), number(total)))
+            lines.append('%s_count%s %s' % (name, label_text(pairs), count))
+    return '\n'.join(lines) + '\n'
+
+
+def label_text(pairs):
+    if not pairs:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (name, str(value).replace('\\', r'\\').replace('"', r'\"')
+                                          .replace('\n', r'\n'))
+                             for name, value in pairs)
+
+
+def number(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
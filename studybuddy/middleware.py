@@ -0,0 +1,41 @@
+from django.utils.functional import SimpleLazyObject
+from studybuddy.models import User
+
+
+def get_student(request):
+    """
+    return the studybuddy User for whoever is logged in, or None if they are anonymous or haven't
+    made an account yet
+
+    The profile is looked up the first time it is needed and then kept on the request, so the
+    views, templates and context processors can all ask for it without querying again.
+    """
+    if not hasattr(request, '_cached_student'):
+        if request.user.is_anonymous:
+            request._cached_student = None
+        else:
+            request._cached_student = User.objects.filter(email=request.user.email).first()
+    return request._cached_student
+
+
+def get_student_name(request):
+    """
+    the name shown in the navigation bar: the student's name, or their login if they haven't set one
+    """
+    student = get_student(request)
+    if student is None or student.name == "":
+        return request.user
+    return student.name
+
+
+class CurrentStudentMiddleware:
+    """
+    Adds request.studybuddy_user, the logged in user's studybuddy profile, loaded on first use
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.studybuddy_user = SimpleLazyObject(lambda: get_student(request))
+        return self.get_response(request)
@@ -0,0 +1,15 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("studybuddy", "0008_alter_studysession_end_alter_studysession_start"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="message",
+            index=models.Index(fields=["room", "date_added", "id"], name="message_room_date_idx"),
+        ),
+    ]
@@ -0,0 +1,56 @@
+from django.db import migrations, models
+from django.db.models import Min
+
+
+def remove_duplicates(apps, schema_editor):
+    """
+    keep the oldest enrollment and friend request for each pair so the unique constraints can be added
+    """
+    for model_name, fields in (("EnrolledClass", ("student", "course")),
+                               ("Friend_Request", ("from_user", "to_user"))):
+        model = apps.get_model("studybuddy", model_name)
+        keep = model.objects.values(*fields).annotate(keep=Min("pk")).values_list("keep", flat=True)
+        model.objects.exclude(pk__in=list(keep)).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("studybuddy", "0009_message_room_date_index"),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="course",
+            index=models.Index(fields=["course_number"], name="course_number_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="course",
+            index=models.Index(fields=["subject", "catalog_number"], name="course_catalog_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="post",
+            index=models.Index(fields=["endDate"], name="post_end_date_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="post",
+            index=models.Index(fields=["course", "post_type"], name="post_course_type_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="studysession",
+            index=models.Index(fields=["date", "end"], name="session_date_end_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="studysession",
+            index=models.Index(fields=["accepted"], name="session_accepted_idx"),
+        ),
+        migrations.AddConstraint(
+            model_name="enrolledclass",
+            constraint=models.UniqueConstraint(fields=("student", "course"), name="unique_enrollment"),
+        ),
+        migrations.AddConstraint(
+            model_name="friend_request",
+            constraint=models.UniqueConstraint(fields=("from_user", "to_user"), name="unique_friend_request"),
+        ),
+    ]
@@ -0,0 +1,40 @@
+from django.db import migrations
+from django.db.utils import OperationalError
+
+SEARCH_TABLE = "studybuddy_course_search"
+
+
+def create_search_index(apps, schema_editor):
+    """
+    full text index over courses for search, only on SQLite builds with FTS5, other databases fall back to LIKE
+    """
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    try:
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE %s USING fts5(subject, catalog_number, description, instructor, "
+            "tokenize = 'unicode61')" % SEARCH_TABLE
+        )
+    except OperationalError:
+        # this SQLite was built without FTS5
+        return
+    schema_editor.execute(
+        "INSERT INTO %s (rowid, subject, catalog_number, description, instructor) "
+        "SELECT id, subject, catalog_number, description, instructor FROM studybuddy_course" % SEARCH_TABLE
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "sqlite":
+        schema_editor.execute("DROP TABLE IF EXISTS %s" % SEARCH_TABLE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("studybuddy", "0010_lookup_indexes_and_unique_constraints"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
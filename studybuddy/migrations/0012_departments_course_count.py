@@ -0,0 +1,36 @@
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def build_departments(apps, schema_editor):
+    """
+    departments used to be loaded separately from courses, list the subjects courses actually have instead
+    """
+    Course = apps.get_model("studybuddy", "Course")
+    Departments = apps.get_model("studybuddy", "Departments")
+    counts = Course.objects.order_by().values_list("subject").annotate(Count("pk"))
+    Departments.objects.all().delete()
+    Departments.objects.bulk_create([Departments(dept=dept, course_count=count) for dept, count in sorted(counts)])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("studybuddy", "0011_course_search_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="departments",
+            name="course_count",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="departments",
+            name="updated",
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.RunPython(build_departments, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("studybuddy", "0012_departments_course_count"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RoomReadState",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("last_read", models.DateTimeField()),
+                ("room", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="read_states",
+                                           to="studybuddy.room")),
+                ("user", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="read_states",
+                                           to="studybuddy.user")),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="roomreadstate",
+            constraint=models.UniqueConstraint(fields=("room", "user"), name="unique_room_read_state"),
+        ),
+    ]
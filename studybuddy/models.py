@@ -28,12 +28,23 @@ class Friend_Request(models.Model):
     to_user = models.ForeignKey(User, related_name='to_user', on_delete=models.CASCADE)
     declined = models.TextField('no')
 
+    class Meta:
+        # only one pending request between two users, so send_friend_request's get_or_create can't race
+        constraints = [
+            models.UniqueConstraint(fields=['from_user', 'to_user'], name='unique_friend_request'),
+        ]
+
     def __str__(self):
         return self.from_user.email
 
 
 class Departments(models.Model):
+    """
+    the department directory, one row per Course.subject, kept up to date by catalog.refresh_departments
+    """
     dept = models.CharField(max_length=4)
+    course_count = models.IntegerField(default=0)
+    updated = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.dept
@@ -49,6 +60,18 @@ class Course(models.Model):
 
     class Meta:
         unique_together = ["subject", "catalog_number", "instructor", "section", "course_number", "description"]
+        # course pages look courses up by course_number, and sibling sections by subject and catalog_number
+        indexes = [
+            models.Index(fields=['course_number'], name='course_number_idx'),
+            models.Index(fields=['subject', 'catalog_number'], name='course_catalog_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        course = super().from_db(db, field_names, values)
+        # remembered so saving can tell whether the course changed department, see signals.course_saved
+        course._loaded_subject = course.__dict__.get('subject')
+        return course
 
     def class_str(self):
         course_level = self.subject + str(self.catalog_number)
@@ -84,6 +107,13 @@ class Post(models.Model):
     description = models.TextField(default="No description was provided by the author of this post")
     post_type = models.TextField(default="section")
 
+    class Meta:
+        # the feeds hide expired posts, and the course feed looks for course wide posts
+        indexes = [
+            models.Index(fields=['endDate'], name='post_end_date_idx'),
+            models.Index(fields=['course', 'post_type'], name='post_course_type_idx'),
+        ]
+
     def past_end_date(self):
         now = timezone.now()
         # returns true if endDate has passed
@@ -105,6 +135,12 @@ class EnrolledClass(models.Model):
     student = models.ForeignKey(User, on_delete=models.CASCADE)
     course = models.ForeignKey(Course, on_delete=models.CASCADE)
 
+    class Meta:
+        # a student is enrolled in a course at most once, this also indexes the enrollment lookups
+        constraints = [
+            models.UniqueConstraint(fields=['student', 'course'], name='unique_enrollment'),
+        ]
+
     def __str__(self):
         return self.course.subject + " " + self.course.course_number
 
@@ -130,6 +166,44 @@ class Message(models.Model):
 
     class Meta:
         ordering = ('date_added',)
+        # chat history is read newest first a page at a time, see room_views.get_message_page
+        indexes = [
+            models.Index(fields=['room', 'date_added', 'id'], name='message_room_date_idx'),
+        ]
+
+
+class RoomReadState(models.Model):
+    """
+    how far a user has read in a room, messages added after last_read count as unread on the rooms page
+    """
+    user = models.ForeignKey(User, related_name='read_states', on_delete=models.CASCADE)
+    room = models.ForeignKey(Room, related_name='read_states', on_delete=models.CASCADE)
+    last_read = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['room', 'user'], name='unique_room_read_state'),
+        ]
+
+    @classmethod
+    def mark_read(cls, user, room, latest_message_at=None):
+        """
+        everything in the room so far has been read by the user
+
+        Nothing is written unless a message was added since the user last read the room, so opening a
+        room that hasn't changed only reads. Pass latest_message_at when the newest message is already
+        loaded to save looking it up.
+        """
+        if latest_message_at is None:
+            latest_message_at = room.messages.aggregate(models.Max('date_added'))['date_added__max']
+        if latest_message_at is None:
+            return
+        last_read = cls.objects.filter(user=user, room=room).values_list('last_read', flat=True).first()
+        if last_read is None or last_read < latest_message_at:
+            cls.objects.update_or_create(user=user, room=room, defaults={'last_read': timezone.now()})
+
+    def __str__(self):
+        return self.user.email
 
 
 class StudySession(models.Model):
@@ -150,6 +224,13 @@ class StudySession(models.Model):
     end = models.TimeField(default=(timezone.now() + datetime.timedelta(hours=1)).strftime("%H-%M"))
     accepted = models.CharField(max_length=4, default="?")
 
+    class Meta:
+        # the schedule pages filter on acceptance and hide sessions that have already ended
+        indexes = [
+            models.Index(fields=['date', 'end'], name='session_date_end_idx'),
+            models.Index(fields=['accepted'], name='session_accepted_idx'),
+        ]
+
     def __str__(self):
         if type(self.start) != str:
             time_frame = "Time Frame: " + self.start.strftime("%H:%M") + " to " + self.end.strftime("%H:%M")
@@ -0,0 +1,269 @@
+"""
+Opt-in request profiling, for finding out why a page is slow in production.
+
+A profiled request records every SQL statement (grouped by statement and by the line in
+studybuddy/views that ran it, so N+1 queries stand out), how long each template took to render,
+and a sampled CPU profile written as a collapsed stack file for flamegraph.pl or speedscope.
+Requests are profiled when they send the PROFILING_HEADER with the PROFILING_TOKEN, or at random
+at PROFILING_SAMPLE_RATE. With neither set the middleware removes itself at startup.
+"""
+import contextvars
+import hmac
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.template.base import Template
+from django.utils import timezone
+
+# the profile of the request being handled, if it is being profiled
+current_profile = contextvars.ContextVar('current_profile', default=None)
+
+STUDYBUDDY_DIR = os.path.dirname(os.path.abspath(__file__))
+VIEWS_DIR = os.path.join(STUDYBUDDY_DIR, 'views') + os.sep
+
+
+class RequestProfile:
+    """
+    what one request spent its time on
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.started = time.perf_counter()
+        self.seconds = 0.0
+        # (sql, call site) -> [count, seconds]
+        self.queries = defaultdict(lambda: [0, 0.0])
+        # template name -> [renders, seconds], times include templates the template includes
+        self.templates = defaultdict(lambda: [0, 0.0])
+        self.stacks = Counter()
+
+    def execute(self, execute, sql, params, many, context):
+        """
+        connection.execute_wrapper hook, times the statement and remembers where it came from
+        """
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            query = self.queries[sql, call_site(sys._getframe(1))]
+            query[0] += 1
+            query[1] += time.perf_counter() - start
+
+    def sql_seconds(self):
+        return sum(seconds for count, seconds in self.queries.values())
+
+    def duplicates(self):
+        """
+        the statements run more than once from the same place, most repeated first
+        """
+        return sorted(((sql, site, count, seconds) for (sql, site), (count, seconds) in self.queries.items()
+                       if count > 1), key=lambda duplicate: -duplicate[2])
+
+    def summary(self, view_name, status):
+        return {
+            'time': timezone.now().isoformat(),
+            'path': self.path,
+            'view': view_name,
+            'status': status,
+            'ms': self.seconds * 1000,
+            'queries': sum(count for count, seconds in self.queries.values()),
+            'sql_ms': self.sql_seconds() * 1000,
+            'duplicate_queries': sum(count - 1 for sql, site, count, seconds in self.duplicates()),
+            'templates': {name: {'renders': renders, 'ms': seconds * 1000}
+                          for name, (renders, seconds) in self.templates.items()},
+            'sql': [{'sql': sql, 'site': site, 'count': count, 'ms': seconds * 1000}
+                    for (sql, site), (count, seconds) in sorted(self.queries.items(), key=lambda query: -query[1][1])],
+        }
+
+    def collapsed_stacks(self):
+        """
+        the CPU samples as "frame;frame;frame count" lines, outermost frame first
+        """
+        return ''.join('%s %d\n' % (stack, count) for stack, count in sorted(self.stacks.items()))
+
+
+def call_site(frame):
+    """
+    the innermost line in studybuddy/views on the stack, or in the rest of studybuddy if no view is
+    on the stack, as "file:line function"
+    """
+    fallback = None
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(VIEWS_DIR):
+            return frame_name(frame)
+        if fallback is None and filename.startswith(STUDYBUDDY_DIR) and filename != __file__:
+            fallback = frame_name(frame)
+        frame = frame.f_back
+    return fallback or '<django>'
+
+
+def frame_name(frame):
+    return '%s:%d %s' % (os.path.relpath(frame.f_code.co_filename, STUDYBUDDY_DIR), frame.f_lineno,
+                         frame.f_code.co_name)
+
+
+def collapse(frame):
+    names = []
+    while frame is not None:
+        names.append('%s:%s' % (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class StackSampler(threading.Thread):
+    """
+    samples what a thread is running every interval seconds until stopped
+    """
+
+    def __init__(self, thread_id, stacks, interval):
+        super().__init__(daemon=True, name='request-profiler')
+        self.thread_id = thread_id
+        self.stacks = stacks
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[collapse(frame)] += 1
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+_original_render = Template.render
+
+
+def profiled_render(self, context):
+    """
+    Template.render, timed when the request is being profiled
+    """
+    profile = current_profile.get()
+    if profile is None:
+        return _original_render(self, context)
+
+    start = time.perf_counter()
+    try:
+        return _original_render(self, context)
+    finally:
+        template = profile.templates[self.origin.template_name or self.name or '<string>']
+        template[0] += 1
+        template[1] += time.perf_counter() - start
+
+
+class ProfilingMiddleware:
+    """
+    Profiles requests that ask for it with the PROFILING_HEADER and PROFILING_TOKEN, and a random
+    PROFILING_SAMPLE_RATE share of all requests.
+
+    Each profiled request adds a line to requests.jsonl in PROFILING_DIR (see the profile_report
+    command). Requests that asked for a profile also get a <id>.json file with every statement and
+    a <id>.collapsed CPU profile, and the id comes back in the X-Profile-Id response header. Every
+    profiled response gets a Server-Timing header that browser dev tools can show.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'PROFILING_SAMPLE_RATE', 0)
+        self.token = getattr(settings, 'PROFILING_TOKEN', '')
+        self.header = 'HTTP_' + getattr(settings, 'PROFILING_HEADER', 'X-Profile').upper().replace('-', '_')
+        self.interval = getattr(settings, 'PROFILING_SAMPLE_INTERVAL', 0.005)
+        self.directory = Path(getattr(settings, 'PROFILING_DIR', settings.BASE_DIR / 'profiles'))
+        self.lock = threading.Lock()
+
+        if not self.sample_rate and not self.token:
+            # nothing can turn profiling on, so don't cost anything per request
+            raise MiddlewareNotUsed
+        Template.render = profiled_render
+
+    def requested(self, request):
+        # compared as bytes, compare_digest raises TypeError for strings that aren't ASCII
+        sent = request.META.get(self.header, '').encode('utf-8', 'surrogatepass')
+        return bool(self.token) and hmac.compare_digest(sent, self.token.encode('utf-8'))
+
+    def __call__(self, request):
+        requested = self.requested(request)
+        if not requested and not (self.sample_rate and random.random() < self.sample_rate):
+            return self.get_response(request)
+
+        profile = RequestProfile(request.path)
+        sampler = StackSampler(threading.get_ident(), profile.stacks, self.interval)
+        token = current_profile.set(profile)
+        sampler.start()
+        try:
+            with connection.execute_wrapper(profile.execute):
+                response = self.get_response(request)
+        finally:
+            sampler.stop()
+            current_profile.reset(token)
+            profile.seconds = time.perf_counter() - profile.started
+
+        match = request.resolver_match
+        summary = profile.summary(match.view_name if match else None, response.status_code)
+        response['Server-Timing'] = 'total;dur=%.1f, sql;dur=%.1f;desc="%d queries"' % (
+            summary['ms'], summary['sql_ms'], summary['queries'])
+        if requested:
+            response['X-Profile-Id'] = self.save(profile, summary)
+        self.record(summary)
+        return response
+
+    def record(self, summary):
+        """
+        add the request to requests.jsonl, without the statements so the file stays small
+        """
+        line = json.dumps({key: value for key, value in summary.items() if key != 'sql'}) + '\n'
+        with self.lock:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            with open(self.directory / 'requests.jsonl', 'a', encoding='utf-8') as file:
+                file.write(line)
+
+    def save(self, profile, summary):
+        """
+        write the full profile and the CPU samples, and return the name they were saved under
+        """
+        profile_id = '%s-%d-%s' % (timezone.now().strftime('%Y%m%d%H%M%S%f'), os.getpid(),
+                                   (summary['view'] or 'unresolved').replace(':', '-'))
+        self.directory.mkdir(parents=True, exist_ok=True)
+        (self.directory / (profile_id + '.json')).write_text(json.dumps(summary, indent=2), encoding='utf-8')
+        (self.directory / (profile_id + '.collapsed')).write_text(profile.collapsed_stacks(), encoding='utf-8')
+        return profile_id
+
+
+def aggregate(lines):
+    """
+    add up requests.jsonl lines by view: how many requests, and the average and worst time, queries
+    and SQL time, slowest views first
+    """
+    views = {}
+    for line in lines:
+        request = json.loads(line)
+        view = views.setdefault(request['view'] or request['path'], {
+            'requests': 0, 'ms': 0.0, 'max_ms': 0.0, 'queries': 0, 'max_queries': 0, 'sql_ms': 0.0,
+            'duplicate_queries': 0, 'templates': defaultdict(float)})
+        view['requests'] += 1
+        view['ms'] += request['ms']
+        view['max_ms'] = max(view['max_ms'], request['ms'])
+        view['queries'] += request['queries']
+        view['max_queries'] = max(view['max_queries'], request['queries'])
+        view['sql_ms'] += request['sql_ms']
+        view['duplicate_queries'] += request['duplicate_queries']
+        for name, template in request['templates'].items():
+            view['templates'][name] += template['ms']
+
+    for view in views.values():
+        for total in ('ms', 'queries', 'sql_ms', 'duplicate_queries'):
+            view['avg_' + total] = view.pop(total) / view['requests']
+        view['avg_template_ms'] = {name: ms / view['requests'] for name, ms in view.pop('templates').items()}
+    return dict(sorted(views.items(), key=lambda item: -item[1]['avg_ms']))
@@ -0,0 +1,145 @@
+import bisect
+import datetime
+from collections import defaultdict
+from django.db import transaction
+from studybuddy.models import StudySession
+
+# the part of the day free study session times are suggested in
+DAY_START = datetime.time(8, 0)
+DAY_END = datetime.time(22, 0)
+
+
+class DayCalendar:
+    """
+    one user's study sessions on one day, sorted by start time
+
+    Alongside the sorted starts it keeps the latest end time seen so far, so checking a new session
+    for a clash is a binary search: only sessions starting before the new one ends can overlap it,
+    and one of them does if the latest of their end times is after the new one starts.
+    """
+
+    def __init__(self, sessions):
+        # sessions are (start, end, session) tuples
+        self.sessions = sorted(sessions, key=lambda session: (session[0], session[1]))
+        self.starts = [start for start, end, session in self.sessions]
+        self.latest_ends = []
+        latest = None
+        for start, end, session in self.sessions:
+            latest = end if latest is None or end > latest else latest
+            self.latest_ends.append(latest)
+
+    def overlaps(self, start, end):
+        """
+        whether any session overlaps start to end, touching end to start doesn't count
+        """
+        before_end = bisect.bisect_left(self.starts, end)
+        return before_end > 0 and self.latest_ends[before_end - 1] > start
+
+    def conflicts(self, start, end):
+        """
+        the sessions that overlap start to end
+        """
+        if not self.overlaps(start, end):
+            return []
+        before_end = bisect.bisect_left(self.starts, end)
+        return [session for session_start, session_end, session in self.sessions[:before_end] if session_end > start]
+
+
+def busy_calendars(emails, first_date, last_date=None):
+    """
+    every user's sessions from first_date to last_date, as {(email, date): DayCalendar}, in one query
+
+    Declined sessions don't count.
+    """
+    memberships = StudySession.users.through.objects.filter(
+        user_id__in=list(emails),
+        studysession__date__range=(first_date, last_date or first_date),
+    ).exclude(studysession__accepted='no').select_related('studysession')
+
+    sessions = defaultdict(list)
+    for membership in memberships:
+        session = membership.studysession
+        sessions[membership.user_id, session.date].append((session.start, session.end, session))
+    return defaultdict(lambda: DayCalendar([]),
+                       {key: DayCalendar(day_sessions) for key, day_sessions in sessions.items()})
+
+
+def weekly_dates(date, weeks=1):
+    """
+    date and the same day of the week for the weeks after it
+    """
+    return [date + datetime.timedelta(weeks=week) for week in range(weeks)]
+
+
+def find_conflicts(emails, date, start, end, weeks=1):
+    """
+    the sessions each user already has between start and end on date, and on the same day in each of
+    the following weeks for recurring sessions, only including users with clashes
+    """
+    dates = weekly_dates(date, weeks)
+    calendars = busy_calendars(emails, dates[0], dates[-1])
+    conflicts = {}
+    for email in emails:
+        clashes = [session for day in dates for session in calendars[email, day].conflicts(start, end)]
+        if clashes:
+            conflicts[email] = clashes
+    return conflicts
+
+
+def schedule_sessions(room, date, start, end, author, weeks=1):
+    """
+    create a session for everyone in the room on date, repeated weekly for recurring sessions
+
+    The sessions and their members are each added with one bulk insert in a single transaction, so
+    scheduling a semester for a whole room is a handful of statements. return the sessions
+    """
+    with transaction.atomic():
+        emails = list(room.users.values_list('email', flat=True))
+        sessions = StudySession.objects.bulk_create([
+            StudySession(date=day, start=start, end=end, name=room.name, post=room.post, author=author)
+            for day in weekly_dates(date, weeks)])
+
+        Membership = StudySession.users.through
+        Membership.objects.bulk_create([Membership(studysession_id=session.pk, user_id=email)
+                                        for session in sessions for email in emails])
+    return sessions
+
+
+def free_slots(emails, first_date, days=7, duration=datetime.timedelta(hours=1), now=None):
+    """
+    the times nobody in emails has a session, for each day from first_date, as {date: [(start, end)]}
+
+    Only gaps of at least duration between DAY_START and DAY_END are included, and for today only
+    the part of the day that hasn't happened yet.
+    """
+    last_date = first_date + datetime.timedelta(days=days - 1)
+    calendars = busy_calendars(emails, first_date, last_date)
+
+    # everyone's sessions on each day, sorted, so the gaps can be found in one sweep
+    busy = defaultdict(list)
+    for (email, date), calendar in calendars.items():
+        busy[date].extend((start, end) for start, end, session in calendar.sessions)
+
+    slots = {}
+    for offset in range(days):
+        date = first_date + datetime.timedelta(days=offset)
+        day_start = DAY_START
+        if now is not None and date == now.date():
+            if now.time() >= DAY_END:
+                continue
+            day_start = max(day_start, now.time().replace(second=0, microsecond=0))
+
+        day_slots = []
+        free_from = day_start
+        for start, end in sorted(busy[date]):
+            if start > free_from and fits(date, free_from, min(start, DAY_END), duration):
+                day_slots.append((free_from, min(start, DAY_END)))
+            free_from = max(free_from, end)
+        if fits(date, free_from, DAY_END, duration):
+            day_slots.append((free_from, DAY_END))
+        slots[date] = day_slots
+    return slots
+
+
+def fits(date, start, end, duration):
+    return datetime.datetime.combine(date, end) - datetime.datetime.combine(date, start) >= duration
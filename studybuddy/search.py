@@ -0,0 +1,123 @@
+import re
+from django.db import connection
+from django.db.models import Q
+from studybuddy.models import Course
+
+# the SQLite FTS5 table that indexes courses, created by migration 0011, rowid is the Course pk
+SEARCH_TABLE = 'studybuddy_course_search'
+SEARCH_FIELDS = ('subject', 'catalog_number', 'description', 'instructor')
+
+# how many courses are returned per page of search results
+SEARCH_PAGE_SIZE = 20
+
+
+def search_terms(query):
+    """
+    split a search into words and numbers, so "cs3240" and "CS 3240" both search for cs and 3240
+    """
+    return re.findall(r'[^\W\d_]+|\d+', query.lower())
+
+
+# the databases the index has been found in, so it is only looked for once per process
+_indexed_databases = set()
+
+
+def index_available():
+    """
+    whether the full text index exists, it is only created when the database is SQLite with FTS5
+    """
+    if connection.vendor != 'sqlite':
+        return False
+    # only finding the index is remembered, so migrating a database that didn't have it yet is noticed
+    database = str(connection.settings_dict['NAME'])
+    if database not in _indexed_databases and SEARCH_TABLE in connection.introspection.table_names():
+        _indexed_databases.add(database)
+    return database in _indexed_databases
+
+
+def index_courses(courses):
+    """
+    add or replace courses in the full text index
+    """
+    if not index_available():
+        return
+    rows = [(course.pk,) + tuple(str(getattr(course, field)) for field in SEARCH_FIELDS) for course in courses]
+    with connection.cursor() as cursor:
+        cursor.executemany('DELETE FROM %s WHERE rowid = %%s' % SEARCH_TABLE, [row[:1] for row in rows])
+        cursor.executemany('INSERT INTO %s (rowid, %s) VALUES (%%s, %%s, %%s, %%s, %%s)'
+                           % (SEARCH_TABLE, ', '.join(SEARCH_FIELDS)), rows)
+
+
+def unindex_course(pk):
+    """
+    remove a course from the full text index
+    """
+    if not index_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('DELETE FROM %s WHERE rowid = %%s' % SEARCH_TABLE, [pk])
+
+
+def rebuild_index():
+    """
+    index every course again, for after bulk changes that don't send signals
+    """
+    if not index_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('DELETE FROM %s' % SEARCH_TABLE)
+        cursor.execute('INSERT INTO %s (rowid, %s) SELECT id, %s FROM %s'
+                       % (SEARCH_TABLE, ', '.join(SEARCH_FIELDS), ', '.join(SEARCH_FIELDS), Course._meta.db_table))
+
+
+def search_courses(query, subject=None, page=1, size=SEARCH_PAGE_SIZE):
+    """
+    return a page of courses matching every word of the query, best matches first, and whether there
+    is another page
+
+    Each word matches the start of a word in the subject, catalog number, description or instructor,
+    so results show up while the search is still being typed. An empty query in a department lists
+    the department's courses in catalog order, so its page can be loaded a page at a time.
+    """
+    terms = search_terms(query)
+    if not terms and not subject:
+        return [], False
+
+    offset = (page - 1) * size
+    if terms and index_available():
+        pks = _match(terms, subject, size + 1, offset)
+        courses = Course.objects.in_bulk(pks)
+        results = [courses[pk] for pk in pks if pk in courses]
+    else:
+        results = list(_like(terms, subject)[offset:offset + size + 1])
+
+    return results[:size], len(results) > size
+
+
+def _match(terms, subject, limit, offset):
+    # each term is quoted so it can't be read as FTS syntax, and * makes it a prefix search
+    match = ' '.join('"%s"*' % term for term in terms)
+    sql = 'SELECT rowid FROM %s WHERE %s MATCH %%s' % (SEARCH_TABLE, SEARCH_TABLE)
+    params = [match]
+    if subject:
+        sql += ' AND subject = %s'
+        params.append(subject)
+    sql += ' ORDER BY rank LIMIT %s OFFSET %s'
+    params += [limit, offset]
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _like(terms, subject):
+    # used when there is no index or nothing to search for, every term has to appear somewhere in the course
+    courses = Course.objects.all()
+    if subject:
+        courses = courses.filter(subject=subject)
+    for term in terms:
+        matches = Q()
+        for field in SEARCH_FIELDS:
+            matches |= Q(**{field + '__icontains': term})
+        courses = courses.filter(matches)
+    return courses.order_by('subject', 'catalog_number', 'section', 'pk')
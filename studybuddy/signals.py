@@ -0,0 +1,91 @@
+import weakref
+from django.conf import settings
+from django.dispatch import receiver
+from django.db.backends.signals import connection_created
+from django.db.models import QuerySet
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from studybuddy.models import User, Course, EnrolledClass
+from studybuddy.search import index_courses, unindex_course
+from studybuddy.catalog import importing, refresh_departments
+from studybuddy.matching import match_index
+from studybuddy.friend_graph import friend_graph
+
+
+# the queryset deletes that have already refreshed the departments
+_refreshed_deletes = weakref.WeakSet()
+
+
+@receiver(post_save, sender=Course)
+def course_saved(sender, instance, created, **kwargs):
+    """
+    keep the course search index and, when a course is added or changes subject, the departments up to date
+    """
+    index_courses([instance])
+    if created or getattr(instance, '_loaded_subject', None) != instance.subject:
+        refresh_departments()
+    instance._loaded_subject = instance.subject
+
+
+@receiver(post_delete, sender=Course)
+def course_deleted(sender, instance, origin=None, **kwargs):
+    # import_catalog rebuilds the index and the departments once it is done
+    if importing.get():
+        return
+    unindex_course(instance.pk)
+    # a queryset delete sends post_delete for each course after all of them are deleted, so the
+    # departments only need refreshing for the first one
+    if isinstance(origin, QuerySet):
+        if origin in _refreshed_deletes:
+            return
+        _refreshed_deletes.add(origin)
+    refresh_departments()
+
+
+@receiver(post_save, sender=EnrolledClass)
+def enrollment_saved(sender, instance, created, **kwargs):
+    """
+    keep the study buddy suggestions up to date
+    """
+    if created and match_index.loaded:
+        match_index.enroll(instance.student_id, instance.course_id, instance.course.subject,
+                           instance.course.catalog_number)
+
+
+@receiver(post_delete, sender=EnrolledClass)
+def enrollment_deleted(sender, instance, **kwargs):
+    match_index.unenroll(instance.student_id, instance.course_id)
+
+
+@receiver(m2m_changed, sender=User.friends.through)
+def friends_changed(sender, instance, action, pk_set, **kwargs):
+    """
+    keep the friend graph up to date when friend requests are accepted and friends are removed
+    """
+    if action == 'post_add':
+        for email in pk_set:
+            friend_graph.befriend(instance.pk, email)
+    elif action == 'post_remove':
+        for email in pk_set:
+            friend_graph.unfriend(instance.pk, email)
+    elif action == 'post_clear':
+        friend_graph.reset()
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, **kwargs):
+    match_index.set_major(instance.pk, instance.major)
+
+
+def apply_sqlite_pragmas(cursor, pragmas):
+    for name, value in pragmas.items():
+        cursor.execute('PRAGMA %s = %s' % (name, value))
+
+
+@receiver(connection_created)
+def tune_sqlite(sender, connection, **kwargs):
+    """
+    set SQLITE_PRAGMAS on every new SQLite connection, pragmas only last as long as the connection
+    """
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            apply_sqlite_pragmas(cursor, getattr(settings, 'SQLITE_PRAGMAS', {}))
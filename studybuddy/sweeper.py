@@ -0,0 +1,71 @@
+import logging
+import threading
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Q
+from django.utils import timezone
+from studybuddy.models import Post, StudySession
+
+logger = logging.getLogger(__name__)
+
+
+def expired_posts():
+    """
+    posts whose end date has passed
+    """
+    return Post.objects.filter(endDate__lt=timezone.localdate())
+
+
+def past_sessions():
+    """
+    study sessions on an earlier day, or earlier today with an end time that has already passed
+    """
+    now = timezone.localtime()
+    return StudySession.objects.filter(Q(date__lt=now.date()) | Q(date=now.date(), end__lt=now.time()))
+
+
+def purge(queryset, batch_size=500):
+    """
+    delete everything in queryset a batch at a time and return how many rows were deleted
+
+    Each batch is its own short delete, so the database is never locked for long no matter how
+    much has built up.
+    """
+    deleted = 0
+    while True:
+        pks = list(queryset.values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            return deleted
+        queryset.model.objects.filter(pk__in=pks).delete()
+        deleted += len(pks)
+
+
+def sweep(batch_size=500):
+    """
+    remove expired posts and past study sessions
+    """
+    return {
+        'posts': purge(expired_posts(), batch_size),
+        'sessions': purge(past_sessions(), batch_size),
+    }
+
+
+def sweep_forever(interval=None, batch_size=None, stopped=None):
+    """
+    run sweep every interval seconds until stopped is set
+
+    This runs in the one process that cleans up (`manage.py purge_expired --loop`, the sweeper in the
+    Procfile), so web and chat worker processes don't race each other deleting the same rows.
+    """
+    interval = interval or getattr(settings, 'SWEEP_INTERVAL', 300)
+    batch_size = batch_size or getattr(settings, 'SWEEP_BATCH_SIZE', 500)
+    stopped = stopped or threading.Event()
+
+    while not stopped.wait(interval):
+        try:
+            sweep(batch_size)
+        except Exception:
+            logger.exception('Sweeping expired posts and sessions failed')
+        finally:
+            close_old_connections()
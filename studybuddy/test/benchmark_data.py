@@ -0,0 +1,111 @@
+"""
+a synthetic dataset the size of a busy semester, for the route benchmarks in test_benchmarks
+"""
+import datetime
+import random
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+from nose.tools import nottest
+from studybuddy.catalog import refresh_departments
+from studybuddy.friend_graph import friend_graph
+from studybuddy.matching import match_index
+from studybuddy.models import User, Course, Post, EnrolledClass, Room, Message, StudySession, Friend_Request
+from studybuddy.search import rebuild_index
+
+# how many of each thing seed makes, multiplied by its scale
+SUBJECTS = 40
+COURSES = 1500
+USERS = 2000
+COURSES_PER_USER = 5
+FRIENDS_PER_USER = 10
+POSTS = 3000
+ROOMS = 500
+MEMBERS_PER_ROOM = 4
+MESSAGES_PER_ROOM = 20
+SESSIONS = 1500
+
+# the user the benchmarks sign in as, they have a bit of everything
+BENCHMARK_EMAIL = 'student0@virginia.edu'
+BENCHMARK_USERNAME = 'student0'
+
+
+@nottest
+def seed(scale=1, random_seed=3240):
+    """
+    fill the database with users, courses, enrollments, friends, posts, rooms, messages and study
+    sessions, the same every time for the same scale, and return the benchmark user's login
+
+    Everything is inserted with bulk_create, so the indexes kept up to date by signals (search,
+    departments, study buddy matching) are rebuilt at the end.
+    """
+    rng = random.Random(random_seed)
+    today = timezone.localdate()
+
+    subjects = ['S%03d' % i for i in range(SUBJECTS)]
+    courses = Course.objects.bulk_create([
+        Course(subject=subjects[i % SUBJECTS], catalog_number=str(1000 + i // SUBJECTS % 9000),
+               instructor='Instructor %d' % (i % 300), section=str(i % 3), course_number=str(10000 + i),
+               description='Course %d about %s' % (i, rng.choice(['algorithms', 'databases', 'writing', 'biology'])))
+        for i in range(int(COURSES * scale))])
+
+    users = User.objects.bulk_create([
+        User(email='student%d@virginia.edu' % i, username='student%d' % i, name='Student %d' % i,
+             major=rng.choice(['Computer Science', 'Biology', 'English', 'Economics']))
+        for i in range(int(USERS * scale))])
+
+    EnrolledClass.objects.bulk_create([
+        EnrolledClass(student=user, course=course)
+        for user in users for course in rng.sample(courses, COURSES_PER_USER)])
+
+    # friends go both ways, so both rows of the symmetrical table are added
+    friendships = set()
+    for i, user in enumerate(users):
+        for friend in rng.sample(users, FRIENDS_PER_USER // 2):
+            if friend is not user:
+                friendships.add((user.pk, friend.pk))
+                friendships.add((friend.pk, user.pk))
+    Friendship = User.friends.through
+    Friendship.objects.bulk_create([Friendship(from_user_id=a, to_user_id=b) for a, b in friendships])
+    Friend_Request.objects.bulk_create([Friend_Request(from_user=users[i], to_user=users[0])
+                                        for i in range(1, len(users), len(users) // 20)
+                                        if (users[i].pk, users[0].pk) not in friendships])
+
+    posts = Post.objects.bulk_create([
+        Post(course=rng.choice(courses), user=users[0] if i % 50 == 0 else rng.choice(users),
+             author='Student', topic='Topic %d' % i, description='Looking for people to study with',
+             startDate=today - datetime.timedelta(days=rng.randrange(7)),
+             endDate=today + datetime.timedelta(days=rng.randrange(-3, 14)),
+             post_type=rng.choice(['section', 'course']))
+        for i in range(int(POSTS * scale))])
+
+    rooms = Room.objects.bulk_create([Room(name=post.topic, post=post) for post in posts[:int(ROOMS * scale)]])
+    Membership = Room.users.through
+    members = {}
+    for i, room in enumerate(rooms):
+        members[room.pk] = {users[0]} if i % 10 == 0 else set()
+        members[room.pk].update(rng.sample(users, MEMBERS_PER_ROOM - len(members[room.pk])))
+    Membership.objects.bulk_create([Membership(room_id=room_pk, user_id=user.pk)
+                                    for room_pk, room_users in members.items() for user in room_users])
+
+    Message.objects.bulk_create([
+        Message(room=room, user=rng.choice(sorted(members[room.pk], key=str)), content='Message %d' % i)
+        for room in rooms for i in range(MESSAGES_PER_ROOM)])
+
+    sessions = StudySession.objects.bulk_create([
+        StudySession(post=rooms[i % len(rooms)].post, author=users[i % len(users)].email,
+                     name=rooms[i % len(rooms)].name, date=today + datetime.timedelta(days=rng.randrange(-7, 21)),
+                     start=datetime.time(8 + i % 12), end=datetime.time(9 + i % 12),
+                     accepted=rng.choice(['?', 'yes', 'no']))
+        for i in range(int(SESSIONS * scale))])
+    SessionMembership = StudySession.users.through
+    SessionMembership.objects.bulk_create([
+        SessionMembership(studysession_id=session.pk, user_id=user.pk)
+        for i, session in enumerate(sessions) for user in members[rooms[i % len(rooms)].pk]])
+
+    rebuild_index()
+    refresh_departments()
+    match_index.reset()
+    friend_graph.reset()
+
+    get_user_model().objects.create_user(BENCHMARK_USERNAME, BENCHMARK_EMAIL, 'benchmark')
+    return users[0]
@@ -0,0 +1,163 @@
+import json
+import os
+import statistics
+import time
+import tracemalloc
+from pathlib import Path
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, tag
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from studybuddy import urls
+from studybuddy.models import Room, EnrolledClass
+from studybuddy.test.benchmark_data import seed, BENCHMARK_USERNAME
+from studybuddy.test.test_utils import reset_indexes
+
+BUDGETS_PATH = Path(__file__).with_name('route_budgets.json')
+
+# how many times each route is requested to measure its latency, after one request to warm up
+RUNS = int(os.environ.get('BENCHMARK_RUNS', 10))
+
+# how much bigger than the seed dataset the benchmarks run with, budgets are checked at scale 1
+SCALE = float(os.environ.get('BENCHMARK_SCALE', 1))
+
+# set to write the measurements to route_budgets.json instead of checking them, with some headroom
+# for slower machines: query counts are exact, times are allowed to grow 4x and memory 2x
+UPDATE_BUDGETS = os.environ.get('UPDATE_ROUTE_BUDGETS') == '1'
+
+# query counts are the same on every machine and are always checked, set to also check the time and
+# memory budgets, which depend on the machine and aren't reliable on shared CI runners
+CHECK_TIMINGS = UPDATE_BUDGETS or os.environ.get('BENCHMARK_TIMINGS') == '1'
+
+
+def percentile(samples, percent):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * percent / 100))]
+
+
+@tag('benchmark')
+class RouteBudgetTest(TestCase):
+    """
+    requests every studybuddy route against the benchmark dataset and checks its query count (and with
+    BENCHMARK_TIMINGS=1 its SQL time, p50/p95 latency and peak memory) against route_budgets.json, so
+    N+1 queries show up as a failing test instead of a slow page in production
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.student = seed(SCALE)
+        cls.course = EnrolledClass.objects.filter(student=cls.student).select_related('course').first().course
+        cls.room = Room.objects.filter(users=cls.student).order_by('pk').first()
+
+    def setUp(self):
+        reset_indexes(self)
+        self.client.force_login(get_user_model().objects.get(username=BENCHMARK_USERNAME))
+
+    def routes(self):
+        """
+        how to request each route: (method, url kwargs, data)
+        """
+        dept = self.course.subject
+        course_number = int(self.course.course_number)
+        course = {'dept': dept, 'course_number': course_number}
+        room = {'roomNumber': self.room.pk}
+        return {
+            'index': ('get', {}, {}),
+            'viewFriends': ('get', {}, {}),
+            'account': ('get', {}, {}),
+            'addAccount': ('get', {}, {}),
+            'editAccount': ('get', {}, {}),
+            'updateAccount': ('post', {}, {'username': 'student0', 'name': 'Student 0', 'major': 'Biology',
+                                           'zlink': '', 'blurb': ''}),
+            'alldepartments': ('get', {}, {}),
+            'rooms': ('get', {}, {}),
+            'room': ('get', room, {}),
+            'roomMessages': ('get', room, {}),
+            'courseSearch': ('get', {}, {'q': 'course alg'}),
+            'department': ('get', {'dept': dept}, {}),
+            'coursefeed': ('get', course, {}),
+            'makepost': ('get', course, {}),
+            'viewposts': ('get', {}, {}),
+            'enroll': ('get', course, {}),
+            'ucl': ('post', course, {'choice': 'YesE'}),
+            'schedule': ('get', room, {}),
+            'upcomingSessions': ('get', {}, {}),
+        }
+
+    def request(self, name):
+        method, kwargs, data = self.routes()[name]
+        response = getattr(self.client, method)(reverse('studybuddy:' + name, kwargs=kwargs), data)
+        self.assertLess(response.status_code, 400, name)
+        return response
+
+    def measure(self, name):
+        # warm up, so the first request's one off costs (templates, in memory indexes) don't count
+        self.request(name)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.request(name)
+        # read them now, the log is cleared when the next request starts
+        query_count = len(queries)
+        sql_ms = sum(float(query['time']) for query in queries.captured_queries) * 1000
+        if not CHECK_TIMINGS:
+            return {'queries': query_count}
+
+        latencies = []
+        for _ in range(RUNS):
+            start = time.perf_counter()
+            self.request(name)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+        tracemalloc.start()
+        try:
+            self.request(name)
+            memory_kb = tracemalloc.get_traced_memory()[1] / 1024
+        finally:
+            tracemalloc.stop()
+
+        return {
+            'queries': query_count,
+            'sql_ms': sql_ms,
+            'p50_ms': statistics.median(latencies),
+            'p95_ms': percentile(latencies, 95),
+            'memory_kb': memory_kb,
+        }
+
+    def test_every_route_has_a_budget(self):
+        """
+        a new route can't be added without a way to benchmark it and a budget
+        """
+        names = {pattern.name for pattern in urls.urlpatterns}
+        self.assertEqual(names, set(self.routes()))
+        if not UPDATE_BUDGETS:
+            self.assertEqual(names, set(json.loads(BUDGETS_PATH.read_text())))
+
+    def test_routes_within_budget(self):
+        """
+        no route makes more queries than its budget allows, or with BENCHMARK_TIMINGS=1 spends more
+        time in SQL or rendering or uses more memory
+        """
+        measurements = {name: self.measure(name) for name in sorted(self.routes())}
+
+        if UPDATE_BUDGETS:
+            budgets = {name: {
+                'queries': measured['queries'],
+                'sql_ms': round(measured['sql_ms'] * 4 + 5, 1),
+                'p50_ms': round(measured['p50_ms'] * 4 + 10, 1),
+                'p95_ms': round(measured['p95_ms'] * 4 + 20, 1),
+                'memory_kb': round(measured['memory_kb'] * 2 + 256),
+            } for name, measured in measurements.items()}
+            BUDGETS_PATH.write_text(json.dumps(budgets, indent=4, sort_keys=True) + '\n')
+            return
+
+        budgets = json.loads(BUDGETS_PATH.read_text())
+        over_budget = []
+        for name, measured in measurements.items():
+            for metric, limit in budgets[name].items():
+                # only the query count is checked when the dataset is scaled up
+                if metric not in measured or SCALE != 1 and metric != 'queries':
+                    continue
+                if measured[metric] > limit:
+                    over_budget.append('%s %s: %.1f > %s' % (name, metric, measured[metric], limit))
+        self.assertEqual(over_budget, [])
@@ -0,0 +1,274 @@
+import json
+import os
+import tempfile
+from unittest import mock
+from io import StringIO
+from django.test import TestCase
+from django.core.management import call_command
+from studybuddy.models import User, Course, Departments, EnrolledClass, Post
+from studybuddy.catalog import iter_catalog, course_fields, import_catalog, refresh_departments, \
+    department_directory, directory_last_modified
+from studybuddy.test.test_constants import TEST_EMAIL
+
+
+def catalog_entry(subject, catalog_number, course_number, section='001', instructor='testInstructor',
+                  description='testCourseDescription'):
+    return {'subject': subject,
+            'catalog_number': catalog_number,
+            'instructor': {'name': instructor, 'email': 'instructor@email.com'},
+            'course_section': section,
+            'course_number': course_number,
+            'description': description}
+
+
+class IterCatalogTest(TestCase):
+    def test_streams_entries(self):
+        """
+        every entry in the array is read, even when entries are split across reads
+        """
+        # given
+        entries = [catalog_entry('CS', str(3000 + i), 10000 + i) for i in range(50)]
+        file = StringIO(json.dumps(entries, indent=2))
+
+        # then
+        self.assertEqual(list(iter_catalog(file, chunk_size=7)), entries)
+
+    def test_empty_catalog(self):
+        """
+        an empty array has no entries
+        """
+        self.assertEqual(list(iter_catalog(StringIO(' [ ] '))), [])
+
+    def test_truncated_catalog(self):
+        """
+        a catalog cut off part way through is an error rather than a partial import
+        """
+        file = StringIO(json.dumps([catalog_entry('CS', '3240', 12345)] * 2)[:-20])
+
+        with self.assertRaises(ValueError):
+            list(iter_catalog(file, chunk_size=16))
+
+    def test_course_fields(self):
+        """
+        the API's nested instructor and course_section are mapped onto the Course fields
+        """
+        self.assertEqual(course_fields(catalog_entry('CS', '3240', 12345, instructor='Sherriff')),
+                         {'subject': 'CS',
+                          'catalog_number': '3240',
+                          'instructor': 'Sherriff',
+                          'section': '001',
+                          'course_number': '12345',
+                          'description': 'testCourseDescription'})
+
+
+class ImportCatalogTest(TestCase):
+    def setUp(self):
+        self.kept = Course.objects.create(**course_fields(catalog_entry('CS', '3240', 1)))
+        self.changed = Course.objects.create(**course_fields(catalog_entry('CS', '2150', 2)))
+        self.removed = Course.objects.create(**course_fields(catalog_entry('MATH', '3351', 3)))
+        Departments.objects.create(dept='MATH')
+
+        self.test_User = User.objects.create(email=TEST_EMAIL)
+        EnrolledClass.objects.create(student=self.test_User, course=self.changed)
+
+        self.catalog = [catalog_entry('CS', '3240', 1),
+                        catalog_entry('CS', '2150', 2, instructor='newInstructor'),
+                        catalog_entry('APMA', '3080', 4)]
+
+    def test_import(self):
+        """
+        new sections are added, changed sections are updated in place and missing sections are removed
+        """
+        # when
+        counts = import_catalog(self.catalog, delete_missing=True)
+
+        # then
+        self.assertEqual(counts, {'created': 1, 'updated': 1, 'deleted': 1, 'merged': 0, 'departments': 2})
+        self.assertEqual(set(Course.objects.values_list('course_number', flat=True)), {'1', '2', '4'})
+        self.assertEqual(Course.objects.get(pk=self.changed.pk).instructor, 'newInstructor')
+        self.assertTrue(EnrolledClass.objects.filter(course=self.changed).exists())
+        self.assertEqual(set(Departments.objects.values_list('dept', flat=True)), {'APMA', 'CS'})
+
+    def test_import_is_idempotent(self):
+        """
+        importing the same catalog again changes nothing
+        """
+        import_catalog(self.catalog, delete_missing=True)
+
+        self.assertEqual(import_catalog(self.catalog, delete_missing=True),
+                         {'created': 0, 'updated': 0, 'deleted': 0, 'merged': 0,
+                          'departments': 2})
+
+    def test_keep_missing(self):
+        """
+        courses missing from the catalog are kept unless deleting them is asked for, so importing part
+        of a catalog can't delete the rest
+        """
+        counts = import_catalog(self.catalog)
+
+        self.assertEqual(counts['deleted'], 0)
+        self.assertTrue(Course.objects.filter(pk=self.removed.pk).exists())
+        self.assertTrue(Departments.objects.filter(dept='MATH').exists())
+
+    def test_duplicates_kept_without_delete_missing(self):
+        """
+        courses sharing a course_number are left alone, with their posts and enrollments, unless
+        deleting is asked for
+        """
+        # given
+        duplicate = Course.objects.create(**course_fields(catalog_entry('CS', '3240', 1, section='002')))
+        EnrolledClass.objects.create(student=self.test_User, course=duplicate)
+
+        # when
+        counts = import_catalog(self.catalog)
+
+        # then
+        self.assertEqual(counts['merged'], 0)
+        self.assertTrue(EnrolledClass.objects.filter(course=duplicate).exists())
+
+    def test_duplicates_merged_into_oldest(self):
+        """
+        with delete_missing, courses sharing a course_number are merged into the oldest one, which
+        takes over their posts and enrollments
+        """
+        # given
+        duplicate = Course.objects.create(**course_fields(catalog_entry('CS', '3240', 1, section='002')))
+        post = Post.objects.create(course=duplicate, user=self.test_User)
+        EnrolledClass.objects.create(student=self.test_User, course=duplicate)
+        EnrolledClass.objects.create(student=self.test_User, course=self.kept)
+        other = User.objects.create(email='other@email.com')
+        EnrolledClass.objects.create(student=other, course=duplicate)
+
+        # when
+        counts = import_catalog(self.catalog, delete_missing=True)
+
+        # then
+        self.assertEqual((counts['merged'], counts['deleted']), (1, 1))
+        self.assertFalse(Course.objects.filter(pk=duplicate.pk).exists())
+        self.assertEqual(Post.objects.get(pk=post.pk).course_id, self.kept.pk)
+        self.assertEqual(set(EnrolledClass.objects.filter(course=self.kept).values_list('student_id', flat=True)),
+                         {self.test_User.email, other.email})
+
+    def test_deletes_skip_per_course_signals(self):
+        """
+        deleted courses aren't unindexed one at a time, the index is rebuilt once at the end
+        """
+        # when
+        with mock.patch('studybuddy.signals.unindex_course') as unindex_course, \
+                mock.patch('studybuddy.catalog.rebuild_index') as rebuild_index:
+            import_catalog(self.catalog, batch_size=1, delete_missing=True)
+
+        # then
+        unindex_course.assert_not_called()
+        rebuild_index.assert_called_once_with()
+        self.assertEqual(set(Departments.objects.values_list('dept', flat=True)), {'APMA', 'CS'})
+
+    def test_import_catalog_command(self):
+        """
+        the import_catalog management command loads a dump file and reports what changed
+        """
+        # given
+        with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as file:
+            json.dump(self.catalog, file)
+        self.addCleanup(os.remove, file.name)
+        out = StringIO()
+
+        # when
+        call_command('import_catalog', file.name, '--batch-size', '1', '--delete-missing', stdout=out)
+
+        # then
+        self.assertIn('Created 1, updated 1, deleted 1 and merged 0 duplicate courses in 2 departments', out.getvalue())
+
+    def test_import_catalog_command_keeps_missing(self):
+        """
+        the command only deletes courses when --delete-missing is passed
+        """
+        # given
+        with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as file:
+            json.dump(self.catalog, file)
+        self.addCleanup(os.remove, file.name)
+        out = StringIO()
+
+        # when
+        call_command('import_catalog', file.name, stdout=out)
+
+        # then
+        self.assertIn('Created 1, updated 1, deleted 0 and merged 0 duplicate courses in 3 departments', out.getvalue())
+        self.assertTrue(Course.objects.filter(pk=self.removed.pk).exists())
+
+
+class DepartmentDirectoryTest(TestCase):
+    def setUp(self):
+        for course_number, subject in enumerate(['CS', 'CS', 'APMA']):
+            Course.objects.create(**course_fields(catalog_entry(subject, '3240', course_number)))
+
+    def test_directory_counts_courses(self):
+        """
+        every subject with courses is listed, in order, with how many sections it has
+        """
+        self.assertEqual(department_directory(), [{'dept': 'APMA', 'course_count': 1},
+                                                  {'dept': 'CS', 'course_count': 2}])
+
+    def test_directory_follows_courses(self):
+        """
+        adding and removing courses updates the directory
+        """
+        # when
+        Course.objects.filter(subject='APMA').get().delete()
+        Course.objects.create(**course_fields(catalog_entry('MATH', '3351', 10)))
+
+        # then
+        self.assertEqual(department_directory(), [{'dept': 'CS', 'course_count': 2},
+                                                  {'dept': 'MATH', 'course_count': 1}])
+
+    def test_bulk_delete_refreshes_directory_once(self):
+        """
+        deleting several courses with a queryset, like the admin's delete selected, refreshes the
+        directory once after they are all gone
+        """
+        # when
+        with mock.patch('studybuddy.signals.refresh_departments', wraps=refresh_departments) as refresh:
+            Course.objects.filter(subject='CS').delete()
+
+        # then
+        refresh.assert_called_once_with()
+        self.assertEqual(department_directory(), [{'dept': 'APMA', 'course_count': 1}])
+
+    def test_saving_course_refreshes_directory_when_subject_changes(self):
+        """
+        only a new course or a course moving to another subject changes the directory
+        """
+        # given
+        course = Course.objects.get(subject='APMA')
+
+        # when
+        with mock.patch('studybuddy.signals.refresh_departments') as refresh:
+            course.description = 'Probability'
+            course.save()
+        unchanged_calls = refresh.call_count
+        course.subject = 'STAT'
+        course.save()
+
+        # then
+        self.assertEqual(unchanged_calls, 0)
+        self.assertEqual(department_directory(), [{'dept': 'CS', 'course_count': 2},
+                                                  {'dept': 'STAT', 'course_count': 1}])
+
+    def test_unchanged_directory_keeps_its_time(self):
+        """
+        refreshing a directory that hasn't changed doesn't make it look modified
+        """
+        last_modified = directory_last_modified()
+
+        refresh_departments()
+
+        self.assertEqual(directory_last_modified(), last_modified)
+
+    def test_directory_is_cached(self):
+        """
+        once the directory is cached, only the time it last changed is looked up
+        """
+        department_directory()
+
+        with self.assertNumQueries(1):
+            department_directory()
@@ -0,0 +1,218 @@
+# Source: https://channels.readthedocs.io/en/stable/topics/testing.html
+from unittest import mock
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from studybuddy.consumers import ChatConsumer, broadcast_profile_update
+from studybuddy.models import User, Room, Post, RoomReadState
+from studybuddy.routing import websocket_urlpatterns
+from studybuddy.test.test_utils import create_default_test_course
+from studybuddy.test.test_constants import TEST_EMAIL, TEST_EMAIL2, TEST_ROOM_NAME, TEST_TOPIC, \
+    TEST_USERNAME, TEST_PASSWORD, TEST_FRIEND_EMAIL
+
+
+class ChatConsumerTest(TestCase):
+    def setUp(self):
+        self.test_User = User.objects.create(email=TEST_EMAIL, name='testName')
+        self.test_User2 = User.objects.create(email=TEST_EMAIL2, name='testName2')
+        test_post = Post.objects.create(topic=TEST_TOPIC, course=create_default_test_course(), user=self.test_User)
+        self.test_room = Room.objects.create(name=TEST_ROOM_NAME, post=test_post)
+        self.test_room.users.add(self.test_User, self.test_User2)
+
+        self.path = '/studybuddy/chat/rooms/' + str(self.test_room.pk) + '/'
+
+        # the user AuthMiddlewareStack would put in the connection scope
+        self.test_user = get_user_model().objects.create_user(TEST_USERNAME, TEST_EMAIL, TEST_PASSWORD)
+
+    def communicator(self, user, path=None):
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), path or self.path)
+        communicator.scope['user'] = user
+        return communicator
+
+    async def connect(self):
+        communicator = self.communicator(self.test_user)
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    def send(self, communicator, message, **data):
+        return communicator.send_json_to(dict(data, message=message))
+
+    @async_to_sync
+    async def test_message_is_broadcast_with_name(self):
+        """
+        every connection in the room receives the message along with the sender's name
+        """
+        # given
+        sender = await self.connect()
+        listener = await self.connect()
+
+        # when
+        await self.send(sender, 'hello')
+
+        # then
+        for communicator in (sender, listener):
+            response = await communicator.receive_json_from()
+            self.assertEqual(response['message'], 'hello')
+            self.assertEqual(response['email'], TEST_EMAIL)
+            self.assertEqual(response['name'], 'testName')
+
+        await sender.disconnect()
+        await listener.disconnect()
+
+    @mock.patch('studybuddy.consumers.ChatConsumer.lookup_name', new_callable=mock.AsyncMock)
+    def test_sending_does_not_look_up_names(self, mock_lookup_name):
+        """
+        the sender's name is known from the moment they connect, so sending a message never
+        looks a name up no matter how many connections are in the room
+        """
+        # when
+        async_to_sync(self.send_to_room)(5, ['first', 'second', 'third'])
+
+        # then
+        mock_lookup_name.assert_not_called()
+
+    async def send_to_room(self, connections, messages):
+        communicators = [await self.connect() for _ in range(connections)]
+
+        for message in messages:
+            await self.send(communicators[0], message)
+            for communicator in communicators:
+                response = await communicator.receive_json_from()
+                self.assertEqual(response['name'], 'testName')
+
+        for communicator in communicators:
+            await communicator.disconnect()
+
+    @async_to_sync
+    async def test_profile_update_clears_cached_name(self):
+        """
+        when a room member changes their name, the next message uses the new name
+        """
+        # given
+        communicator = await self.connect()
+        await self.send(communicator, 'before')
+        await communicator.receive_json_from()
+
+        # when
+        self.test_User.name = 'newName'
+        await self.save_and_broadcast(self.test_User)
+        await self.send(communicator, 'after')
+
+        # then
+        response = await communicator.receive_json_from()
+        self.assertEqual(response['name'], 'newName')
+
+        await communicator.disconnect()
+
+    async def save_and_broadcast(self, user):
+        # broadcast_profile_update is called from sync views, so run it off the event loop
+        def update():
+            user.save()
+            broadcast_profile_update(user)
+
+        await database_sync_to_async(update)()
+
+    @async_to_sync
+    async def test_client_cannot_spoof_sender(self):
+        """
+        the email and room sent by the client are ignored in favour of the signed in user and their room
+        """
+        # given
+        communicator = await self.connect()
+
+        # when
+        await self.send(communicator, 'spoofed', email=TEST_EMAIL2, room_pk=self.test_room.pk + 1)
+
+        # then
+        response = await communicator.receive_json_from()
+        self.assertEqual(response['email'], TEST_EMAIL)
+        self.assertEqual(response['room_pk'], self.test_room.pk)
+
+        await communicator.disconnect()
+
+    @async_to_sync
+    async def test_anonymous_user_is_rejected(self):
+        """
+        a connection that isn't signed in cannot join the room
+        """
+        communicator = self.communicator(AnonymousUser())
+        connected, _ = await communicator.connect()
+
+        self.assertFalse(connected)
+
+    def test_disconnecting_marks_room_read(self):
+        """
+        messages that arrived while the user was connected aren't unread after they leave
+        """
+        # when
+        async_to_sync(self.send_to_room)(1, ['hello'])
+
+        # then
+        self.assertTrue(RoomReadState.objects.filter(user=self.test_User, room=self.test_room).exists())
+
+    def test_disconnecting_after_leaving_room(self):
+        """
+        a user who left the room before their connection closed isn't marked as reading it
+        """
+        # when
+        async_to_sync(self.leave_then_disconnect)()
+
+        # then
+        self.assertFalse(RoomReadState.objects.exists())
+
+    async def leave_then_disconnect(self):
+        communicator = await self.connect()
+        await database_sync_to_async(self.test_room.users.remove)(self.test_User)
+        await communicator.disconnect()
+
+    def test_non_member_is_rejected(self):
+        """
+        a signed in user who isn't in the room cannot join it
+        """
+        # given
+        User.objects.create(email=TEST_FRIEND_EMAIL)
+        outsider = get_user_model().objects.create_user('outsider', TEST_FRIEND_EMAIL, TEST_PASSWORD)
+
+        # when
+        connected = async_to_sync(self.try_connect)(self.communicator(outsider))
+
+        # then
+        self.assertFalse(connected)
+
+    def test_disconnect_after_connecting_failed(self):
+        """
+        a connection that failed before its room was looked up can still disconnect cleanly
+        """
+        # given
+        consumer = ChatConsumer()
+        consumer.scope = {'url_route': {'kwargs': {'room_name': str(self.test_room.pk)}}, 'user': self.test_user}
+        consumer.channel_layer = get_channel_layer()
+        consumer.channel_name = 'test.channel'
+        with mock.patch.object(ChatConsumer, 'get_membership', new_callable=mock.AsyncMock,
+                               side_effect=ConnectionError):
+            with self.assertRaises(ConnectionError):
+                async_to_sync(consumer.connect)()
+
+        # when
+        async_to_sync(consumer.disconnect)(1011)
+
+        # then
+        self.assertFalse(RoomReadState.objects.exists())
+
+    def test_invalid_room_is_rejected(self):
+        """
+        connecting to a room that doesn't exist is rejected
+        """
+        connected = async_to_sync(self.try_connect)(self.communicator(self.test_user, '/studybuddy/chat/rooms/abc/'))
+
+        self.assertFalse(connected)
+
+    async def try_connect(self, communicator):
+        connected, _ = await communicator.connect()
+        return connected
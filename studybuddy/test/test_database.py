@@ -0,0 +1,79 @@
+import sqlite3
+import tempfile
+from pathlib import Path
+from django.conf import settings
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+from studybuddy.signals import apply_sqlite_pragmas
+
+
+class SqlitePragmasTest(TestCase):
+    def test_pragmas_applied_to_connection(self):
+        """
+        the connection the tests use was tuned when it was opened
+        """
+        # when
+        with connection.cursor() as cursor:
+            busy_timeout = cursor.execute('PRAGMA busy_timeout').fetchone()[0]
+            cache_size = cursor.execute('PRAGMA cache_size').fetchone()[0]
+            synchronous = cursor.execute('PRAGMA synchronous').fetchone()[0]
+
+        # then
+        self.assertEqual(busy_timeout, settings.SQLITE_PRAGMAS['busy_timeout'])
+        self.assertEqual(cache_size, settings.SQLITE_PRAGMAS['cache_size'])
+        self.assertEqual(synchronous, 1)  # NORMAL
+
+
+class WalConcurrencyTest(SimpleTestCase):
+    """
+    the in memory test database can't use WAL, so this checks the pragmas on a database file
+    """
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = str(Path(directory.name) / 'chat.sqlite3')
+
+    def connect(self, pragmas):
+        # timeout 0 so a blocked write fails straight away instead of waiting
+        db = sqlite3.connect(self.path, timeout=0, isolation_level=None)
+        self.addCleanup(db.close)
+        apply_sqlite_pragmas(db.cursor(), pragmas)
+        return db
+
+    def write_while_reading(self, pragmas):
+        writer = self.connect(pragmas)
+        writer.execute('CREATE TABLE message (content TEXT)')
+        writer.execute("INSERT INTO message VALUES ('hello')")
+
+        reader = self.connect(pragmas)
+        reader.execute('BEGIN')
+        reader.execute('SELECT * FROM message').fetchall()
+
+        writer.execute("INSERT INTO message VALUES ('hi')")
+        return reader.execute('SELECT COUNT(*) FROM message').fetchone()[0]
+
+    def test_write_while_reading_with_wal(self):
+        """
+        a chat message can be saved while a page is reading, and the page keeps its snapshot
+        """
+        # given
+        pragmas = dict(settings.SQLITE_PRAGMAS, busy_timeout=0)
+
+        # when
+        count = self.write_while_reading(pragmas)
+
+        # then
+        self.assertEqual(count, 1)
+        self.assertEqual(self.connect(pragmas).execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+
+    def test_write_while_reading_without_wal(self):
+        """
+        with the default rollback journal the same write fails
+        """
+        # given
+        pragmas = {'journal_mode': 'DELETE', 'busy_timeout': 0}
+
+        # when / then
+        with self.assertRaisesMessage(sqlite3.OperationalError, 'database is locked'):
+            self.write_while_reading(pragmas)
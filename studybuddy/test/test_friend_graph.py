@@ -0,0 +1,86 @@
+from django.urls import reverse
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+from studybuddy.models import User, Friend_Request
+from studybuddy.friend_graph import friend_graph, people_you_may_know
+from studybuddy.test.test_utils import reset_indexes
+from studybuddy.test.test_constants import TEST_USERNAME, TEST_EMAIL, TEST_PASSWORD
+
+
+class FriendGraphTest(TestCase):
+    def setUp(self):
+        reset_indexes(self)
+
+        self.student = User.objects.create(email=TEST_EMAIL)
+        self.alice, self.bob, self.carol, self.dave = [User.objects.create(email=name + '@email.com')
+                                                       for name in ['alice', 'bob', 'carol', 'dave']]
+        # the student is friends with alice and bob, who both know carol, and only bob knows dave
+        self.student.friends.add(self.alice, self.bob)
+        self.carol.friends.add(self.alice, self.bob)
+        self.dave.friends.add(self.bob)
+
+    def test_friends(self):
+        self.assertEqual(friend_graph.friends(TEST_EMAIL), {self.alice.email, self.bob.email})
+
+    def test_mutual_counts(self):
+        """
+        mutual friends are the friends two users have in common
+        """
+        self.assertEqual(friend_graph.mutual_counts(TEST_EMAIL, [self.carol.email, self.dave.email, 'nobody@email.com']),
+                         {self.carol.email: 2, self.dave.email: 1, 'nobody@email.com': 0})
+
+    def test_people_you_may_know(self):
+        """
+        friends of friends are suggested, most mutual friends first, leaving out the user's own friends
+        """
+        self.assertEqual(people_you_may_know(self.student), [(self.carol, 2), (self.dave, 1)])
+        self.assertEqual(people_you_may_know(self.student, exclude=[self.carol.email]), [(self.dave, 1)])
+
+    def test_changes_update_graph(self):
+        """
+        accepting and removing friends updates the graph without reloading it
+        """
+        # given
+        friend_graph.friends(TEST_EMAIL)
+
+        # when
+        self.student.friends.add(self.carol)
+        self.student.friends.remove(self.bob)
+
+        # then
+        with self.assertNumQueries(0):
+            self.assertEqual(friend_graph.friends(TEST_EMAIL), {self.alice.email, self.carol.email})
+            self.assertEqual(friend_graph.friends_of_friends(TEST_EMAIL), {self.bob.email: 1})
+
+
+class FriendsPageTest(TestCase):
+    def setUp(self):
+        reset_indexes(self)
+
+        self.student = User.objects.create(email=TEST_EMAIL)
+        self.test_user = get_user_model().objects.create_user(TEST_USERNAME, TEST_EMAIL, TEST_PASSWORD)
+        self.client.login(username=TEST_USERNAME, password=TEST_PASSWORD)
+
+    def test_many_friends_constant_queries(self):
+        """
+        mutual friend counts and suggestions for a user with 500 friends don't query once per friend
+        (session, auth user, profile, friends, incoming requests, sent requests, friend graph, suggestions)
+        """
+        # given
+        friends = User.objects.bulk_create([User(email='friend%d@email.com' % i) for i in range(500)])
+        self.student.friends.add(*friends)
+        stranger = User.objects.create(email='stranger@email.com')
+        stranger.friends.add(*friends[:3])
+        requester = User.objects.create(email='requester@email.com')
+        requester.friends.add(*friends[:2])
+        Friend_Request.objects.create(from_user=requester, to_user=self.student)
+
+        # when
+        with self.assertNumQueries(8):
+            response = self.client.get(reverse('studybuddy:viewFriends'))
+
+        # then
+        self.assertEqual(response.context['people_you_may_know'], [(stranger, 3)])
+        self.assertEqual(response.context['friend_requests'][0].mutual_friends, 2)
+        self.assertEqual(response.context['friends'][0].mutual_friends, 0)
+        self.assertContains(response, '(2 mutual friends)')
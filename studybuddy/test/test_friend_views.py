@@ -5,11 +5,13 @@ from studybuddy.models import User, Friend_Request
 from django.test.client import RequestFactory
 from django.contrib.auth import get_user_model
 from studybuddy.views.friend_views import view_friends, accept_friend_request
+from studybuddy.test.test_utils import reset_indexes
 from studybuddy.test.test_constants import TEST_USERNAME, TEST_EMAIL, TEST_PASSWORD, TEST_FRIEND_EMAIL
 
 
 class FriendViewTest(TestCase):
     def setUp(self):
+        reset_indexes(self)
         User.objects.create(email=TEST_EMAIL)
         self.test_request_factory = RequestFactory()
 
@@ -0,0 +1,171 @@
+import os
+import asyncio
+import tempfile
+from asgiref.sync import async_to_sync
+from channels.exceptions import ChannelFull
+from django.test import SimpleTestCase
+from studybuddy.layers import SQLiteChannelLayer
+
+
+class SQLiteChannelLayerTest(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'channels.sqlite3')
+
+        self.layer = self.make_layer()
+
+    def make_layer(self, **config):
+        layer = SQLiteChannelLayer(self.path, **config)
+        self.addCleanup(async_to_sync(layer.close))
+        return layer
+
+    @async_to_sync
+    async def test_send_and_receive(self):
+        """
+        a message sent to a channel is received from it
+        """
+        # given
+        channel = await self.layer.new_channel()
+
+        # when
+        await self.layer.send(channel, {'type': 'test.message', 'text': 'hello'})
+
+        # then
+        message = await asyncio.wait_for(self.layer.receive(channel), 1)
+        self.assertEqual(message, {'type': 'test.message', 'text': 'hello'})
+
+    @async_to_sync
+    async def test_general_channel(self):
+        """
+        channels that were not made by new_channel can be sent to and received from
+        """
+        # when
+        await self.layer.send('general', {'type': 'test.message'})
+
+        # then
+        message = await asyncio.wait_for(self.layer.receive('general'), 1)
+        self.assertEqual(message['type'], 'test.message')
+
+    @async_to_sync
+    async def test_group_send_between_processes(self):
+        """
+        a group message sent by one process reaches channels that belong to another process
+        """
+        # given
+        other_process = self.make_layer()
+        first = await self.layer.new_channel()
+        second = await other_process.new_channel()
+        await self.layer.group_add('chat_1', first)
+        await other_process.group_add('chat_1', second)
+
+        # when
+        sent_to = await self.layer.group_send('chat_1', {'type': 'chat_message', 'message': 'hi'})
+
+        # then
+        self.assertEqual(sent_to, 2)
+        self.assertEqual((await asyncio.wait_for(self.layer.receive(first), 1))['message'], 'hi')
+        self.assertEqual((await asyncio.wait_for(other_process.receive(second), 1))['message'], 'hi')
+
+    @async_to_sync
+    async def test_group_discard(self):
+        """
+        a channel that left a group no longer gets its messages
+        """
+        # given
+        channel = await self.layer.new_channel()
+        await self.layer.group_add('chat_1', channel)
+        await self.layer.group_discard('chat_1', channel)
+
+        # when
+        await self.layer.group_send('chat_1', {'type': 'chat_message'})
+
+        # then
+        with self.assertRaises(asyncio.TimeoutError):
+            await asyncio.wait_for(self.layer.receive(channel), 0.2)
+
+    @async_to_sync
+    async def test_channel_capacity(self):
+        """
+        sending to a channel that already has capacity messages waiting raises ChannelFull
+        """
+        # given
+        layer = self.make_layer(capacity=2)
+        channel = await layer.new_channel()
+        await layer.send(channel, {'type': 'test.message'})
+        await layer.send(channel, {'type': 'test.message'})
+
+        # then
+        with self.assertRaises(ChannelFull):
+            await layer.send(channel, {'type': 'test.message'})
+
+    @async_to_sync
+    async def test_full_channel_is_skipped_by_group_send(self):
+        """
+        group_send drops the message for a full channel instead of failing the whole group
+        """
+        # given
+        layer = self.make_layer(capacity=1)
+        full = await layer.new_channel()
+        empty = await layer.new_channel()
+        await layer.group_add('chat_1', full)
+        await layer.group_add('chat_1', empty)
+        await layer.send(full, {'type': 'first'})
+
+        # when
+        await layer.group_send('chat_1', {'type': 'second'})
+
+        # then
+        self.assertEqual((await asyncio.wait_for(layer.receive(full), 1))['type'], 'first')
+        self.assertEqual((await asyncio.wait_for(layer.receive(empty), 1))['type'], 'second')
+
+    @async_to_sync
+    async def test_expired_messages_are_dropped(self):
+        """
+        messages that waited longer than expiry are never delivered, and their channel leaves its groups
+        """
+        # given
+        layer = self.make_layer(expiry=0, clean_interval=0)
+        channel = await layer.new_channel()
+        await layer.group_add('chat_1', channel)
+
+        # when
+        await layer.send(channel, {'type': 'test.message'})
+        await asyncio.sleep(0.01)
+        await layer.group_send('chat_1', {'type': 'test.message'})
+
+        # then
+        with self.assertRaises(asyncio.TimeoutError):
+            await asyncio.wait_for(layer.receive(channel), 0.2)
+
+    @async_to_sync
+    async def test_flush(self):
+        """
+        flush removes waiting messages and group memberships
+        """
+        # given
+        await self.layer.send('general', {'type': 'test.message'})
+
+        # when
+        await self.layer.flush()
+
+        # then
+        with self.assertRaises(asyncio.TimeoutError):
+            await asyncio.wait_for(self.layer.receive('general'), 0.2)
+
+    @async_to_sync
+    async def test_pending_count(self):
+        """
+        pending_count is how many messages are waiting to be received, in every process
+        """
+        # given
+        other_process = self.make_layer()
+        await self.layer.send('general', {'type': 'test.message'})
+        await other_process.send('general', {'type': 'test.message'})
+
+        # when
+        await self.layer.receive('general')
+
+        # then
+        self.assertEqual(self.layer.pending_count(), 1)
+        self.assertEqual(other_process.pending_count(), 1)
@@ -0,0 +1,111 @@
+from io import StringIO
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.core.management import call_command, CommandError
+from django.test import TestCase
+from studybuddy import loadtest
+from studybuddy.models import User, Room, Message, Departments
+
+
+class HistogramTest(TestCase):
+    def test_percentiles_and_buckets(self):
+        """
+        samples are summarised as percentiles and counted into buckets that double in size
+        """
+        # given
+        histogram = loadtest.Histogram()
+        for ms in [0.2, 0.9, 1.5, 3, 3, 3, 7, 20, 5000, 100000]:
+            histogram.add(ms)
+
+        # when
+        buckets = dict(histogram.buckets())
+
+        # then
+        self.assertEqual(histogram.summary(), {'p50': 3, 'p95': 100000, 'p99': 100000, 'max': 100000})
+        self.assertEqual((buckets[0.5], buckets[1], buckets[2], buckets[4], buckets[8], buckets[32]), (1, 1, 1, 3, 1, 1))
+        self.assertEqual(buckets[float('inf')], 1)
+        self.assertEqual(sum(buckets.values()), 10)
+
+    def test_chart_leaves_off_empty_ends(self):
+        """
+        the chart starts at the fastest sample's bucket and stops at the slowest's
+        """
+        histogram = loadtest.Histogram()
+        for ms in [3, 3, 10]:
+            histogram.add(ms)
+
+        lines = histogram.chart(width=10).splitlines()
+
+        self.assertEqual(len(lines), 3)
+        self.assertIn('<= 4 ms ##########', lines[0])
+        self.assertTrue(lines[1].endswith(' 0'))
+        self.assertIn('<= 16 ms #####', lines[2])
+
+
+class ChatLoadTest(TestCase):
+    def test_every_message_reaches_its_room(self):
+        """
+        every message sent in the load test reaches every connection in its room and no other
+        """
+        # given
+        members = loadtest.prepare(rooms=2, connections_per_room=3)
+        connections = [(room_pk, loadtest.InProcessConnection(user, room_pk)) for user, room_pk in members]
+
+        # when
+        results = async_to_sync(loadtest.drive)(connections, rate=20, duration=0.3, drain=2)
+
+        # then
+        self.assertEqual((results['connections'], results['rooms'], results['failed_connections']), (6, 2, 0))
+        self.assertGreater(results['sent'], 0)
+        self.assertEqual(results['expected'], results['sent'] * 3)
+        self.assertEqual(results['delivered'], results['expected'])
+        self.assertEqual(len(results['latency']), results['delivered'])
+        self.assertEqual(loadtest.saved_messages({room_pk for user, room_pk in members}), results['sent'])
+
+    def test_cleanup(self):
+        """
+        the load test's users, rooms and messages are removed afterwards without touching anyone else's
+        """
+        # given
+        User.objects.create(email='student@virginia.edu')
+        loadtest.prepare(rooms=2, connections_per_room=2)
+
+        # when
+        loadtest.cleanup()
+
+        # then
+        self.assertEqual(list(User.objects.values_list('email', flat=True)), ['student@virginia.edu'])
+        self.assertFalse(Room.objects.exists())
+        self.assertFalse(get_user_model().objects.exists())
+        self.assertFalse(Departments.objects.filter(dept=loadtest.LOADTEST_SUBJECT).exists())
+
+    def test_load_test_course_is_not_listed(self):
+        """
+        the load test's course doesn't show up in the department directory while it runs
+        """
+        loadtest.prepare(rooms=1, connections_per_room=1)
+
+        self.assertFalse(Departments.objects.filter(dept=loadtest.LOADTEST_SUBJECT).exists())
+
+    def test_command(self):
+        """
+        chat_loadtest prints the throughput, latency and lag and cleans up after itself
+        """
+        out = StringIO()
+
+        call_command('chat_loadtest', rooms=1, connections_per_room=2, rate=10, duration=0.2, drain=1, yes=True,
+                     stdout=out)
+
+        output = out.getvalue()
+        for heading in ('Connections:', 'Delivered:', 'Saved:', 'Latency:', 'Loop lag:', 'Delivery latency:'):
+            self.assertIn(heading, output)
+        self.assertFalse(Message.objects.exists())
+
+    def test_command_needs_confirmation_without_debug(self):
+        """
+        with DEBUG off the command won't touch the database unless --yes is passed
+        """
+        with self.assertRaisesMessage(CommandError, '--yes'):
+            call_command('chat_loadtest', rooms=1, connections_per_room=1, stdout=StringIO())
+
+        self.assertFalse(User.objects.exists())
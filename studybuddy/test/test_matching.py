@@ -0,0 +1,134 @@
+import threading
+from unittest import mock
+from django.urls import reverse
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+from studybuddy.models import User, EnrolledClass
+from studybuddy.matching import match_index, suggest_buddies
+from studybuddy.test.test_utils import create_test_course, reset_indexes
+from studybuddy.test.test_constants import TEST_EMAIL, TEST_USERNAME, TEST_PASSWORD
+
+
+class MatchingTest(TestCase):
+    def setUp(self):
+        reset_indexes(self)
+
+        self.section1 = create_test_course('CS', '3240', 'Sherriff', '001', 1, 'Advanced Software Development')
+        self.section2 = create_test_course('CS', '3240', 'Sherriff', '002', 2, 'Advanced Software Development')
+        self.algorithms = create_test_course('CS', '4102', 'Horton', '001', 3, 'Algorithms')
+        self.probability = create_test_course('APMA', '3100', 'Rhodes', '001', 4, 'Probability')
+
+        self.student = User.objects.create(email=TEST_EMAIL, major='Computer Science')
+        self.same_section = self.create_student('section@email.com', self.section1)
+        self.same_course = self.create_student('course@email.com', self.section2)
+        self.same_subject = self.create_student('subject@email.com', self.algorithms)
+        self.nothing_shared = self.create_student('nothing@email.com', self.probability)
+        EnrolledClass.objects.create(student=self.student, course=self.section1)
+
+    def create_student(self, email, course, major=''):
+        student = User.objects.create(email=email, major=major)
+        EnrolledClass.objects.create(student=student, course=course)
+        return student
+
+    def suggested(self, student=None):
+        return [suggestion['user'] for suggestion in suggest_buddies(student or self.student, limit=10)]
+
+    def test_closer_enrollments_rank_higher(self):
+        """
+        the same section ranks above the same course, which ranks above the same department,
+        and students with nothing in common aren't suggested
+        """
+        self.assertEqual(self.suggested(), [self.same_section, self.same_course, self.same_subject])
+
+    def test_mutual_friends_and_major(self):
+        """
+        mutual friends and a shared major move a student up
+        """
+        # given
+        for email in ['friend1@email.com', 'friend2@email.com']:
+            friend = User.objects.create(email=email)
+            self.student.friends.add(friend)
+            self.same_subject.friends.add(friend)
+        User.objects.filter(pk=self.same_subject.pk).update(major='Computer Science')
+        match_index.reset()
+
+        # when
+        suggestions = suggest_buddies(self.student, limit=10)
+
+        # then
+        self.assertEqual(suggestions[1]['user'], self.same_subject)
+        self.assertEqual(suggestions[1]['mutual_friends'], 2)
+        self.assertTrue(suggestions[1]['same_major'])
+
+    def test_friends_are_not_suggested(self):
+        """
+        students who are already friends aren't suggested, even when they are in the same section
+        """
+        # given
+        self.suggested()
+
+        # when
+        self.student.friends.add(self.same_section)
+
+        # then
+        self.assertNotIn(self.same_section, self.suggested())
+
+    def test_enrollment_changes_update_suggestions(self):
+        """
+        enrolling and leaving courses changes suggestions without reloading everything
+        """
+        # given
+        self.suggested()
+
+        # when
+        EnrolledClass.objects.create(student=self.student, course=self.probability)
+        EnrolledClass.objects.filter(student=self.student, course=self.section1).delete()
+
+        # then
+        with self.assertNumQueries(1):
+            suggested = self.suggested()
+        self.assertEqual(suggested, [self.nothing_shared])
+
+    def test_expired_index_reloads_in_background(self):
+        """
+        once the index is older than its max age, suggestions keep using it while it is reloaded on
+        another thread instead of the request waiting for the reload
+        """
+        # given
+        self.suggested()
+        match_index.loaded_at -= match_index.max_age + 1
+        reloading = threading.Event()
+        finish = threading.Event()
+
+        def slow_load():
+            reloading.set()
+            finish.wait(5)
+
+        # when
+        with mock.patch.object(match_index, 'load', slow_load):
+            with self.assertNumQueries(1):
+                suggested = self.suggested()
+            reloading.wait(5)
+            self.suggested()
+            reloading_while_slow = match_index.reloading
+            finish.set()
+
+        # then
+        self.assertEqual(suggested, [self.same_section, self.same_course, self.same_subject])
+        self.assertTrue(reloading_while_slow)
+
+    def test_homepage_shows_suggestions(self):
+        """
+        the homepage suggests study buddies with a button to send them a friend request
+        """
+        # given
+        get_user_model().objects.create_user(TEST_USERNAME, TEST_EMAIL, TEST_PASSWORD)
+        self.client.login(username=TEST_USERNAME, password=TEST_PASSWORD)
+
+        # when
+        response = self.client.get(reverse('studybuddy:index'))
+
+        # then
+        self.assertEqual([buddy['user'] for buddy in response.context['buddies']],
+                         [self.same_section, self.same_course, self.same_subject])
+        self.assertContains(response, '1 of your sections')
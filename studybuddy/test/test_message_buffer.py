@@ -0,0 +1,141 @@
+import asyncio
+from unittest import mock
+from asgiref.sync import async_to_sync
+from django.db import OperationalError
+from django.test import TestCase
+from studybuddy.models import User, Room, Post, Message
+from studybuddy.message_buffer import MessageBuffer
+from studybuddy.test.test_utils import create_default_test_course
+from studybuddy.test.test_constants import TEST_EMAIL, TEST_EMAIL2, TEST_ROOM_NAME, TEST_TOPIC
+
+
+class MessageBufferTest(TestCase):
+    def setUp(self):
+        self.test_User = User.objects.create(email=TEST_EMAIL)
+        test_post = Post.objects.create(topic=TEST_TOPIC, course=create_default_test_course(), user=self.test_User)
+        self.test_room = Room.objects.create(name=TEST_ROOM_NAME, post=test_post)
+
+        self.buffer = MessageBuffer(max_size=3, flush_interval=0)
+
+    def test_add_does_not_save(self):
+        """
+        queued messages are not written to the database until the buffer is flushed
+        """
+        # when
+        self.buffer.add(TEST_EMAIL, self.test_room.pk, 'hello')
+
+        # then
+        self.assertEqual(len(self.buffer), 1)
+        self.assertEqual(Message.objects.count(), 0)
+
+    def test_flush_saves_all_messages(self):
+        """
+        flushing writes every queued message and empties the buffer
+        """
+        # given
+        self.buffer.add(TEST_EMAIL, self.test_room.pk, 'first')
+        self.buffer.add(TEST_EMAIL, self.test_room.pk, 'second')
+
+        # when
+        saved = self.buffer.flush()
+
+        # then
+        self.assertEqual(saved, 2)
+        self.assertEqual(len(self.buffer), 0)
+        self.assertEqual(list(Message.objects.values_list('content', flat=True)), ['first', 'second'])
+
+    def test_flush_in_constant_queries(self):
+        """
+        a flush checks the senders and rooms once and saves every message in one insert
+        """
+        # given
+        for i in range(self.buffer.max_size - 1):
+            self.buffer.add(TEST_EMAIL, self.test_room.pk, str(i))
+
+        # then
+        with self.assertNumQueries(3):
+            self.buffer.flush()
+
+    def test_flush_drops_unknown_senders_and_rooms(self):
+        """
+        messages from users or to rooms that no longer exist are not saved
+        """
+        # given
+        self.buffer.add(TEST_EMAIL2, self.test_room.pk, 'unknown user')
+        self.buffer.add(TEST_EMAIL, self.test_room.pk + 1, 'unknown room')
+        self.buffer.add(TEST_EMAIL, self.test_room.pk, 'valid')
+
+        # when
+        saved = self.buffer.flush()
+
+        # then
+        self.assertEqual(saved, 1)
+        self.assertEqual(Message.objects.get().content, 'valid')
+
+    def test_full_buffer_flushes_on_enqueue(self):
+        """
+        once the buffer reaches its size limit the messages are saved right away
+        """
+        # when
+        for i in range(self.buffer.max_size):
+            async_to_sync(self.buffer.enqueue)(TEST_EMAIL, self.test_room.pk, str(i))
+
+        # then
+        self.assertEqual(len(self.buffer), 0)
+        self.assertEqual(Message.objects.count(), self.buffer.max_size)
+
+    def test_message_queued_during_timed_flush(self):
+        """
+        a message queued while the timer is saving the ones before it is saved by a timer of its own
+        """
+        # given
+        flush = self.buffer.aflush
+        flushes = []
+
+        async def enqueue_while_flushing():
+            saved = await flush()
+            flushes.append(saved)
+            if len(flushes) == 1:
+                await self.buffer.enqueue(TEST_EMAIL, self.test_room.pk, 'during')
+            return saved
+
+        # when
+        with mock.patch.object(self.buffer, 'aflush', enqueue_while_flushing):
+            async_to_sync(self.enqueue_and_wait)('before')
+
+        # then
+        self.assertEqual(list(Message.objects.values_list('content', flat=True)), ['before', 'during'])
+        self.assertEqual(len(self.buffer), 0)
+
+    async def enqueue_and_wait(self, content):
+        await self.buffer.enqueue(TEST_EMAIL, self.test_room.pk, content)
+        for _ in range(100):
+            await asyncio.sleep(0.01)
+            if self.buffer._timer is None and not len(self.buffer):
+                return
+
+    def test_failed_flush_keeps_messages(self):
+        """
+        when saving fails the messages go back in the buffer, ahead of newer ones, to be tried again
+        """
+        # given
+        self.buffer.add(TEST_EMAIL, self.test_room.pk, 'first')
+
+        # when
+        with mock.patch('studybuddy.message_buffer.Message.objects.bulk_create',
+                        side_effect=OperationalError('database is locked')), \
+                self.assertLogs('studybuddy.message_buffer', 'ERROR'):
+            saved = self.buffer.flush()
+        self.buffer.add(TEST_EMAIL, self.test_room.pk, 'second')
+
+        # then
+        self.assertEqual(saved, 0)
+        self.assertEqual(self.buffer.flush(), 2)
+        self.assertEqual(list(Message.objects.values_list('content', flat=True)), ['first', 'second'])
+
+    def test_flush_with_nothing_queued(self):
+        """
+        flushing an empty buffer does not touch the database
+        """
+        with self.assertNumQueries(0):
+            self.assertEqual(self.buffer.flush(), 0)
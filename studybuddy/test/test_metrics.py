@@ -0,0 +1,188 @@
+import json
+import os
+import tempfile
+from asgiref.sync import async_to_sync
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth import get_user_model
+from django.test import TestCase, SimpleTestCase, override_settings
+from django.urls import reverse
+from studybuddy import metrics
+from studybuddy.models import User, Room, Post
+from studybuddy.routing import websocket_urlpatterns
+from studybuddy.test.test_utils import create_default_test_course
+from studybuddy.test.test_constants import TEST_EMAIL, TEST_USERNAME, TEST_PASSWORD, TEST_ROOM_NAME, TEST_TOPIC
+
+
+def value(metric, **labels):
+    found = metric.values.get(metric.key(labels), 0)
+    # histograms are counted by how many times they were observed
+    return found[2] if isinstance(found, list) else found
+
+
+class RenderTest(SimpleTestCase):
+    def test_text_format(self):
+        """
+        counters are one line per set of labels, histograms are cumulative buckets with a sum and count
+        """
+        # given
+        snapshot = {
+            'requests_total': {'kind': 'counter', 'help': 'Requests', 'labels': ['view'], 'buckets': [],
+                               'values': [[['rooms'], 3], [['say "hi"'], 1]]},
+            'duration_seconds': {'kind': 'histogram', 'help': 'Time', 'labels': [], 'buckets': [0.1, 1],
+                                 'values': [[[], [[2, 1, 1], 3.5, 4]]]},
+        }
+
+        # when
+        text = metrics.render(snapshot)
+
+        # then
+        self.assertEqual(text.splitlines(), [
+            '# HELP duration_seconds Time',
+            '# TYPE duration_seconds histogram',
+            'duration_seconds_bucket{le="0.1"} 2',
+            'duration_seconds_bucket{le="1"} 3',
+            'duration_seconds_bucket{le="+Inf"} 4',
+            'duration_seconds_sum 3.5',
+            'duration_seconds_count 4',
+            '# HELP requests_total Requests',
+            '# TYPE requests_total counter',
+            'requests_total{view="rooms"} 3',
+            'requests_total{view="say \\"hi\\""} 1',
+        ])
+
+    def test_merge(self):
+        """
+        counters and histograms from several processes are added up
+        """
+        first = {'hits': {'kind': 'counter', 'help': '', 'labels': ['view'], 'buckets': [],
+                          'values': [[['a'], 1], [['b'], 2]]},
+                 'time': {'kind': 'histogram', 'help': '', 'labels': [], 'buckets': [1],
+                          'values': [[[], [[1, 0], 0.5, 1]]]}}
+        second = {'hits': {'kind': 'counter', 'help': '', 'labels': ['view'], 'buckets': [],
+                           'values': [[['a'], 10]]},
+                  'time': {'kind': 'histogram', 'help': '', 'labels': [], 'buckets': [1],
+                           'values': [[[], [[0, 1], 2.0, 1]]]}}
+
+        merged = metrics.merge([first, second])
+
+        self.assertEqual(sorted(merged['hits']['values']), [[['a'], 11], [['b'], 2]])
+        self.assertEqual(merged['time']['values'], [[[], [[1, 1], 2.5, 2]]])
+
+
+class CollectTest(SimpleTestCase):
+    def test_processes_are_added_up(self):
+        """
+        with METRICS_DIR every process's metrics are served, gauges from processes that have exited are left out
+        """
+        # given
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        exited = {'studybuddy_websocket_connections': {'kind': 'gauge', 'help': '', 'labels': [], 'buckets': [],
+                                                       'values': [[[], 50]]},
+                  'studybuddy_chat_messages_received_total': {'kind': 'counter', 'help': '', 'labels': [],
+                                                              'buckets': [], 'values': [[[], 1000]]}}
+        with open(os.path.join(directory.name, 'metrics-999999999.json'), 'w') as file:
+            json.dump(exited, file)
+
+        # when
+        with override_settings(METRICS_DIR=directory.name):
+            collected = metrics.collect()
+
+        # then
+        self.assertTrue(os.path.exists(os.path.join(directory.name, 'metrics-%d.json' % os.getpid())))
+        received = dict((tuple(labels), count) for labels, count in
+                        collected['studybuddy_chat_messages_received_total']['values'])
+        self.assertEqual(received[()], 1000 + value(metrics.CHAT_RECEIVED))
+        open_connections = dict((tuple(labels), count) for labels, count in
+                                collected['studybuddy_websocket_connections']['values'])
+        self.assertEqual(open_connections.get((), 0), value(metrics.WEBSOCKET_OPEN))
+
+
+class MetricsViewTest(TestCase):
+    def setUp(self):
+        self.test_User = User.objects.create(email=TEST_EMAIL)
+        self.test_user = get_user_model().objects.create_user(TEST_USERNAME, TEST_EMAIL, TEST_PASSWORD)
+        self.client.login(username=TEST_USERNAME, password=TEST_PASSWORD)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_views_are_measured(self):
+        """
+        every request to a studybuddy view is counted, timed and has its queries counted under the url name
+        """
+        # given
+        requests = value(metrics.HTTP_REQUESTS, view='rooms', method='GET', status=200)
+        timed = value(metrics.HTTP_DURATION, view='rooms')
+
+        # when
+        self.client.get(reverse('studybuddy:rooms'))
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret')
+
+        # then
+        self.assertEqual(value(metrics.HTTP_REQUESTS, view='rooms', method='GET', status=200), requests + 1)
+        self.assertEqual(value(metrics.HTTP_DURATION, view='rooms'), timed + 1)
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        text = response.content.decode()
+        self.assertIn('studybuddy_http_requests_total{view="rooms",method="GET",status="200"} %d' % (requests + 1),
+                      text)
+        self.assertIn('studybuddy_http_db_queries_count{view="rooms"}', text)
+        self.assertIn('studybuddy_channel_layer_messages 0', text)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_token(self):
+        """
+        with METRICS_TOKEN set only scrapers that send it get the metrics
+        """
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 401)
+        self.assertEqual(self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer sécret').status_code, 401)
+        self.assertEqual(self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret').status_code, 200)
+
+    @override_settings(METRICS_TOKEN='')
+    def test_no_token(self):
+        """
+        without METRICS_TOKEN the metrics are hidden unless DEBUG is on
+        """
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 404)
+        with override_settings(DEBUG=True):
+            self.assertEqual(self.client.get(reverse('metrics')).status_code, 200)
+
+
+class ChatMetricsTest(TestCase):
+    def setUp(self):
+        self.test_User = User.objects.create(email=TEST_EMAIL, name='testName')
+        post = Post.objects.create(topic=TEST_TOPIC, course=create_default_test_course(), user=self.test_User)
+        self.room = Room.objects.create(name=TEST_ROOM_NAME, post=post)
+        self.room.users.add(self.test_User)
+        self.test_user = get_user_model().objects.create_user(TEST_USERNAME, TEST_EMAIL, TEST_PASSWORD)
+
+    async def chat(self, room_pk):
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), '/studybuddy/chat/rooms/%s/' % room_pk)
+        communicator.scope['user'] = self.test_user
+        connected, _ = await communicator.connect()
+        if connected:
+            self.open_while_connected = value(metrics.WEBSOCKET_OPEN)
+            await communicator.send_json_to({'message': 'hello'})
+            await communicator.receive_json_from()
+            await communicator.disconnect()
+
+    def test_chat_is_measured(self):
+        """
+        connections are counted while they are open, and messages as they are received and delivered
+        """
+        # given
+        before = {metric: value(metric) for metric in (metrics.WEBSOCKET_OPEN, metrics.CHAT_RECEIVED,
+                                                       metrics.CHAT_DELIVERED, metrics.CHAT_RECEIVE_DURATION)}
+        accepted = value(metrics.WEBSOCKET_CONNECTS, result='accepted')
+        rejected = value(metrics.WEBSOCKET_CONNECTS, result='rejected')
+
+        # when
+        async_to_sync(self.chat)(self.room.pk)
+        async_to_sync(self.chat)(self.room.pk + 1)
+
+        # then
+        self.assertEqual(self.open_while_connected, before[metrics.WEBSOCKET_OPEN] + 1)
+        self.assertEqual(value(metrics.WEBSOCKET_OPEN), before[metrics.WEBSOCKET_OPEN])
+        self.assertEqual(value(metrics.WEBSOCKET_CONNECTS, result='accepted'), accepted + 1)
+        self.assertEqual(value(metrics.WEBSOCKET_CONNECTS, result='rejected'), rejected + 1)
+        for metric in (metrics.CHAT_RECEIVED, metrics.CHAT_DELIVERED, metrics.CHAT_RECEIVE_DURATION):
+            self.assertEqual(value(metric), before[metric] + 1)
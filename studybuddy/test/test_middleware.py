@@ -0,0 +1,62 @@
+from django.urls import reverse
+from django.test import TestCase
+from django.test.client import RequestFactory
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from studybuddy.models import User
+from studybuddy.middleware import get_student, get_student_name
+from studybuddy.test.test_constants import TEST_USERNAME, TEST_EMAIL, TEST_PASSWORD
+
+
+class CurrentStudentTest(TestCase):
+    def setUp(self):
+        self.test_User = User.objects.create(email=TEST_EMAIL, name='testName')
+
+        self.test_user = get_user_model().objects.create_user(TEST_USERNAME, TEST_EMAIL, TEST_PASSWORD)
+        self.test_request = RequestFactory().get('/studybuddy/')
+        self.test_request.user = self.test_user
+
+    def test_student_is_looked_up_once(self):
+        """
+        the profile is only queried the first time it is asked for during a request
+        """
+        with self.assertNumQueries(1):
+            self.assertEqual(get_student(self.test_request), self.test_User)
+            self.assertEqual(get_student(self.test_request), self.test_User)
+
+    def test_anonymous_user_has_no_student(self):
+        """
+        nobody is logged in, so there is no profile and nothing is queried
+        """
+        self.test_request.user = AnonymousUser()
+
+        with self.assertNumQueries(0):
+            self.assertIsNone(get_student(self.test_request))
+
+    def test_student_name(self):
+        """
+        the navigation bar shows the student's name
+        """
+        self.assertEqual(get_student_name(self.test_request), 'testName')
+
+    def test_student_name_falls_back_to_login(self):
+        """
+        when the student hasn't set a name, the navigation bar shows their login instead
+        """
+        # given
+        User.objects.filter(email=TEST_EMAIL).update(name='')
+
+        # then
+        self.assertEqual(get_student_name(self.test_request), self.test_user)
+
+    def test_page_queries_profile_once(self):
+        """
+        a page that uses the profile in the view and the navigation bar still only queries it once
+        (session, auth user, profile)
+        """
+        self.client.login(username=TEST_USERNAME, password=TEST_PASSWORD)
+
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('studybuddy:editAccount'))
+
+        self.assertContains(response, 'testName')
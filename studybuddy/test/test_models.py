@@ -1,5 +1,6 @@
+from django.db import IntegrityError
 from django.test import TestCase
-from studybuddy.models import User, Course, Post, StudySession, EnrolledClass
+from studybuddy.models import User, Course, Post, StudySession, EnrolledClass, Friend_Request
 from studybuddy.test.test_constants import \
     TEST_SUBJECT, \
     TEST_CATALOG_NUMBER, \
@@ -82,6 +83,35 @@ class EnrollTest(TestCase):
         self.assertEqual(num_enrolled_course, 1)
 
 
+class UniqueConstraintTest(TestCase):
+    def setUp(self):
+        self.test_user1 = User.objects.create(email="abc4@gmail.com")
+        self.test_user2 = User.objects.create(email="abc5@gmail.com")
+        self.test_course = Course.objects.create(subject=TEST_SUBJECT,
+                                                 catalog_number=TEST_CATALOG_NUMBER,
+                                                 instructor=TEST_INSTRUCTOR,
+                                                 section=TEST_SECTION,
+                                                 course_number=TEST_COURSE_NUMBER,
+                                                 description=TEST_DESCRIPTION)
+
+    def test_enrolled_once(self):
+        """
+        a student can't be enrolled in the same course twice
+        """
+        EnrolledClass.objects.create(course=self.test_course, student=self.test_user1)
+        with self.assertRaises(IntegrityError):
+            EnrolledClass.objects.create(course=self.test_course, student=self.test_user1)
+
+    def test_one_friend_request_per_pair(self):
+        """
+        a user can only have one pending friend request to another user, though the other user can send one back
+        """
+        Friend_Request.objects.create(from_user=self.test_user1, to_user=self.test_user2)
+        Friend_Request.objects.create(from_user=self.test_user2, to_user=self.test_user1)
+        with self.assertRaises(IntegrityError):
+            Friend_Request.objects.create(from_user=self.test_user1, to_user=self.test_user2)
+
+
 class PostTest(TestCase):
     def setUp(self):
         self.test_course = Course.objects.create(subject=TEST_SUBJECT,
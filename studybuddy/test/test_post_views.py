@@ -3,10 +3,11 @@
 from unittest import mock
 from django.urls import reverse
 from django.test import TestCase
-from studybuddy.models import Course, User
+from studybuddy.models import Course, User, Post, EnrolledClass
 from django.test.client import RequestFactory
 from django.contrib.auth import get_user_model
 from studybuddy.views.post_views import viewposts
+from studybuddy.test.test_utils import create_test_course
 from studybuddy.test.test_constants import TEST_USERNAME, TEST_EMAIL, TEST_PASSWORD, TEST_SUBJECT
 
 
@@ -160,3 +161,25 @@ class ViewPostViewTest(TestCase):
         # then
         self.assertEqual(response.status_code, 200)
         mock_deletepost.assert_called_once_with(test_view_delete_request)
+
+    def test_posts_split_by_enrollment_in_fixed_queries(self):
+        """
+        posts for courses the user left are listed separately, and many posts still take a fixed number
+        of queries (session, auth user, profile, enrolled courses, posts, unenrolled posts)
+        """
+        # given
+        student = User.objects.create(email=TEST_EMAIL)
+        enrolled = create_test_course(TEST_SUBJECT, '1000', 'testInstructor', '001', 1, 'enrolled')
+        left = create_test_course(TEST_SUBJECT, '2000', 'testInstructor', '001', 2, 'left')
+        EnrolledClass.objects.create(student=student, course=enrolled)
+        enrolled_posts = [Post.objects.create(course=enrolled, user=student) for _ in range(20)]
+        unenrolled_posts = [Post.objects.create(course=left, user=student) for _ in range(20)]
+
+        # when
+        with self.assertNumQueries(6):
+            response = self.client.get(reverse('studybuddy:viewposts'))
+
+        # then
+        self.assertEqual(list(response.context['unenrolled_posts']), unenrolled_posts)
+        self.assertEqual(list(response.context['user_posts']), enrolled_posts + unenrolled_posts)
+        self.assertNotIn('no_courses_and_post', response.context)
@@ -0,0 +1,126 @@
+import json
+import shutil
+import tempfile
+from io import StringIO
+from pathlib import Path
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.contrib.auth import get_user_model
+from studybuddy.models import User
+from studybuddy.profiling import ProfilingMiddleware, RequestProfile, aggregate
+from studybuddy.test.test_constants import TEST_EMAIL, TEST_USERNAME, TEST_PASSWORD
+
+PROFILES = tempfile.mkdtemp()
+
+
+@override_settings(PROFILING_TOKEN='secret', PROFILING_SAMPLE_RATE=0, PROFILING_DIR=PROFILES,
+                   PROFILING_SAMPLE_INTERVAL=0.0005)
+class ProfilingMiddlewareTest(TestCase):
+    def setUp(self):
+        self.addCleanup(shutil.rmtree, PROFILES, True)
+        User.objects.create(email=TEST_EMAIL)
+        get_user_model().objects.create_user(TEST_USERNAME, TEST_EMAIL, TEST_PASSWORD)
+        self.client.login(username=TEST_USERNAME, password=TEST_PASSWORD)
+
+    def test_requested_profile(self):
+        """
+        a request with the header and token is profiled: its statements with where in the views
+        they came from, its templates and a CPU profile are saved under the id in the response
+        """
+        # when
+        response = self.client.get(reverse('studybuddy:upcomingSessions'), HTTP_X_PROFILE='secret')
+
+        # then
+        profile_id = response['X-Profile-Id']
+        self.assertIn('sql;dur=', response['Server-Timing'])
+        profile = json.loads((Path(PROFILES) / (profile_id + '.json')).read_text())
+        self.assertEqual(profile['view'], 'studybuddy:upcomingSessions')
+        self.assertEqual(profile['queries'], sum(query['count'] for query in profile['sql']))
+        self.assertTrue(any(query['site'].startswith('views/study_session_views.py:') for query in profile['sql']))
+        self.assertIn('schedule_sessions/upcomingSessions.html', profile['templates'])
+        self.assertTrue((Path(PROFILES) / (profile_id + '.collapsed')).exists())
+        self.assertEqual(len((Path(PROFILES) / 'requests.jsonl').read_text().splitlines()), 1)
+
+    def test_not_requested(self):
+        """
+        requests without the header, or with the wrong token (even one that isn't ASCII), aren't profiled
+        """
+        for headers in ({}, {'HTTP_X_PROFILE': 'guess'}, {'HTTP_X_PROFILE': 'sécret'}):
+            response = self.client.get(reverse('studybuddy:upcomingSessions'), **headers)
+
+            self.assertEqual(response.status_code, 200)
+            self.assertFalse(response.has_header('X-Profile-Id'))
+            self.assertFalse(response.has_header('Server-Timing'))
+        self.assertFalse((Path(PROFILES) / 'requests.jsonl').exists())
+
+    @override_settings(PROFILING_SAMPLE_RATE=1)
+    def test_sampled_requests_are_recorded_and_reported(self):
+        """
+        sampled requests are summarised in requests.jsonl, which profile_report adds up by view
+        """
+        # given
+        for _ in range(3):
+            self.client.get(reverse('studybuddy:upcomingSessions'))
+        self.client.get(reverse('studybuddy:rooms'))
+        out = StringIO()
+        output = Path(PROFILES) / 'report.json'
+
+        # when
+        call_command('profile_report', output=str(output), stdout=out)
+
+        # then
+        report = json.loads(output.read_text())
+        self.assertEqual(report['studybuddy:upcomingSessions']['requests'], 3)
+        self.assertEqual(report['studybuddy:rooms']['requests'], 1)
+        self.assertIn('studybuddy:upcomingSessions', out.getvalue())
+        self.assertFalse(list(Path(PROFILES).glob('*.collapsed')))
+
+    @override_settings(PROFILING_TOKEN='')
+    def test_off_without_token_or_rate(self):
+        """
+        with nothing able to turn profiling on the middleware takes itself out of the stack
+        """
+        with self.assertRaises(MiddlewareNotUsed):
+            ProfilingMiddleware(lambda request: None)
+
+
+class RequestProfileTest(TestCase):
+    def test_duplicates_grouped_by_call_site(self):
+        """
+        the same statement run in a loop is counted once per place it was run from
+        """
+        # given
+        profile = RequestProfile('/')
+
+        # when
+        with connection.execute_wrapper(profile.execute):
+            for email in ('a@email.com', 'b@email.com', 'c@email.com'):
+                User.objects.filter(email=email).first()
+            User.objects.count()
+
+        # then
+        duplicates = profile.duplicates()
+        self.assertEqual(len(duplicates), 1)
+        sql, site, count, seconds = duplicates[0]
+        self.assertEqual(count, 3)
+        self.assertTrue(site.startswith('test/test_profiling.py:'))
+        self.assertEqual(profile.summary('view', 200)['duplicate_queries'], 2)
+
+    def test_aggregate(self):
+        """
+        requests are added up by view, slowest on average first
+        """
+        lines = [json.dumps({'view': view, 'path': '/', 'ms': ms, 'queries': queries, 'sql_ms': 1.0,
+                             'duplicate_queries': 0, 'templates': {'page.html': {'renders': 1, 'ms': 2.0}}})
+                 for view, ms, queries in [('fast', 10, 2), ('slow', 100, 8), ('slow', 50, 4)]]
+
+        views = aggregate(lines)
+
+        self.assertEqual(list(views), ['slow', 'fast'])
+        self.assertEqual(views['slow']['requests'], 2)
+        self.assertEqual(views['slow']['avg_ms'], 75)
+        self.assertEqual(views['slow']['max_queries'], 8)
+        self.assertEqual(views['slow']['avg_template_ms'], {'page.html': 2.0})
@@ -1,10 +1,19 @@
 # Sources: https://developer.mozilla.org/en-US/docs/Learn/Server-side/Django/Testing
 #          https://stackoverflow.com/questions/58839125/how-to-test-if-a-method-is-called-in-django-rest-framework
+import datetime
+import random
+import threading
+import time
+from unittest.mock import patch
 from django.urls import reverse
-from django.test import TestCase
+from django.db import connection, OperationalError
+from django.db.models import QuerySet
+from django.test import TestCase, TransactionTestCase
 from django.test.client import RequestFactory
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth import get_user_model
-from studybuddy.models import User, Room, Post, Course
+from django.utils import timezone
+from studybuddy.models import User, Room, Post, Course, Message, RoomReadState
 from studybuddy.test.test_constants import \
     TEST_USERNAME, \
     TEST_EMAIL, \
@@ -17,7 +26,9 @@ from studybuddy.test.test_constants import \
     TEST_INSTRUCTOR, \
     TEST_CATALOG_NUMBER, \
     TEST_TOPIC, TEST_PK, TEST_EMAIL2
-from studybuddy.views.room_views import room
+from studybuddy.views.room_views import room, addRoom, rooms_with_activity, get_message_page, parse_cursor, \
+    MESSAGE_PAGE_SIZE
+from studybuddy.test.test_utils import create_default_test_course
 
 
 class RoomsViewTest(TestCase):
@@ -85,6 +96,97 @@ class RoomsViewTest(TestCase):
         # then
         self.assertContains(response, TEST_ROOM_NAME)
 
+    def test_rooms_show_last_message_unread_and_members(self):
+        """
+        each room shows its last message, the messages the user hasn't read and how many members it
+        has, most recently active room first, all in one query
+        """
+        # given
+        friend = User.objects.create(email=TEST_EMAIL2, name='Friend')
+        course = create_default_test_course()
+        now = timezone.now()
+        quiet, busy, empty = [Room.objects.create(name='room %d' % i, post=Post.objects.create(course=course, user=friend))
+                              for i in range(3)]
+        for room in (quiet, busy, empty):
+            room.users.add(self.test_User)
+        busy.users.add(friend)
+
+        Message.objects.create(room=quiet, user=self.test_User, content='old news')
+        for content in ('read', 'unread', 'also unread'):
+            Message.objects.create(room=busy, user=friend, content=content)
+        Message.objects.create(room=busy, user=self.test_User, content='mine')
+        Message.objects.filter(room=quiet).update(date_added=now - datetime.timedelta(days=2))
+        for minutes, content in enumerate(('read', 'unread', 'also unread', 'mine')):
+            Message.objects.filter(content=content).update(date_added=now - datetime.timedelta(minutes=10 - minutes))
+        RoomReadState.objects.create(user=self.test_User, room=busy, last_read=now - datetime.timedelta(minutes=9, seconds=30))
+
+        # when
+        with self.assertNumQueries(1):
+            rooms = list(rooms_with_activity(self.test_User))
+            [str(room) for room in rooms]
+
+        # then
+        self.assertEqual(rooms, [busy, quiet, empty])
+        self.assertEqual([room.last_message for room in rooms], ['mine', 'old news', None])
+        self.assertEqual([room.unread_count for room in rooms], [2, 0, 0])
+        self.assertEqual([room.member_count for room in rooms], [2, 1, 1])
+
+    def test_never_opened_room_is_all_unread(self):
+        """
+        every message from someone else is unread in a room the user has never opened
+        """
+        # given
+        friend = User.objects.create(email=TEST_EMAIL2)
+        room = Room.objects.create(name=TEST_ROOM_NAME, post=Post.objects.create(course=create_default_test_course(), user=friend))
+        room.users.add(self.test_User, friend)
+        for content in ('one', 'two'):
+            Message.objects.create(room=room, user=friend, content=content)
+
+        # when
+        response = self.client.get(reverse('studybuddy:rooms'))
+
+        # then
+        self.assertContains(response, '2 unread')
+        self.assertContains(response, '2 members')
+
+    def test_opening_room_marks_it_read(self):
+        """
+        after the user opens a room its messages aren't unread any more
+        """
+        # given
+        friend = User.objects.create(email=TEST_EMAIL2)
+        room = Room.objects.create(name=TEST_ROOM_NAME, post=Post.objects.create(course=create_default_test_course(), user=friend))
+        room.users.add(self.test_User, friend)
+        Message.objects.create(room=room, user=friend, content='hello')
+
+        # when
+        self.client.get(reverse('studybuddy:room', args=[room.pk]))
+
+        # then
+        self.assertEqual(rooms_with_activity(self.test_User).get().unread_count, 0)
+        self.assertNotContains(self.client.get(reverse('studybuddy:rooms')), 'unread')
+
+    def test_reopening_unchanged_room_does_not_write(self):
+        """
+        opening a room again with no new messages leaves the read marker alone instead of writing on every view
+        """
+        # given
+        friend = User.objects.create(email=TEST_EMAIL2)
+        room = Room.objects.create(name=TEST_ROOM_NAME, post=Post.objects.create(course=create_default_test_course(), user=friend))
+        room.users.add(self.test_User, friend)
+        Message.objects.create(room=room, user=friend, content='hello')
+        self.client.get(reverse('studybuddy:room', args=[room.pk]))
+        last_read = RoomReadState.objects.get().last_read
+
+        # when
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('studybuddy:room', args=[room.pk]))
+
+        # then
+        self.assertEqual(RoomReadState.objects.get().last_read, last_read)
+        self.assertFalse([query for query in queries if 'studybuddy_roomreadstate' in query['sql']
+                          and not query['sql'].startswith('SELECT')])
+
 
 class RoomViewTest(TestCase):
     def setUp(self):
@@ -206,3 +308,252 @@ class RoomViewTest(TestCase):
         self.assertEqual(response.status_code, 302)
         self.assertEqual(self.test_room.users.all().count(), 1)
         self.assertEqual(Room.objects.all().count(), 1)
+
+
+class RoomMessagesViewTest(TestCase):
+    def setUp(self):
+        self.test_User = User.objects.create(email=TEST_EMAIL)
+
+        test_course = Course.objects.create(subject=TEST_SUBJECT.upper(),
+                                            catalog_number=TEST_CATALOG_NUMBER,
+                                            instructor=TEST_INSTRUCTOR,
+                                            section=TEST_SECTION,
+                                            course_number=TEST_COURSE_NUMBER,
+                                            description=TEST_DESCRIPTION)
+
+        test_post = Post.objects.create(topic=TEST_TOPIC, course=test_course, user=self.test_User)
+        self.test_room = Room.objects.create(name=TEST_ROOM_NAME, post=test_post)
+        self.test_room.users.add(self.test_User)
+
+        self.message_count = MESSAGE_PAGE_SIZE + 5
+        for i in range(self.message_count):
+            Message.objects.create(room=self.test_room, user=self.test_User, content='message ' + str(i))
+
+        # mock user login
+        self.test_user = get_user_model().objects.create_user(TEST_USERNAME, TEST_EMAIL, TEST_PASSWORD)
+        self.client.login(username=TEST_USERNAME, password=TEST_PASSWORD)
+
+    def contents(self, messages):
+        return [message.content for message in messages]
+
+    def test_room_shows_newest_messages(self):
+        """
+        a room shows its newest page of messages, oldest first, with a cursor for older ones
+        """
+        # when
+        response = self.client.get(reverse('studybuddy:room', args=(self.test_room.pk,)))
+
+        # then
+        self.assertEqual(self.contents(response.context['messages']),
+                         ['message ' + str(i) for i in range(5, self.message_count)])
+        self.assertIsNotNone(response.context['older_cursor'])
+        self.assertContains(response, 'Load older messages')
+
+    def test_older_messages_are_loaded_from_cursor(self):
+        """
+        the cursor from the room page returns the page of messages before it
+        """
+        # given
+        cursor = self.client.get(reverse('studybuddy:room', args=(self.test_room.pk,))).context['older_cursor']
+
+        # when
+        response = self.client.get(reverse('studybuddy:roomMessages', args=(self.test_room.pk,)), {'before': cursor})
+
+        # then
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([message['content'] for message in response.json()['messages']],
+                         ['message ' + str(i) for i in range(5)])
+        self.assertIsNone(response.json()['older_cursor'])
+
+    def test_messages_sent_at_the_same_time(self):
+        """
+        messages with the same date_added are neither repeated nor skipped between pages
+        """
+        # given
+        Message.objects.update(date_added=timezone.now())
+        cursor = self.client.get(reverse('studybuddy:room', args=(self.test_room.pk,))).context['older_cursor']
+
+        # when
+        response = self.client.get(reverse('studybuddy:roomMessages', args=(self.test_room.pk,)), {'before': cursor})
+
+        # then
+        self.assertEqual(len(response.json()['messages']), self.message_count - MESSAGE_PAGE_SIZE)
+
+    def test_message_page_queries_do_not_grow(self):
+        """
+        loading a page of messages doesn't query each message's user
+        """
+        # given
+        url = reverse('studybuddy:roomMessages', args=(self.test_room.pk,))
+        self.client.get(url)
+
+        # then (session, auth user, membership check, messages with their users)
+        with self.assertNumQueries(4):
+            self.client.get(url)
+
+    def test_older_page_uses_index_range(self):
+        """
+        an older page starts at the cursor in message_room_date_idx instead of walking every newer message
+        """
+        # given
+        cursor = parse_cursor(self.client.get(reverse('studybuddy:room', args=(self.test_room.pk,)))
+                              .context['older_cursor'])
+
+        statements = []
+
+        def capture(execute, sql, params, many, context):
+            statements.append((sql, params))
+            return execute(sql, params, many, context)
+
+        # when
+        with connection.execute_wrapper(capture):
+            get_message_page(self.test_room.pk, cursor)
+        # explained with the same parameters, SQLite plans literal values differently
+        sql, params = statements[0]
+        with connection.cursor() as db:
+            plan = ' '.join(row[-1] for row in db.execute('EXPLAIN QUERY PLAN ' + sql, params).fetchall())
+
+        # then
+        self.assertIn('message_room_date_idx (room_id=? AND date_added<?)', plan)
+
+    def test_invalid_cursor(self):
+        """
+        a cursor that can't be read is rejected
+        """
+        response = self.client.get(reverse('studybuddy:roomMessages', args=(self.test_room.pk,)), {'before': 'abc'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_non_member_cannot_load_messages(self):
+        """
+        only users in the room can load its messages
+        """
+        # given
+        self.test_room.users.remove(self.test_User)
+
+        # when
+        response = self.client.get(reverse('studybuddy:roomMessages', args=(self.test_room.pk,)))
+
+        # then
+        self.assertEqual(response.status_code, 404)
+
+
+class AddRoomTest(TestCase):
+    def setUp(self):
+        self.author = User.objects.create(email=TEST_EMAIL)
+        self.post = Post.objects.create(course=create_default_test_course(), user=self.author, topic=TEST_TOPIC)
+        self.students = [User.objects.create(email='student%d@email.com' % i) for i in range(2)]
+
+    def message_request(self, student):
+        request = RequestFactory().post('/studybuddy/', {'message': 'message', 'post_pk': self.post.pk})
+        request.user = get_user_model()(username=student.email, email=student.email)
+        return request
+
+    def test_first_message_makes_room(self):
+        """
+        the first user to message about a post makes a room with the post's author, in a fixed number of
+        queries (post, profile, savepoint, get room, savepoint, create room, release savepoint, members,
+        release savepoint)
+        """
+        with self.assertNumQueries(9):
+            room_pk = addRoom(self.message_request(self.students[0]))
+
+        room = Room.objects.get(pk=room_pk)
+        self.assertEqual(room.name, TEST_TOPIC)
+        self.assertEqual(set(room.users.all()), {self.author, self.students[0]})
+
+    def test_later_messages_join_room(self):
+        """
+        everyone who messages about the post joins the same room, and messaging again changes nothing
+        """
+        room_pk = addRoom(self.message_request(self.students[0]))
+
+        self.assertEqual(addRoom(self.message_request(self.students[1])), room_pk)
+        self.assertEqual(addRoom(self.message_request(self.students[1])), room_pk)
+        self.assertEqual(Room.objects.count(), 1)
+        self.assertEqual(set(Room.objects.get(pk=room_pk).users.all()), {self.author, *self.students})
+
+    def test_author_messaging_own_post(self):
+        """
+        the author is only added once when they message about their own post
+        """
+        room_pk = addRoom(self.message_request(self.author))
+
+        self.assertEqual(list(Room.objects.get(pk=room_pk).users.all()), [self.author])
+
+    def test_room_made_by_someone_else_at_the_same_time(self):
+        """
+        when another user's request makes the room after this one looked for it, this one joins that room
+        """
+        # given
+        other_request = self.message_request(self.students[1])
+        get = QuerySet.get
+
+        def room_made_after_lookup(queryset, *args, **kwargs):
+            if queryset.model is Room and not Room.objects.filter(post=self.post).exists():
+                with patch.object(QuerySet, 'get', get):
+                    addRoom(other_request)
+                raise Room.DoesNotExist
+            return get(queryset, *args, **kwargs)
+
+        # when
+        with patch.object(QuerySet, 'get', room_made_after_lookup):
+            room_pk = addRoom(self.message_request(self.students[0]))
+
+        # then
+        self.assertEqual(Room.objects.get().pk, room_pk)
+        self.assertEqual(set(Room.objects.get().users.all()), {self.author, *self.students})
+
+
+class AddRoomConcurrencyTest(TransactionTestCase):
+    def setUp(self):
+        self.author = User.objects.create(email=TEST_EMAIL)
+        self.post = Post.objects.create(course=create_default_test_course(), user=self.author, topic=TEST_TOPIC)
+        self.students = [User.objects.create(email='student%d@email.com' % i) for i in range(8)]
+
+    def retry_while_locked(self, view, request):
+        """
+        the in memory test database locks a table for the whole of a transaction that writes to it and
+        fails other threads straight away instead of waiting, addRoom is atomic so it's safe to run again
+        """
+        for attempt in range(200):
+            try:
+                return view(request)
+            except OperationalError as error:
+                if 'locked' not in str(error):
+                    raise
+                connection.close()
+                time.sleep(random.uniform(0.001, 0.01))
+        return view(request)
+
+    def test_many_users_message_at_once(self):
+        """
+        users messaging about the same post at the same time all end up in one room
+        """
+        # given
+        start = threading.Barrier(len(self.students))
+        room_pks = []
+        errors = []
+
+        def join(student):
+            request = RequestFactory().post('/studybuddy/', {'message': 'message', 'post_pk': self.post.pk})
+            request.user = get_user_model()(username=student.email, email=student.email)
+            try:
+                start.wait()
+                room_pks.append(self.retry_while_locked(addRoom, request))
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connection.close()
+
+        # when
+        threads = [threading.Thread(target=join, args=(student,)) for student in self.students]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # then
+        self.assertEqual(errors, [])
+        self.assertEqual(Room.objects.count(), 1)
+        self.assertEqual(set(room_pks), {Room.objects.get().pk})
+        self.assertEqual(set(Room.objects.get().users.all()), {self.author, *self.students})
@@ -0,0 +1,192 @@
+import datetime
+from django.urls import reverse
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+from studybuddy.models import User, Room, Post, StudySession
+from studybuddy.scheduling import DayCalendar, find_conflicts, free_slots, schedule_sessions
+from studybuddy.test.test_utils import create_default_test_course
+from studybuddy.test.test_constants import TEST_EMAIL, TEST_EMAIL2, TEST_USERNAME, TEST_PASSWORD, TEST_ROOM_NAME
+
+DATE = datetime.date(2030, 1, 7)
+
+
+def at(hour, minute=0):
+    return datetime.time(hour, minute)
+
+
+class DayCalendarTest(TestCase):
+    def setUp(self):
+        self.calendar = DayCalendar([(at(13), at(14), 'lunch'), (at(9), at(12), 'morning'), (at(10), at(11), 'inside')])
+
+    def test_overlaps(self):
+        """
+        a time clashes with any session it overlaps, but not with sessions it only touches
+        """
+        self.assertTrue(self.calendar.overlaps(at(11, 30), at(12, 30)))
+        self.assertFalse(self.calendar.overlaps(at(12), at(13)))
+        self.assertFalse(self.calendar.overlaps(at(14), at(15)))
+        self.assertFalse(self.calendar.overlaps(at(7), at(9)))
+
+    def test_conflicts(self):
+        """
+        a long session that started earlier still clashes with a later time inside it
+        """
+        self.assertEqual(self.calendar.conflicts(at(11, 30), at(13, 30)), ['morning', 'lunch'])
+        self.assertEqual(self.calendar.conflicts(at(10, 30), at(10, 45)), ['morning', 'inside'])
+
+
+class SchedulingTest(TestCase):
+    def setUp(self):
+        self.student = User.objects.create(email=TEST_EMAIL)
+        self.buddy = User.objects.create(email=TEST_EMAIL2)
+
+    def create_session(self, users, date, start, end, accepted='yes'):
+        session = StudySession.objects.create(date=date, start=start, end=end, accepted=accepted)
+        session.users.add(*users)
+        return session
+
+    def test_find_conflicts(self):
+        """
+        only the users who are busy are reported, and declined sessions don't count
+        """
+        # given
+        busy = self.create_session([self.buddy], DATE, at(10), at(11))
+        self.create_session([self.student], DATE, at(10), at(11), accepted='no')
+        self.create_session([self.student], DATE + datetime.timedelta(days=1), at(10), at(11))
+
+        # then
+        self.assertEqual(find_conflicts([TEST_EMAIL, TEST_EMAIL2], DATE, at(10, 30), at(12)), {TEST_EMAIL2: [busy]})
+
+    def test_conflicts_for_large_room_in_one_query(self):
+        """
+        a room of 20 users with hundreds of sessions each is checked in a single query
+        """
+        # given
+        users = User.objects.bulk_create([User(email='user%d@email.com' % i) for i in range(20)])
+        sessions = StudySession.objects.bulk_create([
+            StudySession(date=DATE + datetime.timedelta(days=day), start=at(8 + hour), end=at(9 + hour))
+            for day in range(20) for hour in range(10)])
+        StudySession.users.through.objects.bulk_create([
+            StudySession.users.through(studysession=session, user=user) for session in sessions for user in users])
+        emails = [user.email for user in users]
+
+        # then
+        with self.assertNumQueries(1):
+            conflicts = find_conflicts(emails, DATE, at(12, 30), at(13))
+        self.assertEqual(len(conflicts), 20)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(find_conflicts(emails, DATE, at(18), at(19)), {})
+
+    def test_free_slots(self):
+        """
+        free times are the gaps between everyone's sessions that are long enough
+        """
+        # given
+        self.create_session([self.student], DATE, at(9), at(12))
+        self.create_session([self.buddy], DATE, at(11), at(13))
+        self.create_session([self.buddy], DATE, at(13, 30), at(18))
+
+        # when
+        slots = free_slots([TEST_EMAIL, TEST_EMAIL2], DATE, days=2)
+
+        # then
+        self.assertEqual(slots[DATE], [(at(8), at(9)), (at(18), at(22))])
+        self.assertEqual(slots[DATE + datetime.timedelta(days=1)], [(at(8), at(22))])
+
+    def test_free_slots_today_start_now(self):
+        """
+        today's free times don't include the part of the day that has already passed
+        """
+        now = datetime.datetime.combine(DATE, at(15, 20))
+
+        self.assertEqual(free_slots([TEST_EMAIL], DATE, days=1, now=now)[DATE], [(at(15, 20), at(22))])
+
+
+class ScheduleConflictViewTest(TestCase):
+    def setUp(self):
+        self.student = User.objects.create(email=TEST_EMAIL)
+        self.buddy = User.objects.create(email=TEST_EMAIL2)
+        post = Post.objects.create(course=create_default_test_course(), user=self.student)
+        self.room = Room.objects.create(name=TEST_ROOM_NAME, post=post)
+        self.room.users.add(self.student, self.buddy)
+
+        session = StudySession.objects.create(name='busy', date=DATE, start=at(10), end=at(11), accepted='yes')
+        session.users.add(self.buddy)
+
+        get_user_model().objects.create_user(TEST_USERNAME, TEST_EMAIL, TEST_PASSWORD)
+        self.client.login(username=TEST_USERNAME, password=TEST_PASSWORD)
+
+    def schedule(self, **extra):
+        data = {'schedule': 'schedule', 'date': str(DATE), 'start': '10:30', 'end': '11:30', 'room_pk': self.room.pk}
+        data.update(extra)
+        return self.client.post(reverse('studybuddy:upcomingSessions'), data)
+
+    def test_conflict_is_shown(self):
+        """
+        scheduling over someone's session shows who is busy instead of scheduling it
+        """
+        response = self.schedule()
+
+        self.assertTemplateUsed(response, 'schedule_sessions/schedule.html')
+        self.assertContains(response, TEST_EMAIL2 + ': busy (01-07-2030 10:00 to 11:00)')
+        self.assertEqual(StudySession.objects.count(), 1)
+
+    def test_schedule_anyway(self):
+        """
+        the user can choose to schedule it anyway
+        """
+        response = self.schedule(force='force')
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(StudySession.objects.count(), 2)
+
+    def test_recurring_conflict(self):
+        """
+        a weekly session is checked against every week it repeats on
+        """
+        # given
+        later = StudySession.objects.create(name='later', date=DATE + datetime.timedelta(weeks=3), start=at(11),
+                                            end=at(12), accepted='yes')
+        later.users.add(self.student)
+
+        # when
+        response = self.schedule(start='11:15', end='11:45', weeks='4')
+
+        # then
+        self.assertEqual(response.context['conflicts'], [(TEST_EMAIL, [later])])
+
+    def test_schedule_weekly_in_a_few_statements(self):
+        """
+        a semester of weekly sessions for a 30 person room is a fixed number of statements
+        (savepoint, members, sessions, memberships, release savepoint)
+        """
+        # given
+        self.room.users.add(*User.objects.bulk_create([User(email='user%d@email.com' % i) for i in range(28)]))
+
+        # when
+        with self.assertNumQueries(5):
+            sessions = schedule_sessions(self.room, DATE, at(15), at(16), TEST_EMAIL, weeks=16)
+
+        # then
+        self.assertEqual([session.date for session in sessions], [DATE + datetime.timedelta(weeks=week)
+                                                                  for week in range(16)])
+        self.assertEqual(StudySession.users.through.objects.filter(studysession__in=sessions).count(), 16 * 30)
+
+    def test_schedule_weekly_from_form(self):
+        """
+        the schedule form can repeat a session weekly
+        """
+        response = self.schedule(start='14:00', end='15:00', weeks='3')
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(StudySession.objects.filter(name=TEST_ROOM_NAME, start=at(14)).count(), 3)
+
+    def test_schedule_page_suggests_free_times(self):
+        """
+        the schedule page lists times when everyone in the room is free
+        """
+        response = self.client.get(reverse('studybuddy:schedule', args=(self.room.pk,)))
+
+        self.assertEqual(len(response.context['free_slots']), 7)
+        self.assertContains(response, 'Times everyone is free')
@@ -0,0 +1,145 @@
+from unittest import mock
+from django.urls import reverse
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+from studybuddy.models import Course
+from studybuddy.search import search_terms, search_courses, index_available, rebuild_index
+from studybuddy.test.test_utils import create_test_course
+from studybuddy.test.test_constants import TEST_USERNAME, TEST_EMAIL, TEST_PASSWORD
+
+
+class CourseSearchTest(TestCase):
+    def setUp(self):
+        self.software = create_test_course('CS', '3240', 'Sherriff', '001', 12345, 'Advanced Software Development')
+        self.algorithms = create_test_course('CS', '4102', 'Horton', '001', 12346, 'Algorithms')
+        self.probability = create_test_course('APMA', '3100', 'Rhodes', '001', 12347, 'Probability')
+
+    def test_search_terms(self):
+        """
+        letters and numbers are searched separately, and punctuation is ignored
+        """
+        self.assertEqual(search_terms('CS3240: "Software"'), ['cs', '3240', 'software'])
+
+    def test_sqlite_uses_index(self):
+        """
+        the tests run on SQLite, which has the full text index
+        """
+        self.assertTrue(index_available())
+
+    def test_index_is_only_looked_for_once(self):
+        """
+        searching and saving courses don't look up the database's tables every time
+        """
+        index_available()
+
+        with self.assertNumQueries(0):
+            self.assertTrue(index_available())
+
+    def test_search_by_course(self):
+        """
+        a subject and catalog number finds that course
+        """
+        self.assertEqual(search_courses('cs 3240'), ([self.software], False))
+
+    def test_search_by_word_prefix(self):
+        """
+        results show up for part of a word in the description or instructor
+        """
+        self.assertEqual(search_courses('soft')[0], [self.software])
+        self.assertEqual(search_courses('hort')[0], [self.algorithms])
+
+    def test_search_in_department(self):
+        """
+        a search can be limited to one department
+        """
+        self.assertEqual(search_courses('3', subject='APMA')[0], [self.probability])
+
+    def test_search_pages(self):
+        """
+        results are split into pages
+        """
+        first, has_next = search_courses('3', size=1)
+        second, has_more = search_courses('3', page=2, size=1)
+
+        self.assertTrue(has_next)
+        self.assertFalse(has_more)
+        self.assertEqual({first[0], second[0]}, {self.software, self.probability})
+
+    def test_empty_search_lists_department(self):
+        """
+        nothing typed in a department lists its courses in catalog order, a page at a time
+        """
+        first, has_next = search_courses('', subject='CS', size=1)
+        second, has_more = search_courses(' ', subject='CS', page=2, size=1)
+
+        self.assertEqual((first, has_next), ([self.software], True))
+        self.assertEqual((second, has_more), ([self.algorithms], False))
+        self.assertEqual(search_courses(''), ([], False))
+
+    def test_index_follows_changes(self):
+        """
+        saving and deleting courses updates the index
+        """
+        # when
+        self.software.description = 'Software Engineering'
+        self.software.save()
+        self.algorithms.delete()
+
+        # then
+        self.assertEqual(search_courses('engineering')[0], [self.software])
+        self.assertEqual(search_courses('algorithms')[0], [])
+
+    def test_rebuild_index(self):
+        """
+        courses changed without signals can be found after rebuilding the index
+        """
+        # given
+        Course.objects.filter(pk=self.probability.pk).update(description='Statistics')
+
+        # when
+        rebuild_index()
+
+        # then
+        self.assertEqual(search_courses('statistics')[0], [self.probability])
+
+    @mock.patch('studybuddy.search.index_available', return_value=False)
+    def test_like_fallback(self, mock_index_available):
+        """
+        without the index, courses are still found by searching every field
+        """
+        self.assertEqual(search_courses('cs soft')[0], [self.software])
+        self.assertEqual(search_courses('cs')[0], [self.software, self.algorithms])
+
+
+class CourseSearchViewTest(TestCase):
+    def setUp(self):
+        self.software = create_test_course('CS', '3240', 'Sherriff', '001', 12345, 'Advanced Software Development')
+
+        self.test_user = get_user_model().objects.create_user(TEST_USERNAME, TEST_EMAIL, TEST_PASSWORD)
+        self.client.login(username=TEST_USERNAME, password=TEST_PASSWORD)
+
+    def test_search(self):
+        """
+        the search returns matching courses with a link to enroll in them
+        """
+        response = self.client.get(reverse('studybuddy:courseSearch'), {'q': 'software', 'dept': 'CS'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['courses'][0]['url'], reverse('studybuddy:enroll', args=('CS', 12345)))
+        self.assertFalse(response.json()['has_next'])
+
+    def test_invalid_page(self):
+        """
+        an invalid page is rejected
+        """
+        response = self.client.get(reverse('studybuddy:courseSearch'), {'q': 'software', 'page': '0'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_anonymous(self):
+        """
+        only logged in users can search
+        """
+        self.client.logout()
+
+        response = self.client.get(reverse('studybuddy:courseSearch'), {'q': 'software'})
+        self.assertEqual(response.status_code, 403)
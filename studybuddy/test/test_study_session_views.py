@@ -1,3 +1,4 @@
+import datetime
 from unittest import mock
 from django.urls import reverse
 from django.test import TestCase
@@ -32,7 +33,8 @@ class ScheduleViewTest(TestCase):
                                             description=TEST_DESCRIPTION)
 
         test_post = Post.objects.create(topic=TEST_TOPIC, course=test_course, user=self.test_User)
-        Room.objects.create(name=TEST_ROOM_NAME, post=test_post)
+        self.test_room = Room.objects.create(name=TEST_ROOM_NAME, post=test_post)
+        self.test_room.users.add(self.test_User)
 
         # mock user login
         self.test_user = get_user_model().objects.create_user(TEST_USERNAME, TEST_EMAIL, TEST_PASSWORD)
@@ -82,8 +84,22 @@ class ScheduleViewTest(TestCase):
         response = self.client.get(reverse('studybuddy:schedule', args=(TEST_PK,)))
 
         # then
-        self.assertEqual(response.status_code, 200)
-        self.assertContains(response, 'The room you are trying to look for does not exist')
+        self.assertContains(response, 'The room you are trying to look for does not exist', status_code=404)
+
+    def test_non_member_cannot_see_room_schedule(self):
+        """
+        a user who isn't in the room can't see when its users are free
+        """
+        # given
+        self.test_room.users.remove(self.test_User)
+
+        # when
+        response = self.client.get(reverse('studybuddy:schedule', args=(TEST_PK,)))
+
+        # then
+        self.assertContains(response, 'The room you are trying to look for does not exist', status_code=404)
+        self.assertNotContains(response, TEST_ROOM_NAME, status_code=404)
+        self.assertNotIn('free_slots', response.context)
 
 
 class UpcomingSessionsViewTest(TestCase):
@@ -218,3 +234,30 @@ class UpcomingSessionsViewTest(TestCase):
         # then
         self.assertEqual(response.status_code, 302)
         self.assertEqual(StudySession.objects.count(), 1)
+
+    def test_sessions_sorted_into_lists(self):
+        """
+        accepted, declined, sent and pending sessions each go in their own list, and many sessions
+        still take a fixed number of queries (session, auth user, profile, study sessions)
+        """
+        # given
+        future = datetime.date.today() + datetime.timedelta(days=2)
+        expected = {'study_sessions': [], 'declined_sessions': [], 'sent_sessions': [], 'pending_sessions': []}
+        for i in range(100):
+            for name, accepted, author in [('study_sessions', 'yes', TEST_EMAIL),
+                                           ('declined_sessions', 'no', 'other@email.com'),
+                                           ('sent_sessions', '?', TEST_EMAIL),
+                                           ('pending_sessions', '?', 'other@email.com')]:
+                session = StudySession.objects.create(name=TEST_STUDY_SESSION_NAME, date=future, start='10:00',
+                                                      end='11:00', accepted=accepted, author=author)
+                session.users.add(self.test_User)
+                expected[name].append(session)
+
+        # when
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('studybuddy:upcomingSessions'))
+
+        # then
+        for name, sessions in expected.items():
+            self.assertEqual(response.context[name], sessions)
+        self.assertNotIn('no_sessions', response.context)
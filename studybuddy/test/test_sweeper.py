@@ -0,0 +1,151 @@
+import datetime
+import threading
+from io import StringIO
+from unittest.mock import patch
+from django.urls import reverse
+from django.db import OperationalError
+from django.test import TestCase
+from django.utils import timezone
+from django.core.management import call_command
+from django.contrib.auth import get_user_model
+from studybuddy.models import User, Post, StudySession
+from studybuddy.sweeper import expired_posts, past_sessions, purge, sweep, sweep_forever
+from studybuddy.test.test_utils import create_default_test_course
+from studybuddy.test.test_constants import TEST_EMAIL, TEST_USERNAME, TEST_PASSWORD, TEST_STUDY_SESSION_NAME
+
+
+class SweeperTest(TestCase):
+    def setUp(self):
+        self.test_User = User.objects.create(email=TEST_EMAIL)
+        self.test_course = create_default_test_course()
+
+        self.today = timezone.localdate()
+        self.yesterday = self.today - datetime.timedelta(days=1)
+        self.tomorrow = self.today + datetime.timedelta(days=1)
+
+        self.expired_post = self.create_post(self.yesterday)
+        self.current_post = self.create_post(self.today)
+
+        self.past_session = self.create_session(self.yesterday, '23:00')
+        self.upcoming_session = self.create_session(self.tomorrow, '00:30')
+
+    def create_post(self, end_date):
+        return Post.objects.create(course=self.test_course,
+                                   user=self.test_User,
+                                   startDate=self.yesterday - datetime.timedelta(days=7),
+                                   endDate=end_date)
+
+    def create_session(self, date, end):
+        session = StudySession.objects.create(name=TEST_STUDY_SESSION_NAME, date=date, start='00:00', end=end)
+        session.users.add(self.test_User)
+        return session
+
+    def test_expired_posts(self):
+        """
+        only posts whose end date is before today are expired
+        """
+        self.assertEqual(list(expired_posts()), [self.expired_post])
+
+    def test_past_sessions(self):
+        """
+        only sessions on an earlier day are past
+        """
+        self.assertEqual(list(past_sessions()), [self.past_session])
+
+    def test_purge_in_batches(self):
+        """
+        purging deletes everything in the queryset, a batch at a time
+        """
+        # given
+        for _ in range(4):
+            self.create_post(self.yesterday)
+
+        # when
+        deleted = purge(expired_posts(), batch_size=2)
+
+        # then
+        self.assertEqual(deleted, 5)
+        self.assertEqual(list(Post.objects.all()), [self.current_post])
+
+    def test_sweep(self):
+        """
+        sweeping removes expired posts and past sessions and leaves everything else
+        """
+        # when
+        deleted = sweep()
+
+        # then
+        self.assertEqual(deleted, {'posts': 1, 'sessions': 1})
+        self.assertEqual(list(Post.objects.all()), [self.current_post])
+        self.assertEqual(list(StudySession.objects.all()), [self.upcoming_session])
+
+    def test_purge_expired_command(self):
+        """
+        the purge_expired management command sweeps and reports what it deleted
+        """
+        # given
+        out = StringIO()
+
+        # when
+        call_command('purge_expired', stdout=out)
+
+        # then
+        self.assertIn('Deleted 1 expired posts and 1 past study sessions', out.getvalue())
+        self.assertFalse(Post.objects.filter(pk=self.expired_post.pk).exists())
+
+    def test_purge_expired_command_batch_size(self):
+        """
+        the command deletes SWEEP_BATCH_SIZE rows at a time unless --batch-size is given
+        """
+        # when
+        with self.settings(SWEEP_BATCH_SIZE=7), \
+                patch('studybuddy.management.commands.purge_expired.sweep_forever') as mock_sweep_forever, \
+                patch('studybuddy.management.commands.purge_expired.sweep') as mock_sweep:
+            call_command('purge_expired', '--loop', stdout=StringIO())
+            call_command('purge_expired', '--batch-size', '3', stdout=StringIO())
+
+        # then
+        mock_sweep_forever.assert_called_once_with(batch_size=7)
+        mock_sweep.assert_called_once_with(3)
+
+    def test_sweep_forever(self):
+        """
+        the sweeper keeps going after a sweep fails, until it is stopped
+        """
+        # given
+        stopped = threading.Event()
+        calls = []
+
+        def failing_then_stopping_sweep(batch_size):
+            calls.append(batch_size)
+            if len(calls) == 1:
+                raise OperationalError('database is locked')
+            stopped.set()
+
+        # when
+        with patch('studybuddy.sweeper.sweep', failing_then_stopping_sweep), \
+                patch('studybuddy.sweeper.close_old_connections'), \
+                self.assertLogs('studybuddy.sweeper', 'ERROR'):
+            sweep_forever(interval=0.001, batch_size=10, stopped=stopped)
+
+        # then
+        self.assertEqual(calls, [10, 10])
+
+    def test_pages_hide_expired_rows_without_deleting(self):
+        """
+        viewing posts and sessions hides what has expired but leaves deleting it to the sweeper
+        """
+        # given
+        StudySession.objects.update(accepted='yes')
+        get_user_model().objects.create_user(TEST_USERNAME, TEST_EMAIL, TEST_PASSWORD)
+        self.client.login(username=TEST_USERNAME, password=TEST_PASSWORD)
+
+        # when
+        posts_response = self.client.get(reverse('studybuddy:viewposts'))
+        sessions_response = self.client.get(reverse('studybuddy:upcomingSessions'))
+
+        # then
+        self.assertEqual(list(posts_response.context['user_posts']), [self.current_post])
+        self.assertEqual(list(sessions_response.context['study_sessions']), [self.upcoming_session])
+        self.assertTrue(Post.objects.filter(pk=self.expired_post.pk).exists())
+        self.assertTrue(StudySession.objects.filter(pk=self.past_session.pk).exists())
@@ -2,6 +2,8 @@
 
 from nose.tools import nottest
 from studybuddy.models import Course
+from studybuddy.friend_graph import friend_graph
+from studybuddy.matching import match_index
 
 
 @nottest
@@ -29,3 +31,13 @@ def create_test_course(subject, catalog_number, instructor, section, course_numb
                                  section=section,
                                  course_number=course_number,
                                  description=description)
+
+
+def reset_indexes(test_case):
+    """
+    empty the in memory match index and friend graph now and when the test is done, they belong to
+    the process so they would otherwise carry students over from earlier tests
+    """
+    for index in (match_index, friend_graph):
+        index.reset()
+        test_case.addCleanup(index.reset)
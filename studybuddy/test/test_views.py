@@ -8,12 +8,16 @@ from django.contrib.auth import get_user_model
 from studybuddy.models import User, Course, Post
 from studybuddy.test.test_constants import TEST_EMAIL, TEST_USERNAME, TEST_PASSWORD, TEST_SUBJECT, TEST_COURSE_NUMBER, \
     TEST_PK, TEST_DESCRIPTION, TEST_SECTION, TEST_INSTRUCTOR, TEST_CATALOG_NUMBER, TEST_TOPIC
+from studybuddy.search import SEARCH_PAGE_SIZE
+from studybuddy.test.test_utils import reset_indexes, create_test_course
 from studybuddy.views import room_views
 from studybuddy.views.views import coursefeed
 
 
 class HomepageViewTest(TestCase):
     def setUp(self):
+        reset_indexes(self)
+
         # mock user login
         self.test_user = get_user_model().objects.create_user(TEST_USERNAME, TEST_EMAIL, TEST_PASSWORD)
         self.client.login(username=TEST_USERNAME, password=TEST_PASSWORD)
@@ -88,6 +92,61 @@ class AllDepartmentViewTest(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertTemplateUsed(response, 'alldepartments.html')
 
+    def test_view_lists_departments_with_course_counts(self):
+        """
+        every department with courses is listed with how many sections it has
+        """
+        # given
+        Course.objects.create(subject=TEST_SUBJECT, catalog_number=TEST_CATALOG_NUMBER, instructor=TEST_INSTRUCTOR,
+                              section=TEST_SECTION, course_number=TEST_COURSE_NUMBER, description=TEST_DESCRIPTION)
+
+        # when
+        response = self.client.get(reverse('studybuddy:alldepartments'))
+
+        # then
+        self.assertContains(response, TEST_SUBJECT + ' (1)')
+
+    def test_repeat_visit_not_modified(self):
+        """
+        a repeat visit gets a 304 until the directory changes
+        """
+        # given
+        Course.objects.create(subject=TEST_SUBJECT, catalog_number=TEST_CATALOG_NUMBER, instructor=TEST_INSTRUCTOR,
+                              section=TEST_SECTION, course_number=TEST_COURSE_NUMBER, description=TEST_DESCRIPTION)
+        etag = self.client.get(reverse('studybuddy:alldepartments'))['ETag']
+
+        # when
+        unchanged = self.client.get(reverse('studybuddy:alldepartments'), HTTP_IF_NONE_MATCH=etag)
+        Course.objects.create(subject='MATH', catalog_number=TEST_CATALOG_NUMBER, instructor=TEST_INSTRUCTOR,
+                              section=TEST_SECTION, course_number=TEST_COURSE_NUMBER, description=TEST_DESCRIPTION)
+        changed = self.client.get(reverse('studybuddy:alldepartments'), HTTP_IF_NONE_MATCH=etag)
+
+        # then
+        self.assertEqual(unchanged.status_code, 304)
+        self.assertEqual(changed.status_code, 200)
+        self.assertContains(changed, 'MATH (1)')
+
+    def test_validators_are_per_user(self):
+        """
+        the page shows who is signed in, so it is only validated by an ETag that includes the user,
+        never by a Last-Modified time shared by everyone
+        """
+        # given
+        Course.objects.create(subject=TEST_SUBJECT, catalog_number=TEST_CATALOG_NUMBER, instructor=TEST_INSTRUCTOR,
+                              section=TEST_SECTION, course_number=TEST_COURSE_NUMBER, description=TEST_DESCRIPTION)
+        response = self.client.get(reverse('studybuddy:alldepartments'))
+        etag = response['ETag']
+        get_user_model().objects.create_user('other', 'other@email.com', TEST_PASSWORD)
+        self.client.login(username='other', password=TEST_PASSWORD)
+
+        # when
+        other_user = self.client.get(reverse('studybuddy:alldepartments'), HTTP_IF_NONE_MATCH=etag,
+                                     HTTP_IF_MODIFIED_SINCE='Fri, 01 Jan 2100 00:00:00 GMT')
+
+        # then
+        self.assertFalse(response.has_header('Last-Modified'))
+        self.assertEqual(other_user.status_code, 200)
+
 
 class DepartmentViewTest(TestCase):
     def setUp(self):
@@ -132,6 +191,24 @@ class DepartmentViewTest(TestCase):
         self.assertContains(response, "No classes are available in " + self.test_dept.upper() + " or " +
                             self.test_dept.upper() + " does not exist.")
 
+    def test_only_first_page_of_courses(self):
+        """
+        a large department only sends its first page of courses, the rest are loaded by the course search
+        """
+        # given
+        for number in range(SEARCH_PAGE_SIZE + 5):
+            create_test_course(self.test_dept, str(1000 + number), 'Instructor', '001', 20000 + number, 'Course')
+
+        # when
+        response = self.client.get(reverse('studybuddy:department', args=(self.test_dept,)))
+
+        # then
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['department_list']), SEARCH_PAGE_SIZE)
+        self.assertTrue(response.context['has_next'])
+        self.assertContains(response, '/enroll"', count=SEARCH_PAGE_SIZE)
+        self.assertNotContains(response, str(1000 + SEARCH_PAGE_SIZE))
+
     def test_passing_string_as_dept(self):
         """
         when url received is not a desired format throw a 404 error?
@@ -350,6 +427,79 @@ class CourseFeedViewTest(TestCase):
     #     self.assertContains(response, test_topic)
 
 
+class CourseFeedQueryTest(TestCase):
+    def setUp(self):
+        self.test_User = User.objects.create(email=TEST_EMAIL)
+        self.sections = [Course.objects.create(subject=TEST_SUBJECT,
+                                               catalog_number=TEST_CATALOG_NUMBER,
+                                               instructor=TEST_INSTRUCTOR,
+                                               section=section,
+                                               course_number=TEST_COURSE_NUMBER + section,
+                                               description=TEST_DESCRIPTION) for section in range(5)]
+        self.other_course = Course.objects.create(subject=TEST_SUBJECT,
+                                                  catalog_number=TEST_CATALOG_NUMBER + 1,
+                                                  instructor=TEST_INSTRUCTOR,
+                                                  section=TEST_SECTION,
+                                                  course_number=TEST_COURSE_NUMBER + 100,
+                                                  description=TEST_DESCRIPTION)
+
+        self.test_user = get_user_model().objects.create_user(TEST_USERNAME, TEST_EMAIL, TEST_PASSWORD)
+        self.client.login(username=TEST_USERNAME, password=TEST_PASSWORD)
+
+    def get_feed(self, course, **params):
+        return self.client.get(reverse('studybuddy:coursefeed', args=(TEST_SUBJECT, course.course_number)), params)
+
+    def test_feed_shows_section_and_course_posts(self):
+        """
+        the feed has posts for this section and posts for the whole course from other sections,
+        but not section posts from other sections or posts for other courses
+        """
+        # given
+        own_post = Post.objects.create(course=self.sections[0], user=self.test_User)
+        course_post = Post.objects.create(course=self.sections[1], user=self.test_User, post_type='course')
+        Post.objects.create(course=self.sections[2], user=self.test_User)
+        Post.objects.create(course=self.other_course, user=self.test_User, post_type='course')
+
+        # when
+        response = self.get_feed(self.sections[0])
+
+        # then
+        self.assertEqual(set(response.context['feed_posts']), {own_post, course_post})
+        self.assertTrue(response.context['has_posts'])
+
+    def test_feed_query_count_does_not_grow_with_sections(self):
+        """
+        the feed costs the same number of queries however many sections and posts there are
+        (session, auth user, course, post count, posts, profile for the navigation bar)
+        """
+        # given
+        for section in self.sections:
+            for _ in range(3):
+                Post.objects.create(course=section, user=self.test_User, post_type='course')
+
+        # then
+        with self.assertNumQueries(6):
+            response = self.get_feed(self.sections[0])
+        self.assertEqual(len(response.context['feed_posts']), 15)
+
+    @mock.patch('studybuddy.views.views.FEED_PAGE_SIZE', 2)
+    def test_feed_is_paginated(self):
+        """
+        the feed is split into pages, newest posts first
+        """
+        # given
+        posts = [Post.objects.create(course=self.sections[0], user=self.test_User) for _ in range(3)]
+
+        # when
+        first_page = self.get_feed(self.sections[0])
+        second_page = self.get_feed(self.sections[0], page=2)
+
+        # then
+        self.assertEqual(list(first_page.context['feed_posts']), posts[:0:-1])
+        self.assertEqual(list(second_page.context['feed_posts']), posts[:1])
+        self.assertContains(first_page, 'Page 1 of 2')
+
+
 class EnrollViewTest(TestCase):
     def setUp(self):
         self.test_dept = 'testDept'
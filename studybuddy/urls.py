@@ -1,4 +1,5 @@
 from django.urls import path
+from studybuddy.metrics import instrument
 from studybuddy.views import views, post_views, study_session_views, friend_views, room_views
 
 app_name = 'studybuddy'
@@ -12,9 +13,11 @@ urlpatterns = [
     path('account/edit/', views.EditAccount, name='editAccount'),
     path('account/update/', views.UpdateAccount, name='updateAccount'),
 
-    path('alldepartments/', views.alldepartments.as_view(), name='alldepartments'),
+    path('alldepartments/', views.alldepartments, name='alldepartments'),
     path('rooms/', room_views.rooms, name='rooms'),
     path('rooms/<int:roomNumber>/', room_views.room, name='room'),
+    path('rooms/<int:roomNumber>/messages/', room_views.room_messages, name='roomMessages'),
+    path('courses/search/', views.course_search, name='courseSearch'),
     path('<str:dept>/', views.department, name='department'),
     path('<str:dept>/<int:course_number>/', views.coursefeed, name ='coursefeed'),
 
@@ -27,4 +30,7 @@ urlpatterns = [
 
     path('<int:roomNumber>/schedule', study_session_views.schedule, name='schedule'),
     path('upcomingSessions', study_session_views.upcomingSessions, name='upcomingSessions'),
-]
\ No newline at end of file
+]
+
+# every view's request count, time and queries are served at /metrics
+instrument(urlpatterns)
\ No newline at end of file
@@ -1,5 +1,7 @@
 from django.shortcuts import render
 from studybuddy.models import User, Friend_Request
+from studybuddy.middleware import get_student
+from studybuddy.friend_graph import friend_graph, people_you_may_know
 
 
 def send_friend_request(request, requestee_email):
@@ -10,7 +12,7 @@ def send_friend_request(request, requestee_email):
     '''
 
     # This method is called after already processing to and from users are valid
-    from_user = User.objects.get(email__exact=request.user.email)
+    from_user = get_student(request)
     to_user = User.objects.get(email__exact=requestee_email)
 
     if from_user.friends.all().filter(email=requestee_email):
@@ -29,7 +31,7 @@ def accept_friend_request(request, requester_email):
            1: friend request successfully accepted
     """
     from_user = User.objects.get(email=requester_email)
-    to_user = User.objects.get(email=request.user.email)
+    to_user = get_student(request)
 
     friend_request_query_set = Friend_Request.objects.filter(from_user=from_user).filter(to_user=to_user)
     friend_request = friend_request_query_set.first()
@@ -46,7 +48,7 @@ def accept_friend_request(request, requester_email):
 
 
 def remove_friend(request, email):
-    User.objects.get(email=request.user.email).friends.remove(User.objects.get(email=email))
+    get_student(request).friends.remove(User.objects.get(email=email))
 
 
 def decline_request(request, email):
@@ -55,7 +57,7 @@ def decline_request(request, email):
     parameters: email - the email of the user that sent the friend request
     """
     from_user = User.objects.get(email=email)
-    to_user = User.objects.get(email=request.user.email)
+    to_user = get_student(request)
 
     Friend_Request.objects.filter(from_user=from_user).filter(to_user=to_user).delete()
 
@@ -64,23 +66,20 @@ def view_friends(request):
     if request.user.is_anonymous:
         return render(request, template_name="index.html")
 
-    from_user = User.objects.get(email=request.user.email)
+    from_user = get_student(request)
     # get the friend requests that are sent to the current user
-    friend_request = Friend_Request.objects.filter(to_user=from_user)
-    sent_requests = Friend_Request.objects.filter(from_user=from_user)
+    friend_request = Friend_Request.objects.filter(to_user=from_user).select_related('from_user')
+    sent_requests = Friend_Request.objects.filter(from_user=from_user).select_related('to_user')
     friends = from_user.friends.all()
 
     context = {
+        'student': from_user,
         'friends': friends,
         'friend_requests': friend_request,
         'sent_requests': sent_requests,
-        'student_name': from_user.name,
         # add declined?
     }
 
-    if from_user.name == "":
-        context['student_name'] = request.user
-
     # if the user sent a friend request
     if request.POST.get('request'):
         requestee_email = request.POST.get('email')
@@ -132,19 +131,45 @@ def view_friends(request):
         return view_friend_profile(request, friend_email)
 
     request.POST = None
+    add_mutual_friends(context)
     return render(request, "friends/view_friends.html", context)
 
 
+def add_mutual_friends(context):
+    """
+    count the mutual friends for each friend and friend request, and suggest people the user may know
+
+    Done after any friend request was accepted or friend removed, so the counts include the change.
+    The counts come from the friend graph, so this doesn't query once per friend.
+    """
+    student = context['student']
+    friends = list(context['friends'])
+    friend_requests = list(context['friend_requests'])
+    sent_requests = list(context['sent_requests'])
+
+    mutual = friend_graph.mutual_counts(student.email, [friend.email for friend in friends] +
+                                        [friend_request.from_user_id for friend_request in friend_requests])
+    for friend in friends:
+        friend.mutual_friends = mutual[friend.email]
+    for friend_request in friend_requests:
+        friend_request.mutual_friends = mutual[friend_request.from_user_id]
+
+    # people who already have a pending request either way aren't suggested
+    pending = [friend_request.from_user_id for friend_request in friend_requests] + \
+              [sent_request.to_user_id for sent_request in sent_requests]
+
+    context['friends'] = friends
+    context['friend_requests'] = friend_requests
+    context['sent_requests'] = sent_requests
+    context['people_you_may_know'] = people_you_may_know(student, exclude=pending)
+
+
 def view_friend_profile(request, friend_email):
     friend = User.objects.get(email__exact=friend_email)
 
     context = {
-        'student': User.objects.get(email=request.user.email),
-        'student_name': User.objects.get(email=request.user.email).name,
+        'student': get_student(request),
         'friend': friend
     }
 
-    if User.objects.get(email=request.user.email).name == "":
-        context['student_name'] = request.user
-
     return render(request, "friends/friend_profile.html", context)
@@ -0,0 +1,31 @@
+import hmac
+from django.conf import settings
+from django.http import HttpResponse, Http404
+from studybuddy import metrics
+
+
+def metrics_page(request):
+    """
+    every metric in the Prometheus text format, for the whole server when METRICS_DIR is set
+
+    The scraper has to send METRICS_TOKEN as "Authorization: Bearer <token>". Without a token the
+    page is only served with DEBUG on, so traffic and queue sizes aren't public by default.
+    """
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if not token and not settings.DEBUG:
+        raise Http404
+    # compared as bytes, compare_digest raises TypeError for strings that aren't ASCII
+    sent = request.META.get('HTTP_AUTHORIZATION', '').encode('utf-8', 'surrogatepass')
+    if token and not hmac.compare_digest(sent, ('Bearer ' + token).encode('utf-8')):
+        return HttpResponse('Unauthorized', status=401, content_type='text/plain')
+
+    snapshot = metrics.collect()
+
+    # the channel layer is shared by every process, so its queue is counted once when scraped
+    depth = metrics.channel_layer_depth()
+    if depth is not None:
+        snapshot['studybuddy_channel_layer_messages'] = {
+            'kind': 'gauge', 'help': 'Messages waiting in the channel layer', 'labels': [], 'buckets': [],
+            'values': [[[], depth]]}
+
+    return HttpResponse(metrics.render(snapshot), content_type='text/plain; version=0.0.4; charset=utf-8')
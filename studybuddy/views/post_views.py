@@ -1,8 +1,10 @@
 from django.http import HttpResponseRedirect
 from django.urls import reverse
 from django.utils import timezone
+from django.db.models import Subquery
 from django.shortcuts import render
 from studybuddy.models import Post, Course, User, EnrolledClass
+from studybuddy.middleware import get_student
 
 
 def makepost(request, dept, course_number):
@@ -14,12 +16,8 @@ def makepost(request, dept, course_number):
     context = {
         'dept': dept.upper(),
         'course_number': course_number,
-        'student_name': User.objects.get(email=request.user.email).name,
     }
 
-    if User.objects.get(email=request.user.email).name == "":
-        context['student_name'] = request.user
-
     if Course.objects.filter(course_number=course_number, subject=dept.upper()).exists():
         context['course'] = Course.objects.get(course_number=course_number)
 
@@ -52,7 +50,7 @@ def submitpost(request, dept, course_number):
         if description == "":
             description = Post._meta.get_field('description').get_default()
 
-        user = User.objects.get(email=email)
+        user = get_student(request)
         author = str(request.user)
         if user.name != "":
             author = user.name
@@ -88,12 +86,10 @@ def submitpost(request, dept, course_number):
 
 
 def deletepost(request):
-    email = request.user.email
     target_post_pk = request.POST['post_pk']
     # There shouldn't be a case where this called and post_pk doesn't exist because this is
     # method and not a url call. Putting in guards just in case
-    if Post.objects.filter(user=User.objects.get(email=email), pk=target_post_pk).exists():
-        Post.objects.get(user=User.objects.get(email=email), pk=target_post_pk).delete()
+    Post.objects.filter(user=get_student(request), pk=target_post_pk).delete()
 
 
 def viewposts(request):
@@ -103,39 +99,25 @@ def viewposts(request):
     if request.POST.get('delete'):
         deletepost(request)
 
-    Post.objects.filter(endDate__lt=timezone.localtime()).delete()
-
-    email = request.user.email
+    student = get_student(request)
     template_name = 'post/viewposts.html'
-    user_posts = Post.objects.filter(user=User.objects.get(email=email)).distinct()
-    enrolled_courses = EnrolledClass.objects.filter(student=User.objects.get(email=email))
-    unenrolled_posts_pk = []
-
-    for post in user_posts:
-        if not enrolled_courses.filter(course=post.course).exists():
-            # if the student is not enrolled in the class append the post pk
-            unenrolled_posts_pk.append(post.pk)
-
-    unenrolled_posts = None
-    for pk in unenrolled_posts_pk:
-        if unenrolled_posts is None:
-            unenrolled_posts = Post.objects.filter(pk=pk)
-        else:
-            unenrolled_posts = unenrolled_posts | Post.objects.filter(pk=pk)
+    # expired posts are deleted by the sweeper, until then they are just hidden
+    user_posts = Post.objects.filter(user=student, endDate__gte=timezone.localdate()).select_related('course')
+    enrolled_courses = EnrolledClass.objects.filter(student=student).select_related('course')
+    # posts for courses the student is no longer enrolled in
+    unenrolled_posts = user_posts.exclude(
+        course__in=Subquery(EnrolledClass.objects.filter(student=student).values('course')))
 
     context = {
         'user_posts': user_posts,
         'enrolled_courses': enrolled_courses,
-        'student_name': User.objects.get(email=request.user.email).name,
     }
 
-    if User.objects.get(email=request.user.email).name == "":
-        context['student_name'] = request.user
-
-    if enrolled_courses.count() == 0 and unenrolled_posts is None:
+    # each queryset is only run once, the template reuses the results
+    if not enrolled_courses and not unenrolled_posts:
         context['no_courses_and_post'] = True
 
-    if unenrolled_posts is not None:
+    if unenrolled_posts:
         context['unenrolled_posts'] = unenrolled_posts
 
     request.POST = None
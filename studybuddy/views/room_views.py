@@ -1,7 +1,18 @@
+import datetime
+
 from django.urls import reverse
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
 from django.shortcuts import render
-from django.http import HttpResponseRedirect
-from studybuddy.models import Room, Message, User, Post
+from django.http import HttpResponseRedirect, JsonResponse
+from studybuddy.models import Room, Message, User, Post, RoomReadState
+from studybuddy.middleware import get_student
+
+# how many chat messages are shown at a time
+MESSAGE_PAGE_SIZE = 25
+
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
 
 
 def rooms(request):
@@ -9,16 +20,37 @@ def rooms(request):
         return render(request, template_name="index.html")
 
     context = {
-        'rooms': Room.objects.filter(users=User.objects.get(email=request.user.email)),
-        'student_name': User.objects.get(email=request.user.email).name,
+        'rooms': rooms_with_activity(get_student(request)),
     }
 
-    if User.objects.get(email=request.user.email).name == "":
-        context['student_name'] = request.user
-
     return render(request, 'studybuddy/rooms.html', context)
 
 
+def rooms_with_activity(student):
+    """
+    the student's rooms with each room's last message, how many messages the student hasn't read and
+    how many members it has, most recently active first, in one query
+
+    Messages the student sent themselves are never unread. Rooms nobody has messaged in yet go last.
+    """
+    last_message = Message.objects.filter(room=OuterRef('pk')).order_by('-date_added', '-id')
+    last_read = RoomReadState.objects.filter(room=OuterRef('pk'), user=student).values('last_read')[:1]
+    unread = (Message.objects.filter(room=OuterRef('pk'), date_added__gt=OuterRef('last_read'))
+              .exclude(user=student).order_by().values('room').annotate(count=Count('pk')).values('count'))
+    members = (Room.users.through.objects.filter(room=OuterRef('pk'))
+               .order_by().values('room').annotate(count=Count('pk')).values('count'))
+
+    return (Room.objects.filter(users=student)
+            .select_related('post__course')
+            .annotate(last_message=Subquery(last_message.values('content')[:1]),
+                      last_message_name=Subquery(last_message.values('user__name')[:1]),
+                      last_message_at=Subquery(last_message.values('date_added')[:1]),
+                      last_read=Coalesce(Subquery(last_read), Value(EPOCH)),
+                      unread_count=Coalesce(Subquery(unread), 0),
+                      member_count=Subquery(members))
+            .order_by(F('last_message_at').desc(nulls_last=True), '-pk'))
+
+
 def room(request, roomNumber):
     if request.user.is_anonymous:
         return render(request, template_name="index.html")
@@ -30,42 +62,113 @@ def room(request, roomNumber):
             if room.users.count() == 1:
                 room.delete()
             else:
-                room.users.remove(User.objects.get(email=request.user.email))
+                room.users.remove(get_student(request))
         return HttpResponseRedirect(reverse('studybuddy:rooms'))
 
     context = {
-        'username': User.objects.get(email=request.user.email).username,
-        'student_name': User.objects.get(email=request.user.email).name,
+        'username': get_student(request).username,
     }
 
     if Room.objects.filter(pk=roomNumber):
         if Room.objects.get(pk=roomNumber).users.all().filter(email=request.user.email):
             room = Room.objects.get(pk=roomNumber)
             context['room'] = room
-            messages = Message.objects.filter(room=room)[:25]
-            context['messages'] = messages
+            context['messages'], context['older_cursor'] = get_message_page(room)
+            if context['messages']:
+                RoomReadState.mark_read(get_student(request), room, context['messages'][-1].date_added)
         else:
             context['notMember'] = True
     else:
         context['noRoom'] = True
 
-    if User.objects.get(email=request.user.email).name == "":
-        context['student_name'] = request.user
-
     return render(request, 'studybuddy/room.html', context)
 
 
 def addRoom(request):
+    """
+    join the room for a post, making the room if nobody has messaged about the post yet, and return its pk
+
+    The room is found or created and the post's author and the user are added to it in one transaction.
+    Two users messaging about the same post at once both end up in the same room: get_or_create
+    falls back to the room the other request made, and members who are already in the room are skipped.
+    """
     post_pk = request.POST['post_pk']
-    post = Post.objects.get(pk=post_pk)
-    # If there is no rooms current associated to this room, make a new room
-    if not Room.objects.filter(post=post):
-        # create a new object with the owner of the post
-        Room.objects.create(post=post, name=post.topic)
-        Room.objects.get(post=post).users.add(User.objects.get(email=post.user.email))
-        # add the new user who wants to join to the room
-    # add the new user into the room (this will happen after a new made room or just added to the already existing room)
-    Room.objects.get(post=post).users.add(User.objects.get(email=request.user.email))
-
-    # return room(request, roomNumber=Room.objects.get(post=post).pk)
-    return Room.objects.get(post=post).pk
+    topic, author = Post.objects.values_list('topic', 'user_id').get(pk=post_pk)
+
+    with transaction.atomic():
+        room, created = Room.objects.get_or_create(post_id=post_pk, defaults={'name': topic})
+        Membership = Room.users.through
+        Membership.objects.bulk_create([Membership(room_id=room.pk, user_id=email)
+                                        for email in {author, get_student(request).email}],
+                                       ignore_conflicts=True)
+
+    return room.pk
+
+
+def room_messages(request, roomNumber):
+    """
+    JSON page of a room's chat history, newest first, for the "load older messages" button
+    parameters: before - cursor returned with the previous page
+    """
+    if request.user.is_anonymous:
+        return JsonResponse({'error': 'You must be logged in to view messages'}, status=403)
+
+    if not Room.objects.filter(pk=roomNumber, users__email=request.user.email).exists():
+        return JsonResponse({'error': 'You are not a user of this room'}, status=404)
+
+    before = None
+    if request.GET.get('before'):
+        before = parse_cursor(request.GET['before'])
+        if before is None:
+            return JsonResponse({'error': 'Invalid cursor'}, status=400)
+
+    messages, older_cursor = get_message_page(roomNumber, before)
+
+    return JsonResponse({
+        'messages': [{
+            'email': message.user.email,
+            'name': message.user.name,
+            'content': message.content,
+            'date_added': message.date_added.isoformat(),
+        } for message in messages],
+        'older_cursor': older_cursor,
+    })
+
+
+def get_message_page(room, before=None, size=MESSAGE_PAGE_SIZE):
+    """
+    return the newest messages in the room that come before the before cursor (oldest first, ready
+    to display) along with the cursor for the page before them, or None if there is nothing older
+
+    Messages are found by (date_added, id) using the message_room_date_idx index instead of an
+    offset, so every page costs the same no matter how long the room's history is.
+    """
+    messages = Message.objects.filter(room=room).select_related('user').order_by('-date_added', '-id')
+    if before is not None:
+        date_added, pk = before
+        # the OR alone can't be used as a range on the index, date_added__lte bounds the scan to older rows
+        messages = messages.filter(Q(date_added__lt=date_added) | Q(date_added=date_added, id__lt=pk),
+                                   date_added__lte=date_added)
+
+    page = list(messages[:size + 1])
+    older_cursor = None
+    if len(page) > size:
+        page = page[:size]
+        older_cursor = make_cursor(page[-1])
+
+    page.reverse()
+    return page, older_cursor
+
+
+def make_cursor(message):
+    # microseconds since the epoch keeps the cursor exact and safe to put in a url
+    microseconds = (message.date_added - EPOCH) // datetime.timedelta(microseconds=1)
+    return '%d_%d' % (microseconds, message.pk)
+
+
+def parse_cursor(cursor):
+    try:
+        microseconds, pk = cursor.split('_')
+        return EPOCH + datetime.timedelta(microseconds=int(microseconds)), int(pk)
+    except (ValueError, OverflowError):
+        return None
@@ -3,8 +3,18 @@ import datetime
 from django.http import HttpResponseRedirect
 from django.urls import reverse
 from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_time
 from django.shortcuts import render
 from studybuddy.models import Room, StudySession, User
+from studybuddy.middleware import get_student
+from studybuddy.scheduling import find_conflicts, free_slots, schedule_sessions
+
+# how long the free times suggested on the schedule page have to be
+FREE_SLOT_MINUTES = 60
+FREE_SLOT_DAYS = 7
+
+# the most weeks a recurring study session can be scheduled for, about a semester
+MAX_WEEKS = 16
 
 
 def schedule(request, roomNumber):
@@ -12,20 +22,23 @@ def schedule(request, roomNumber):
         return render(request, template_name="index.html")
 
     template_name = "schedule_sessions/schedule.html"
-    email=request.user.email
-
-    context = {
-        'student_name': User.objects.get(email=email).name
-    }
 
-    if User.objects.get(email=email).name == "":
-        context['student_name'] = request.user
+    context = {}
 
-    if Room.objects.filter(pk=roomNumber):
-        room = Room.objects.get(pk=roomNumber)
+    # the page shows when the room's users are busy, so a room the user isn't in is treated as missing
+    room = Room.objects.filter(pk=roomNumber, users__email=request.user.email).first()
+    if room:
         context['room'] = room
+        context['weeks'] = 1
+        context['max_weeks'] = MAX_WEEKS
+        # times when nobody in the room has a study session
+        now = timezone.localtime()
+        emails = list(room.users.values_list('email', flat=True))
+        context['free_slots'] = sorted(free_slots(emails, now.date(), FREE_SLOT_DAYS,
+                                                  datetime.timedelta(minutes=FREE_SLOT_MINUTES), now).items())
     else:
         context['noRoom'] = roomNumber
+        return render(request, template_name, context, status=404)
 
     return render(request, template_name, context)
 
@@ -52,56 +65,58 @@ def upcomingSessions(request):
         end = request.POST.get('end')
         room_pk = request.POST.get('room_pk')
 
+        # recurring sessions repeat weekly, a single session is one week
+        weeks = request.POST.get('weeks', '1')
+        weeks = min(int(weeks), MAX_WEEKS) if weeks.isdigit() and int(weeks) > 0 else 1
+
         room = Room.objects.get(pk=room_pk)
 
-        # if not StudySession.objects.filter(date=date, start=start, end=end, name=room.name).exists():
-        session = StudySession.objects.create(date=date,
-                                              start=start,
-                                              end=end,
-                                              name=room.name,
-                                              post=room.post,
-                                              author=email)
-        for user in room.users.all():
-            session.users.add(user)
+        # check nobody in the room is already busy then, unless the user chose to schedule it anyway
+        if not request.POST.get('force'):
+            emails = list(room.users.values_list('email', flat=True))
+            conflicts = find_conflicts(emails, parse_date(date), parse_time(start), parse_time(end), weeks)
+            if conflicts:
+                context = {
+                    'room': room,
+                    'date': date,
+                    'start': start,
+                    'end': end,
+                    'weeks': weeks,
+                    'max_weeks': MAX_WEEKS,
+                    'conflicts': sorted(conflicts.items()),
+                }
+                return render(request, "schedule_sessions/schedule.html", context)
+
+        schedule_sessions(room, parse_date(date), parse_time(start), parse_time(end), email, weeks)
         return HttpResponseRedirect(reverse('studybuddy:upcomingSessions'))
 
-    context = {
-        'student_name': User.objects.get(email=request.user.email).name
-    }
-
-    if User.objects.get(email=email).name == "":
-        context['student_name'] = request.user
-
-    # remove any sessions that are today but end time has already passed
-    StudySession.objects.filter(date=timezone.localtime(), end__lt=timezone.localtime()).delete()
-    # remove any sessions that are past date
-    StudySession.objects.filter(date__lt=timezone.localtime()).delete()
-
-    user_sessions = StudySession.objects.filter(users=User.objects.get(email=email))
+    context = {}
+
+    # hide any sessions that are past date or are today but end time has already passed,
+    # the sweeper deletes them later
+    now = timezone.localtime()
+    user_sessions = StudySession.objects.filter(users=get_student(request)) \
+        .exclude(date__lt=now.date()) \
+        .exclude(date=now.date(), end__lt=now.time()) \
+        .select_related('post').order_by('pk')
+
+    # sort the sessions into the page's lists in one pass over a single query
+    buckets = {'study_sessions': [], 'pending_sessions': [], 'sent_sessions': [], 'declined_sessions': []}
+    for session in user_sessions:
+        if session.accepted == 'yes':
+            buckets['study_sessions'].append(session)
+        elif session.accepted == 'no':
+            buckets['declined_sessions'].append(session)
+        elif session.accepted == '?':
+            # sessions the user scheduled are waiting on others, the rest are waiting on the user
+            if session.author == request.user.email:
+                buckets['sent_sessions'].append(session)
+            else:
+                buckets['pending_sessions'].append(session)
 
-    pending_sessions = None
-    sent_sessions = None
+    # user_sessions was already fetched by the loop, so this doesn't query again
     if user_sessions:
-        for session in user_sessions:
-            # if the owner of the session is not the user checking their study sessions
-            if session.author != request.user.email:
-                if pending_sessions is None:
-                    pending_sessions = StudySession.objects.filter(pk=session.pk)
-                else:
-                    pending_sessions = pending_sessions | StudySession.objects.filter(pk=session.pk)
-            # else if the owner of the session is the user checking their study sessions
-            else:
-                if sent_sessions is None:
-                    sent_sessions = StudySession.objects.filter(pk=session.pk)
-                else:
-                    sent_sessions = sent_sessions | StudySession.objects.filter(pk=session.pk)
-
-        context['study_sessions'] = user_sessions.filter(accepted='yes')
-        if pending_sessions:
-            context['pending_sessions'] = pending_sessions.filter(accepted='?')
-        context['declined_sessions'] = user_sessions.filter(accepted='no')
-        if sent_sessions:
-            context['sent_sessions'] = sent_sessions.filter(accepted='?')
+        context.update(buckets)
     # if the user doesn't have any sessions associated to them, show a message on how to schedule sessions
     else:
         context['no_sessions'] = True
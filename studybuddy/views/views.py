@@ -1,27 +1,34 @@
-import requests, json
+import requests, json, hashlib
 from studybuddy.views import room_views, post_views
+from studybuddy.consumers import broadcast_profile_update
+from studybuddy.middleware import get_student, get_student_name
+from studybuddy.catalog import department_directory, directory_last_modified
+from studybuddy.search import search_courses
+from studybuddy.matching import suggest_buddies
 from django.urls import reverse
-from django.views import generic
+from django.views.decorators.http import condition
+from django.core.paginator import Paginator
+from django.db.models import Exists, OuterRef, Q
 from django.utils import timezone
 from django.shortcuts import render
-from django.http import HttpResponseRedirect
-from studybuddy.models import User, Departments, Course, Post, EnrolledClass, Room
+from django.http import HttpResponseRedirect, JsonResponse
+from studybuddy.models import User, Course, Post, EnrolledClass, Room
+
+# how many posts are shown on each page of a course feed
+FEED_PAGE_SIZE = 20
 
 
 def index(request):
-    if request.user.is_anonymous or not User.objects.filter(email=request.user.email).exists():
+    if request.user.is_anonymous or get_student(request) is None:
         return render(request, template_name="index.html")
     else:
         template_name = 'homepage.html'
 
         context = {
-            'student_name': User.objects.get(email=request.user.email).name,
-            'student': User.objects.get(email=request.user.email)
+            'student': get_student(request),
+            'buddies': suggest_buddies(get_student(request)),
         }
 
-        if User.objects.get(email=request.user.email).name == "":
-            context['student_name'] = request.user
-
         return render(request, template_name, context)
 
 
@@ -30,8 +37,7 @@ def addAccount(request):
         return render(request, template_name="index.html")
 
     email = request.user.email
-    exist = User.objects.filter(email=email).exists()
-    if not exist:
+    if get_student(request) is None:
         newAcc = User.objects.create(email=email, name=request.user.username)
         # newAcc.save()
         return HttpResponseRedirect(reverse('studybuddy:editAccount'))
@@ -43,8 +49,7 @@ def account(request):
     if request.user.is_anonymous:
         return render(request, template_name="index.html")
 
-    email = request.user.email
-    user = User.objects.get(email__exact=email)
+    user = get_student(request)
     context = {
         'Email': user.email,
         'UserName': user.username,
@@ -53,12 +58,8 @@ def account(request):
         'ZoomLink': user.zoomLink,
         'Introduction': user.blurb,
         'student': user,
-        'student_name': user.name
     }
 
-    if User.objects.get(email=request.user.email).name == "":
-        context['student_name'] = request.user
-
     return render(request, 'studybuddy/account.html', context)
 
 
@@ -66,8 +67,7 @@ def EditAccount(request):
     if request.user.is_anonymous:
         return render(request, template_name="index.html")
 
-    email = request.user.email
-    user = User.objects.get(email=email)
+    user = get_student(request)
     context = {
         'Email': user.email,
         'UserName': user.username,
@@ -75,12 +75,8 @@ def EditAccount(request):
         'Major': user.major,
         'ZoomLink': user.zoomLink,
         'Introduction': user.blurb,
-        'student_name': User.objects.get(email=email).name,
     }
 
-    if User.objects.get(email=email).name == "":
-        context['student_name'] = request.user
-
     return render(request, 'studybuddy/editAccount.html', context)
 
 
@@ -88,8 +84,8 @@ def UpdateAccount(request):
     if request.user.is_anonymous:
         return render(request, template_name="index.html")
 
-    email = request.user.email
-    account = User.objects.get(email__exact=email)
+    account = get_student(request)
+    old_name = account.name
     account.username = request.POST['username']
     account.name = request.POST['name']
     account.major = request.POST['major']
@@ -98,42 +94,46 @@ def UpdateAccount(request):
 
     account.save()
 
+    # open chat rooms cache display names, so tell them about the new one
+    if account.name != old_name:
+        broadcast_profile_update(account)
+
     return HttpResponseRedirect(reverse('studybuddy:account'))
 
 
-class alldepartments(generic.ListView):
-    model = Departments
-    # template_name = get_template_name()
+def directory_modified(request):
+    """
+    when the department directory last changed, looked up once per request
+    """
+    if not hasattr(request, '_directory_modified'):
+        request._directory_modified = None if request.user.is_anonymous else directory_last_modified()
+    return request._directory_modified
 
-    # Get the json for all the departments
-    # deptList = requests.get('http://luthers-list.herokuapp.com/api/deptlist/')
-    # deptList_json = json.loads(deptList.text)
 
-    # # makes sure there are no departments from previous calls
-    # if Departments.objects.exists():
-    #     Departments.objects.all().delete()
+def directory_etag(request):
+    """
+    the department page changes when the directory does, and has the student's name in the navigation bar
+    """
+    last_modified = directory_modified(request)
+    if last_modified is None:
+        return None
+    name = hashlib.md5(str(get_student_name(request)).encode()).hexdigest()[:8]
+    return '%d-%s-%s' % (last_modified.timestamp() * 1000000, request.user.pk, name)
 
-    # # Get all of the current departments available
-    # for i in range(len(deptList_json)):
-    #     newDept = Departments(dept=deptList_json[i].get("subject"))
-    #     newDept.save()
 
-    # def get_queryset(self):
-    #     return Departments.objects.all()
+# no Last-Modified: the directory's time is the same for everyone, but the page also shows who is signed in,
+# so a browser could be told a page for another user hadn't changed
+@condition(etag_func=directory_etag)
+def alldepartments(request):
+    # departments are loaded with `manage.py import_catalog`
+    if request.user.is_anonymous:
+        return render(request, template_name="index.html")
 
-    # Source: https://stackoverflow.com/questions/9899113/get-request-session-from-a-class-based-generic-view
-    def get_context_data(self, *args, **kwargs):
-        context = super(alldepartments, self).get_context_data(*args, **kwargs)
-        if not self.request.user.is_anonymous:
-            context['student_name'] = User.objects.get(email=self.request.user.email).name
-            if User.objects.get(email=self.request.user.email).name == "":
-                context['student_name'] = self.request.user
-        return context
+    context = {
+        'departments_list': department_directory(directory_modified(request)),
+    }
 
-    def get_template_names(self, *args, **kwargs):
-        if self.request.user.is_anonymous:
-            return 'index.html'
-        return 'alldepartments.html'
+    return render(request, 'alldepartments.html', context)
 
 
 def department(request, dept):
@@ -145,43 +145,48 @@ def department(request, dept):
 
     template_name = 'department.html'
 
-    # Get the json file for the request department
-    # dept = dept.upper()
-    # dept_request = "http://luthers-list.herokuapp.com/api/dept/" + dept
-    # dept_classes = requests.get(dept_request)
-    # dept_classes_json = json.loads(dept_classes.text)
-
-    # # Get all of the classes in the requested department
-    # for i in range(len(dept_classes_json)):
-    #     current_class = dept_classes_json[i]
-
-        # if the course doesn't exists then we will add it
-        # if not Course.objects.filter(subject=dept,
-        #                              catalog_number=current_class.get('catalog_number'),
-        #                              instructor=current_class.get('instructor').get('name'),
-        #                              section=current_class.get('course_section'),
-        #                              course_number=current_class.get('course_number'),
-        #                              description=current_class.get('description')).exists():
-        #     newClass = Course(subject=dept,
-        #                       catalog_number=current_class.get('catalog_number'),
-        #                       instructor=current_class.get('instructor').get('name'),
-        #                       section=current_class.get('course_section'),
-        #                       course_number=current_class.get('course_number'),
-        #                       description=current_class.get('description'))
-        #     newClass.save()
-
+    # courses are loaded with `manage.py import_catalog`, only the first page is sent and the page
+    # loads the rest from studybuddy:courseSearch
+    courses, has_next = search_courses('', dept)
     context = {
-        'student_name': User.objects.get(email=request.user.email).name,
-        'department_list': Course.objects.filter(subject=dept),
+        'department_list': courses,
+        'has_next': has_next,
         'dept': dept
     }
 
-    if User.objects.get(email=request.user.email).name == "":
-        context['student_name'] = request.user
-
     return render(request, template_name, context)
 
 
+def course_search(request):
+    """
+    JSON page of courses matching a search, best matches first, for the course search box
+    parameters: q - what was typed, dept - only search this department, page - which page of results
+    """
+    if request.user.is_anonymous:
+        return JsonResponse({'error': 'You must be logged in to search courses'}, status=403)
+
+    page = request.GET.get('page', '1')
+    if not page.isdigit() or int(page) < 1:
+        return JsonResponse({'error': 'Invalid page'}, status=400)
+
+    courses, has_next = search_courses(request.GET.get('q', ''), request.GET.get('dept'), int(page))
+
+    return JsonResponse({
+        'courses': [{
+            'subject': course.subject,
+            'catalog_number': course.catalog_number,
+            'section': course.section,
+            'instructor': course.instructor,
+            'description': course.description,
+            'course_number': course.course_number,
+            'text': str(course),
+            'url': reverse('studybuddy:enroll', args=(course.subject, course.course_number)),
+        } for course in courses],
+        'page': int(page),
+        'has_next': has_next,
+    })
+
+
 def coursefeed(request, dept, course_number):
     template_name = 'course_feed.html'
 
@@ -205,37 +210,38 @@ def coursefeed(request, dept, course_number):
             if room.users.count() == 1:
                 room.delete()
             else:
-                room.users.remove(User.objects.get(email=request.user.email))
+                room.users.remove(get_student(request))
         return HttpResponseRedirect(reverse('studybuddy:rooms'))
 
-    email = request.user.email
     context = {
         'dept': dept.upper(),
-        'student_name': User.objects.get(email=email).name,
     }
 
-    if Course.objects.filter(course_number=course_number).exists() and Course.objects.filter(subject=dept):
-        course = Course.objects.get(course_number=course_number)
-        Post.objects.filter(endDate__lt=timezone.localtime()).delete()
-        post_for_this_class = Post.objects.filter(
-            course=course)  # this will find posts that are related to this specific section only
-
-        for catalog_course in Course.objects.filter(subject=course.subject, catalog_number=course.catalog_number):
-            post_for_this_class = post_for_this_class | Post.objects.filter(course=catalog_course, post_type='course')
+    # the course, whether the department exists and whether the student is enrolled, all in one query
+    course = Course.objects.filter(course_number=course_number).annotate(
+        dept_exists=Exists(Course.objects.filter(subject=dept)),
+        enrolled=Exists(EnrolledClass.objects.filter(course=OuterRef('pk'), student_id=request.user.email)),
+    ).first()
+
+    if course is not None and course.dept_exists:
+        # posts for this specific section, and posts made for every section of this course
+        # expired posts are deleted by the sweeper, until then they are just hidden
+        feed_posts = Post.objects.filter(
+            Q(course=course) |
+            Q(post_type='course', course__subject=course.subject, course__catalog_number=course.catalog_number),
+            endDate__gte=timezone.localdate(),
+        ).select_related('course', 'user').order_by('-startDate', '-pk')
+        page = Paginator(feed_posts, FEED_PAGE_SIZE).get_page(request.GET.get('page'))
 
         context['course'] = course
         context['valid'] = 'true'
-        context['feed_posts'] = post_for_this_class
-        context['has_posts'] = post_for_this_class.exists()
-        context['enrolled'] = EnrolledClass.objects.filter(course=Course.objects.get(course_number=course_number),
-                                                     student=User.objects.get(email=email)).exists()
+        context['feed_posts'] = page
+        context['has_posts'] = page.paginator.count > 0
+        context['enrolled'] = course.enrolled
 
     else:
         context['course_number'] = course_number
 
-    if User.objects.get(email=request.user.email).name == "":
-        context['student_name'] = request.user
-
     return render(request, template_name, context)
 
 
@@ -246,7 +252,6 @@ def enrollcourse(request, dept, course_number):
     template_name = 'enroll.html'
 
     context = {
-        'student_name': User.objects.get(email=request.user.email).name,
         'dept': dept.upper(),
     }
 
@@ -254,13 +259,10 @@ def enrollcourse(request, dept, course_number):
         context['course'] = Course.objects.get(course_number=course_number)
         context['valid'] = 'true'
         context['enrolled'] = EnrolledClass.objects.filter(course=Course.objects.get(course_number=course_number),
-                                                     student=User.objects.get(email=request.user.email)).exists()
+                                                     student=get_student(request)).exists()
     else:
         context['course'] = course_number
 
-    if User.objects.get(email=request.user.email).name == "":
-        context['student_name'] = request.user
-
     return render(request, template_name, context)
 
 
@@ -268,15 +270,14 @@ def updatecourseload(request, dept, course_number):
     if request.user.is_anonymous:
         return render(request, template_name="index.html")
 
-    email = request.user.email
-    account = User.objects.get(email__exact=email)
+    account = get_student(request)
     course = Course.objects.get(course_number=course_number)
 
     action = request.POST['choice']
     if action == "YesD":
         EnrolledClass.objects.filter(course=course, student=account).delete()
-    elif action == "YesE" and not EnrolledClass.objects.filter(course=course, student=account).exists():
-        enrolled = EnrolledClass(course=course, student=account)
-        enrolled.save()
+    elif action == "YesE":
+        # the unique constraint on (student, course) keeps double submits from enrolling twice
+        EnrolledClass.objects.get_or_create(course=course, student=account)
 
     return HttpResponseRedirect(reverse('studybuddy:index'))